@@ -99,6 +99,64 @@ class base_store(object):
             The object that was saved under ``name``
         '''
 
+    def dump_many(self, objects, names):
+        '''
+        store.dump_many(objects, names)
+
+        Saves each of ``objects`` under the corresponding name.
+
+        The default implementation calls ``dump`` for each object.
+
+        Parameters
+        ----------
+        objects : sequence
+        names : sequence of str
+            Keys to use (same length as ``objects``)
+        '''
+        for obj, name in zip(objects, names):
+            self.dump(obj, name)
+
+    def can_load_many(self, names):
+        '''
+        can = store.can_load_many(names)
+
+        Checks for the presence of each of ``names``.
+
+        The default implementation calls ``can_load`` for each name. Backends
+        for which a round trip is expensive should override it to check all
+        keys at once.
+
+        Parameters
+        ----------
+        names : sequence of str
+            Keys to use
+
+        Returns
+        -------
+        can : list of bool
+        '''
+        return [bool(self.can_load(name)) for name in names]
+
+    def load_many(self, names):
+        '''
+        objs = store.load_many(names)
+
+        Loads several objects from the store.
+
+        The default implementation calls ``load`` for each name.
+
+        Parameters
+        ----------
+        names : sequence of str
+            Keys to use
+
+        Returns
+        -------
+        objs : list
+            The objects that were saved under each of ``names``
+        '''
+        return [self.load(name) for name in names]
+
     @abstractmethod
     def remove(self, name):
         '''
@@ -119,6 +177,28 @@ class base_store(object):
             Whether the key was present
         '''
 
+    def remove_many(self, names):
+        '''
+        was_removed = store.remove_many(names)
+
+        Remove the entries associated with each of ``names``.
+
+        The default implementation calls ``remove`` for each name. Backends
+        for which a round trip is expensive should override it to remove
+        entries in bulk.
+
+        Parameters
+        ----------
+        names : sequence of str
+            Keys
+
+        Returns
+        -------
+        was_removed : list of bool
+            For each key, whether it was present
+        '''
+        return [self.remove(name) for name in names]
+
     @abstractmethod
     def cleanup(self, active):
         '''
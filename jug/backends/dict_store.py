@@ -29,6 +29,7 @@ import logging
 logger = logging.getLogger(__name__)
 from six.moves import cPickle as pickle
 from collections import defaultdict
+from collections.abc import Iterator
 
 from abc import ABCMeta, abstractmethod
 from .base import base_store
@@ -76,6 +77,10 @@ class dict_store(base_store):
         '''
         self.dump(object, name)
         '''
+        if isinstance(object, Iterator):
+            # Iterators cannot be pickled: keep them as a StreamedResult
+            from .encode import encode, decode
+            object = decode(encode(object))
         self.store[_resultname(name)] = pickle.dumps(object)
         self.counts['dump:{0}'.format(name)] += 1
 
@@ -110,6 +115,8 @@ class dict_store(base_store):
         if self.can_load(name):
             self.counts['true-del:{0}'.format(name)] += 1
             del self.store[_resultname(name)]
+            return True
+        return False
 
 
     def cleanup(self, active):
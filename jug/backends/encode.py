@@ -26,13 +26,40 @@ import logging
 logger = logging.getLogger(__name__)
 
 import io
+import struct
+from collections import namedtuple
 
 from six import BytesIO
 import six
-from .open_compressed import open_compressed
+from .open_compressed import open_compressed, open_compressed_writer, open_codec, parse_compression
 
 
-__all__ = ['encode', 'decode', 'encode_to', 'decode_from', 'available_encoders']
+__all__ = ['encode', 'decode', 'encode_to', 'decode_from', 'read_header', 'available_encoders', 'io_counters']
+
+class IOCounters(object):
+    '''
+    Number of bytes written by ``encode_to`` (``encoded``) and read by
+    ``decode_from`` (``decoded``) in this process.
+
+    Streams which do not support ``tell()`` are not counted.
+    '''
+    def __init__(self):
+        self.encoded = 0
+        self.decoded = 0
+
+io_counters = IOCounters()
+
+def _seekable(stream):
+    try:
+        return stream.seekable()
+    except (AttributeError, ValueError):
+        return False
+
+def _tell(stream):
+    try:
+        return stream.tell()
+    except (AttributeError, IOError, OSError, ValueError):
+        return None
 
 available_encoders = []
 
@@ -43,16 +70,97 @@ except ImportError:
     pass
 
 try:
-    from .encoders.numpy_encoder import NumpyEncoder
-    available_encoders.append( NumpyEncoder() )
+    from .encoders.numpy_encoder import NDArrayEncoder
+    available_encoders.append( NDArrayEncoder() )
+except ImportError:
+    pass
+
+try:
+    from .encoders.arrow_encoder import ArrowEncoder
+    available_encoders.append( ArrowEncoder() )
+except ImportError:
+    pass
+
+try:
+    from .encoders.sparse_encoder import SparseEncoder
+    available_encoders.append( SparseEncoder() )
+except ImportError:
+    pass
+
+try:
+    from .encoders.pickle5_encoder import Pickle5Encoder
+    available_encoders.append( Pickle5Encoder() )
 except ImportError:
     pass
 
+from .encoders.stream_encoder import StreamEncoder
+from .encoders.list_encoder import ListEncoder
 from .encoders.pickle_encoder import PickleEncoder
 
+available_encoders.append(StreamEncoder())
+available_encoders.append(ListEncoder())
 available_encoders.append(PickleEncoder())
 
-def encode(obj):
+# Results start with a fixed size header:
+#
+#   magic (4 bytes) | version | codec id | encoder id | (unused) | payload size (u64)
+#
+# so that they can be decoded without probing for the compression and the
+# encoder. The payload size (the number of bytes after the header) is 0 if the
+# output could not be seeked back to fill it in (e.g., results streamed out in
+# chunks). Results written without a header (by earlier versions of jug or
+# with an encoder which has no ``encoder_id``) are still decoded by probing.
+_HEADER_MAGIC = b'\x8aJUG'
+_HEADER_VERSION = 1
+_HEADER = struct.Struct('<4sBBBxQ')
+HEADER_SIZE = _HEADER.size
+_PAYLOAD_SIZE = struct.Struct('<Q')
+
+_CODEC_IDS = {
+    None: 0,
+    'gzip': 1,
+    'zstd': 2,
+    'lz4': 3,
+    'snappy': 4,
+}
+_CODECS = dict((i, c) for c, i in _CODEC_IDS.items())
+
+ResultHeader = namedtuple('ResultHeader', ['codec', 'encoder', 'payload_size'])
+
+def _find_encoder(encoder_id):
+    for e in available_encoders:
+        if getattr(e, 'encoder_id', None) == encoder_id:
+            return e
+    raise ValueError("jug: result was encoded with encoder %s, which is not available (is the module it needs installed?)" % encoder_id)
+
+def read_header(stream):
+    '''
+    header = read_header(stream)
+
+    Reads the header of the result in ``stream``.
+
+    Parameters
+    ----------
+    stream : file-like object
+
+    Returns
+    -------
+    header : ResultHeader or None
+        The codec (None if the payload is not compressed), the encoder and
+        the payload size (0 if unknown). If the result was written without
+        a header, None is returned and ``stream`` is left where it was.
+    '''
+    position = stream.tell()
+    data = stream.read(HEADER_SIZE)
+    if len(data) != HEADER_SIZE or not data.startswith(_HEADER_MAGIC):
+        stream.seek(position)
+        return None
+    _, version, codec_id, encoder_id, payload_size = _HEADER.unpack(data)
+    if version != _HEADER_VERSION or codec_id not in _CODECS:
+        raise ValueError("jug: result header is from a newer version of jug (version: %s, codec: %s)" % (version, codec_id))
+    return ResultHeader(_CODECS[codec_id], _find_encoder(encoder_id), payload_size)
+
+def encode(obj, compression=None):
     """Encode object to bytes.
 
     Encode object via first available encoder to bytes.
@@ -60,6 +168,8 @@ def encode(obj):
     Parameters
     ----------
       obj : Pickle-able or encodable object.
+      compression : str, optional
+        Compression setting (see ``encode_to``)
 
     Returns
     -------
@@ -70,10 +180,20 @@ def encode(obj):
       `decode`
     """
     output = BytesIO()
-    encode_to(obj, output)
+    encode_to(obj, output, compression)
     return output.getvalue()
 
-def encode_to(obj, stream):
+def _uncompressed(compression):
+    if compression is None:
+        try:
+            import snappy_stream
+            return False
+        except ImportError:
+            return True
+    codec, _, adaptive = parse_compression(compression)
+    return codec is None and not adaptive
+
+def encode_to(obj, stream, compression=None, partial=False):
     """Encode object to output stream.
 
     Encode object via first available encoder to output stream.
@@ -82,6 +202,17 @@ def encode_to(obj, stream):
     ----------
       obj : Pickle-able or encodable object.
       stream : File-like object.
+      compression : str, optional
+        One of ``none``, ``zstd``, ``lz4`` or ``gzip`` (optionally followed by
+        ``:LEVEL``). With an ``auto:`` prefix (or just ``auto``), the first MB
+        of output is used to check whether compression is worthwhile. By
+        default, the output is compressed with snappy if ``snappy_stream`` is
+        available.
+      partial : bool, optional
+        Whether the store can load parts of results (e.g., single elements).
+        If so, and if the output is not compressed, encoders which only pay
+        off for partial loading (those with a true ``partial_only``
+        attribute, such as the block layout of long lists) are used too.
 
     Returns
     -------
@@ -91,21 +222,48 @@ def encode_to(obj, stream):
     ---
       `decode`
     """
-    try:
-        import snappy_stream
-        stream = snappy_stream.SnappyWriteWrapper(stream, owns_sink=False)
-    except ImportError:
-        pass
-
+    partial = partial and _uncompressed(compression)
     for e in available_encoders:
+        if getattr(e, 'partial_only', False) and not partial:
+            continue
         if e.can_dump(obj):
             logger.debug("Resolved encoder: %s obj: %s", e, type(obj))
-            e.dump(obj, stream)
-            stream.flush()
-            return
+            break
     else:
         raise ValueError("No valid encoder for obj: %s" % type(obj))
 
+    sink = stream
+    start = _tell(sink)
+    header_position = []
+    encoder_id = getattr(e, 'encoder_id', None)
+    def write_header(codec):
+        if encoder_id is not None:
+            header_position.append(_tell(sink))
+            sink.write(_HEADER.pack(_HEADER_MAGIC, _HEADER_VERSION, _CODEC_IDS[codec], encoder_id, 0))
+
+    if compression is not None:
+        stream = open_compressed_writer(stream, compression, write_header)
+    else:
+        try:
+            import snappy_stream
+            write_header('snappy')
+            stream = snappy_stream.SnappyWriteWrapper(stream, owns_sink=False)
+        except ImportError:
+            write_header(None)
+
+    e.dump(obj, stream)
+    if compression is not None:
+        stream.close()
+    else:
+        stream.flush()
+    end = _tell(sink)
+    if header_position and header_position[0] is not None and end is not None and _seekable(sink):
+        sink.seek(header_position[0] + HEADER_SIZE - _PAYLOAD_SIZE.size)
+        sink.write(_PAYLOAD_SIZE.pack(end - header_position[0] - HEADER_SIZE))
+        sink.seek(end)
+    if start is not None and end is not None:
+        io_counters.encoded += end - start
+
 def decode(s):
     '''Decode object from bytes.
 
@@ -135,12 +293,24 @@ def decode_from(stream):
     obj : decoded object
     '''
 
-    stream = open_compressed(stream)
-    stream = io.BufferedReader(stream)
-
-    for e in available_encoders:
-        if e.can_load(stream):
-            logger.debug("Resolved decoder: %s", e)
-            return e.load(stream)
+    source = stream
+    start = _tell(source)
+    header = read_header(stream)
+    if header is not None:
+        e = header.encoder
+        stream = io.BufferedReader(open_codec(stream, header.codec))
     else:
-        raise ValueError("No valid decoder for stream.")
+        stream = open_compressed(stream)
+        stream = io.BufferedReader(stream)
+        for e in available_encoders:
+            if e.can_load(stream):
+                break
+        else:
+            raise ValueError("No valid decoder for stream.")
+
+    logger.debug("Resolved decoder: %s", e)
+    obj = e.load(stream)
+    end = _tell(source)
+    if start is not None and end is not None:
+        io_counters.decoded += end - start
+    return obj
@@ -0,0 +1,113 @@
+from .base import BaseEncoder
+
+import pyarrow
+import pyarrow.ipc
+
+try:
+    import pandas
+    from pandas.api.types import infer_dtype
+except ImportError:
+    pandas = None
+
+# Added to the schema metadata of tables which were converted from a
+# DataFrame (so that they are converted back on load)
+_TYPE_KEY = b'jug.type'
+_PANDAS = b'pandas'
+
+# Inferred types of object columns which Arrow stores natively (columns
+# holding other Python objects are left to the pickle encoder)
+_OBJECT_TYPES = frozenset(['string', 'bytes', 'empty'])
+
+def _is_dataframe(obj):
+    return pandas is not None and type(obj) == pandas.DataFrame
+
+def _can_convert(df):
+    # Other column names do not round trip
+    if not all(isinstance(c, str) for c in df.columns) or not df.columns.is_unique:
+        return False
+    for values in [df.index] + [df[name] for name in df.columns]:
+        if values.dtype == object and infer_dtype(values, skipna=True) not in _OBJECT_TYPES:
+            return False
+    return True
+
+def _to_table(obj):
+    if not _is_dataframe(obj):
+        return obj
+    # RangeIndex objects are kept as metadata, other indices as columns
+    table = pyarrow.Table.from_pandas(obj)
+    metadata = dict(table.schema.metadata or {})
+    metadata[_TYPE_KEY] = _PANDAS
+    return table.replace_schema_metadata(metadata)
+
+def _index_columns(table):
+    metadata = table.schema.pandas_metadata or {}
+    # RangeIndex objects are described in the metadata (not stored as columns)
+    return [c for c in metadata.get('index_columns', []) if isinstance(c, str)]
+
+def select_columns(obj, columns):
+    '''
+    sub = select_columns(obj, columns)
+
+    Returns only the given ``columns`` of ``obj`` (a DataFrame or an Arrow
+    table). The index of a DataFrame is kept.
+    '''
+    columns = list(columns)
+    if isinstance(obj, pyarrow.Table):
+        return obj.select(columns + [c for c in _index_columns(obj) if c not in columns])
+    return obj[columns]
+
+def _from_table(table, columns=None, split_blocks=False):
+    if columns is not None:
+        table = select_columns(table, columns)
+    if (table.schema.metadata or {}).get(_TYPE_KEY) != _PANDAS:
+        return table
+    return table.to_pandas(split_blocks=split_blocks)
+
+class ArrowEncoder(BaseEncoder):
+    '''
+    Saves pandas DataFrames (with their index and dtypes) and Arrow tables in
+    the Arrow IPC streaming format.
+
+    Uncompressed results can be memory mapped (see ``load_mmap``), in which
+    case only the columns which are used are read from disk.
+    '''
+    encoder_id = 5
+
+    @classmethod
+    def can_load(cls, file):
+        # Results in this format are always written with a header
+        return False
+
+    @classmethod
+    def load(cls, file):
+        reader = pyarrow.ipc.open_stream(pyarrow.PythonFile(file, mode='r'))
+        return _from_table(reader.read_all())
+
+    @classmethod
+    def load_mmap(cls, fname, offset=0, columns=None):
+        '''
+        obj = ArrowEncoder.load_mmap(fname, offset=0, columns=None)
+
+        Loads the table saved (uncompressed) at ``offset`` in file ``fname``
+        without copying its data: the columns of the table (and the numeric
+        columns of a DataFrame which have no missing values) are backed by a
+        read-only memory map. If ``columns`` is given, only those columns
+        (plus the index) are loaded.
+        '''
+        source = pyarrow.memory_map(fname, 'r')
+        source.seek(offset)
+        table = pyarrow.ipc.open_stream(source).read_all()
+        return _from_table(table, columns, split_blocks=True)
+
+    @classmethod
+    def can_dump(cls, obj):
+        if _is_dataframe(obj):
+            return _can_convert(obj)
+        return type(obj) == pyarrow.Table
+
+    @classmethod
+    def dump(cls, obj, file):
+        table = _to_table(obj)
+        writer = pyarrow.ipc.new_stream(pyarrow.PythonFile(file, mode='w'), table.schema)
+        writer.write_table(table)
+        writer.close()
@@ -4,6 +4,11 @@ from abc import ABCMeta, abstractproperty, abstractmethod
 class BaseEncoder(object):
     __metaclass__ = ABCMeta
 
+    # Identifies the encoder in the header of results (see
+    # ``jug.backends.encode``). Results written by encoders without one are
+    # written without a header and found by probing with ``can_load``.
+    encoder_id = None
+
     @abstractmethod
     def can_load(self, file):
         """True if manage can decode the contents of the given file."""
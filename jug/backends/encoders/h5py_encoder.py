@@ -1,6 +1,7 @@
 from .base import BaseEncoder
 
 import io
+import os
 import binascii
 import itertools
 import h5py
@@ -68,6 +69,14 @@ def detect_hdf5_signature(target_file, max_userblock_size = None):
     return locate_hdf5_signature(target_file, max_userblock_size) is not None
 
 class H5PyEncoder(BaseEncoder):
+    '''
+    Saves open ``h5py.File`` objects as an image of the whole file.
+
+    ``file_store`` does not use the image: it copies the HDF5 file into the
+    jugdir and opens it in place, read-only, when it is loaded (see
+    ``disk_filename`` and ``open_file``).
+    '''
+    encoder_id = 1
     max_userblock_size = 4096
 
     @classmethod
@@ -84,9 +93,42 @@ class H5PyEncoder(BaseEncoder):
         fapl.set_fapl_core(backing_store=False)
         fapl.set_file_image(image)
 
-        fid = h5py.h5f.open("tf", h5py.h5f.ACC_RDONLY, fapl=fapl)
+        fid = h5py.h5f.open(b"tf", h5py.h5f.ACC_RDONLY, fapl=fapl)
         return h5py.File(fid)
 
+    @classmethod
+    def is_hdf5(cls, target_file):
+        '''
+        is_hdf5 = H5PyEncoder.is_hdf5(target_file)
+
+        Whether ``target_file`` (a file name or a file object, whose position
+        is changed) is an HDF5 file
+        '''
+        return detect_hdf5_signature(target_file, cls.max_userblock_size)
+
+    @classmethod
+    def open_file(cls, fname):
+        '''
+        f = H5PyEncoder.open_file(fname)
+
+        Opens the HDF5 file ``fname`` read-only (datasets are read from disk
+        when they are accessed).
+        '''
+        return h5py.File(fname, 'r')
+
+    @classmethod
+    def disk_filename(cls, obj):
+        '''
+        fname = H5PyEncoder.disk_filename(obj)
+
+        Flushes ``obj`` and returns the name of the file on disk which holds
+        it (None if it is held in memory).
+        '''
+        obj.flush()
+        if obj.driver == 'core' or not os.path.exists(obj.filename):
+            return None
+        return obj.filename
+
     @classmethod
     def can_dump(cls, obj):
         if type(obj) == h5py.File:
@@ -95,4 +137,4 @@ class H5PyEncoder(BaseEncoder):
     @classmethod
     def dump(cls, obj, file):
         obj.flush()
-        file.write(obj.fid.get_file_image())
+        file.write(obj.id.get_file_image())
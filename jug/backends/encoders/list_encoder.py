@@ -0,0 +1,124 @@
+from .base import BaseEncoder
+
+import operator
+import os
+import pickle
+import struct
+
+# Layout of the encoded stream:
+#
+#   magic | nr elements (u64) | elements per block (u64) |
+#   blocks (each: size (u64) | pickle of a list of elements) |
+#   offset of each block (u64 each, from the start of the stream)
+#
+# The offsets come last so that the stream can be written (and read in full)
+# sequentially; they are only needed to load single elements or slices.
+_MAGIC = b'JUGLST01'
+_HEADER = struct.Struct('<8sQQ')
+_U64 = struct.Struct('<Q')
+
+# Shorter lists are pickled in one go
+_MIN_LENGTH = 64
+
+# Blocks hold about this many bytes (estimated from the first elements), so
+# that loading an element only reads a small part of the result
+_BLOCK_BYTES = 64 * 1024
+_MAX_BLOCK_LENGTH = 4096
+_SAMPLE_LENGTH = 16
+
+def _read_exactly(file, n):
+    data = file.read(n)
+    if len(data) != n:
+        raise ValueError('jug.ListEncoder: truncated stream')
+    return data
+
+def _block_length(lst):
+    sample = lst[:_SAMPLE_LENGTH]
+    per_element = len(pickle.dumps(sample, pickle.HIGHEST_PROTOCOL)) / float(len(sample))
+    return int(max(1, min(_MAX_BLOCK_LENGTH, _BLOCK_BYTES // max(per_element, 1))))
+
+class ListEncoder(BaseEncoder):
+    '''
+    Saves long lists as blocks of elements (each block pickled separately),
+    followed by an index of the blocks, so that a single element (or a slice)
+    can be loaded by reading only the blocks which hold it (see
+    ``load_item``).
+
+    Objects which are shared between elements in different blocks are loaded
+    as separate copies. Therefore, this is only used when the result can be
+    loaded in part (``file_store``, writing uncompressed results); otherwise,
+    lists are pickled as a whole.
+    '''
+    encoder_id = 7
+    partial_only = True
+
+    @classmethod
+    def can_load(cls, file):
+        return file.peek(len(_MAGIC))[:len(_MAGIC)] == _MAGIC
+
+    @classmethod
+    def load(cls, file):
+        _, n, block_length = _HEADER.unpack(_read_exactly(file, _HEADER.size))
+        result = []
+        while len(result) < n:
+            size, = _U64.unpack(_read_exactly(file, _U64.size))
+            result.extend(pickle.loads(_read_exactly(file, size)))
+        return result
+
+    @classmethod
+    def load_item(cls, fname, offset, index):
+        '''
+        elem = ListEncoder.load_item(fname, offset, index)
+
+        Returns ``lst[index]``, where ``lst`` is the list saved (uncompressed)
+        at ``offset`` in file ``fname``, reading only the blocks which are
+        needed. ``index`` is an integer or a slice.
+        '''
+        if not isinstance(index, slice):
+            try:
+                index = operator.index(index)
+            except TypeError:
+                raise NotImplementedError('jug.ListEncoder: unsupported index %r' % (index,))
+        with open(fname, 'rb') as f:
+            f.seek(offset)
+            magic, n, block_length = _HEADER.unpack(_read_exactly(f, _HEADER.size))
+            if magic != _MAGIC:
+                raise NotImplementedError('jug.ListEncoder: not a list')
+            nr_blocks = (n + block_length - 1) // block_length
+            f.seek(os.fstat(f.fileno()).st_size - nr_blocks * _U64.size)
+            offsets = struct.unpack('<%sQ' % nr_blocks, _read_exactly(f, nr_blocks * _U64.size))
+
+            blocks = {}
+            def element(i):
+                b = i // block_length
+                if b not in blocks:
+                    f.seek(offset + offsets[b])
+                    size, = _U64.unpack(_read_exactly(f, _U64.size))
+                    blocks[b] = pickle.loads(_read_exactly(f, size))
+                return blocks[b][i % block_length]
+
+            if isinstance(index, slice):
+                return [element(i) for i in range(*index.indices(n))]
+            if index < 0:
+                index += n
+            if not (0 <= index < n):
+                raise IndexError('list index out of range')
+            return element(index)
+
+    @classmethod
+    def can_dump(cls, obj):
+        return type(obj) == list and len(obj) >= _MIN_LENGTH
+
+    @classmethod
+    def dump(cls, obj, file):
+        block_length = _block_length(obj)
+        file.write(_HEADER.pack(_MAGIC, len(obj), block_length))
+        pos = _HEADER.size
+        offsets = []
+        for start in range(0, len(obj), block_length):
+            data = pickle.dumps(obj[start:start + block_length], pickle.HIGHEST_PROTOCOL)
+            offsets.append(pos)
+            file.write(_U64.pack(len(data)))
+            file.write(data)
+            pos += _U64.size + len(data)
+        file.write(struct.pack('<%sQ' % len(offsets), *offsets))
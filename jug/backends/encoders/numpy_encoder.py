@@ -1,30 +1,132 @@
 from .base import BaseEncoder
 import io
 import numpy
+import numpy.lib.format
+
+# Header versions which are read with the public numpy functions (others,
+# written by recent numpy versions, are passed on to ``read_array``)
+_HEADER_READERS = {
+    (1, 0): numpy.lib.format.read_array_header_1_0,
+    (2, 0): numpy.lib.format.read_array_header_2_0,
+}
+
+def _byte_view(arr):
+    '''
+    view = _byte_view(arr)
+
+    Returns a flat uint8 view of the memory of ``arr``, which must be C or
+    Fortran contiguous (the bytes are in the order of the npy format).
+    '''
+    if not arr.flags.c_contiguous:
+        arr = arr.T
+    return arr.reshape(-1).view(numpy.uint8)
+
+def _write_header(file, arr):
+    d = numpy.lib.format.header_data_from_array_1_0(arr)
+    for write_header in (numpy.lib.format.write_array_header_1_0, numpy.lib.format.write_array_header_2_0):
+        try:
+            # The header is only written once it is known to fit the version
+            write_header(file, d)
+            return True
+        except (ValueError, UnicodeEncodeError):
+            pass
+    return False
 
 class NDArrayEncoder(BaseEncoder):
+    '''
+    Saves arrays in the npy format.
+
+    Contiguous arrays (in C or Fortran order, including structured dtypes) are
+    written straight from their memory and read back with ``readinto`` into a
+    preallocated array, so that no intermediate copy is made.
+    '''
+    encoder_id = 2
+
     @classmethod
     def can_load(cls, file):
+        # peek() does not advance the stream
         test_bytes = file.peek(1024)
         try:
-            magic = numpy.lib.npyio.format.read_magic(io.BytesIO(test_bytes))
+            magic = numpy.lib.format.read_magic(io.BytesIO(test_bytes))
             if magic:
                 return True
         except ValueError:
             pass
-        finally:
-            file.seek(0)
 
         return False
 
     @classmethod
     def load(cls, file):
-        return numpy.lib.npyio.format.read_array(file)
+        prefix = file.peek(len(numpy.lib.format.MAGIC_PREFIX) + 2)
+        version = tuple(bytearray(prefix[len(numpy.lib.format.MAGIC_PREFIX):][:2]))
+        if version not in _HEADER_READERS:
+            return numpy.lib.format.read_array(file)
+        numpy.lib.format.read_magic(file)
+        shape, fortran_order, dtype = _HEADER_READERS[version](file)
+        if dtype.hasobject:
+            raise ValueError('jug.NDArrayEncoder: cannot load arrays of Python objects')
+
+        arr = numpy.empty(shape, dtype=dtype, order=('F' if fortran_order else 'C'))
+        buf = memoryview(_byte_view(arr))
+        pos = 0
+        while pos < len(buf):
+            n = file.readinto(buf[pos:])
+            if not n:
+                raise ValueError('jug.NDArrayEncoder: truncated array data (expected %s bytes, got %s)' % (len(buf), pos))
+            pos += n
+        return arr
+
+    @classmethod
+    def load_mmap(cls, fname, offset=0):
+        '''
+        arr = NDArrayEncoder.load_mmap(fname, offset=0)
+
+        Returns the array saved (uncompressed) at ``offset`` in file ``fname``
+        as a read-only ``numpy.memmap``. Returns None if there is no npy data
+        at ``offset`` or if the array cannot be memory mapped (Python objects,
+        no elements, ...).
+        '''
+        with open(fname, 'rb') as f:
+            f.seek(offset)
+            prefix = f.read(len(numpy.lib.format.MAGIC_PREFIX) + 2)
+            if not prefix.startswith(numpy.lib.format.MAGIC_PREFIX):
+                return None
+            version = tuple(bytearray(prefix[len(numpy.lib.format.MAGIC_PREFIX):]))
+            if version not in _HEADER_READERS:
+                return None
+            shape, fortran_order, dtype = _HEADER_READERS[version](f)
+            data_offset = f.tell()
+        if dtype.hasobject or not numpy.prod(shape, dtype=numpy.int64):
+            return None
+        return numpy.memmap(fname, dtype=dtype, mode='r', shape=shape, order=('F' if fortran_order else 'C'), offset=data_offset)
+
+    @classmethod
+    def load_item(cls, fname, offset, index):
+        '''
+        elem = NDArrayEncoder.load_item(fname, offset, index)
+
+        Returns ``arr[index]``, where ``arr`` is the array saved
+        (uncompressed) at ``offset`` in file ``fname``. The array is memory
+        mapped, so that only the rows which are needed are read from disk.
+        '''
+        arr = cls.load_mmap(fname, offset)
+        if arr is None:
+            raise NotImplementedError('jug.NDArrayEncoder: array cannot be memory mapped')
+        elem = arr[index]
+        if isinstance(elem, numpy.ndarray):
+            # Copy it out of the memory map
+            elem = numpy.array(elem)
+        return elem
 
     @classmethod
     def can_dump(cls, obj):
-        return type(obj) == numpy.ndarray
+        # Arrays of Python objects would need to be pickled inside the npy
+        # file (and numpy refuses to load those by default)
+        return type(obj) == numpy.ndarray and not obj.dtype.hasobject
 
     @classmethod
     def dump(cls, obj, file):
-        numpy.lib.npyio.format.write_array(file, obj)
+        if (obj.flags.c_contiguous or obj.flags.f_contiguous) and _write_header(file, obj):
+            file.write(memoryview(_byte_view(obj)))
+        else:
+            numpy.lib.format.write_array(file, obj)
@@ -0,0 +1,150 @@
+from .base import BaseEncoder
+
+import mmap
+import pickle
+import struct
+
+if pickle.HIGHEST_PROTOCOL < 5:
+    raise ImportError("pickle protocol 5 (Python 3.8) is needed for out-of-band buffers.")
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Layout of the encoded stream:
+#
+#   magic | nr buffers (u64) | pickle size (u64) | buffer sizes (u64 each) |
+#   pickle | buffers (each starting at a multiple of _ALIGNMENT)
+#
+# All integers are little endian and offsets are relative to the start of the
+# stream.
+_MAGIC = b'JUGPKL05'
+_ALIGNMENT = 64
+
+# Buffers smaller than this are kept inside the pickle
+_MIN_OUT_OF_BAND = 64 * 1024
+
+# How deep into nested containers ``can_dump`` looks for arrays
+_MAX_DEPTH = 4
+
+def _padding(pos):
+    return (-pos) % _ALIGNMENT
+
+def _has_large_buffers(obj, depth=0):
+    if numpy is not None and isinstance(obj, numpy.ndarray):
+        return obj.nbytes >= _MIN_OUT_OF_BAND and not obj.dtype.hasobject
+    if depth == _MAX_DEPTH:
+        return False
+    if isinstance(obj, dict):
+        obj = obj.values()
+    elif not isinstance(obj, (list, tuple)):
+        return False
+    return any(_has_large_buffers(elem, depth + 1) for elem in obj)
+
+def _read_exactly(file, n):
+    data = file.read(n)
+    if len(data) != n:
+        raise ValueError('jug.Pickle5Encoder: truncated stream')
+    return data
+
+def _read_layout(file):
+    '''
+    data, buffers = _read_layout(file)
+
+    Reads the header and the pickle from ``file``
+
+    Returns
+    -------
+    data : bytes
+        The pickle
+    buffers : list of (int, int)
+        Offset (from the start of the stream) and size of each buffer
+    '''
+    header = _read_exactly(file, len(_MAGIC) + 16)
+    nr_buffers, pickle_size = struct.unpack('<QQ', header[len(_MAGIC):])
+    sizes = struct.unpack('<%sQ' % nr_buffers, _read_exactly(file, 8 * nr_buffers))
+    data = _read_exactly(file, pickle_size)
+    pos = len(header) + 8 * nr_buffers + pickle_size
+    buffers = []
+    for size in sizes:
+        pos += _padding(pos)
+        buffers.append((pos, size))
+        pos += size
+    return data, buffers
+
+class Pickle5Encoder(BaseEncoder):
+    '''
+    Pickles containers (dicts, lists, tuples) which hold large numpy arrays
+    with protocol 5, writing the array buffers out-of-band: each one is
+    written directly from the array memory, after the pickle, and read back
+    into its own buffer (or memory mapped, see ``load_mmap``) with no
+    intermediate copy.
+    '''
+    encoder_id = 3
+
+    @classmethod
+    def can_load(cls, file):
+        return file.peek(len(_MAGIC))[:len(_MAGIC)] == _MAGIC
+
+    @classmethod
+    def load(cls, file):
+        data, layout = _read_layout(file)
+        pos = len(_MAGIC) + 16 + 8 * len(layout) + len(data)
+        buffers = []
+        for offset, size in layout:
+            _read_exactly(file, offset - pos)
+            buf = bytearray(size)
+            view = memoryview(buf)
+            filled = 0
+            while filled < size:
+                n = file.readinto(view[filled:])
+                if not n:
+                    raise ValueError('jug.Pickle5Encoder: truncated stream')
+                filled += n
+            buffers.append(buf)
+            pos = offset + size
+        return pickle.loads(data, buffers=buffers)
+
+    @classmethod
+    def load_mmap(cls, fname, offset=0):
+        '''
+        obj = Pickle5Encoder.load_mmap(fname, offset=0)
+
+        Loads the object saved (uncompressed) at ``offset`` in file ``fname``
+        with its buffers memory mapped (read-only). Returns None if the data
+        at ``offset`` is not in this format.
+        '''
+        with open(fname, 'rb') as f:
+            f.seek(offset)
+            if f.read(len(_MAGIC)) != _MAGIC:
+                return None
+            f.seek(offset)
+            data, layout = _read_layout(f)
+            mapped = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        return pickle.loads(data, buffers=[mapped[offset + start:offset + start + size] for start, size in layout])
+
+    @classmethod
+    def can_dump(cls, obj):
+        return _has_large_buffers(obj)
+
+    @classmethod
+    def dump(cls, obj, file):
+        buffers = []
+        def out_of_band(buf):
+            raw = buf.raw()
+            if raw.nbytes < _MIN_OUT_OF_BAND:
+                return True
+            buffers.append(raw)
+            return False
+        data = pickle.dumps(obj, protocol=5, buffer_callback=out_of_band)
+
+        header = _MAGIC + struct.pack('<QQ', len(buffers), len(data)) + struct.pack('<%sQ' % len(buffers), *[b.nbytes for b in buffers])
+        file.write(header)
+        file.write(data)
+        pos = len(header) + len(data)
+        for buf in buffers:
+            pad = _padding(pos)
+            file.write(b'\0' * pad)
+            file.write(buf)
+            pos += pad + buf.nbytes
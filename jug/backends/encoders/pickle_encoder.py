@@ -5,6 +5,7 @@ from .base import BaseEncoder
 from six.moves import cPickle as pickle
 
 class PickleEncoder(BaseEncoder):
+    encoder_id = 4
 
     @classmethod
     def can_load(cls, file):
@@ -0,0 +1,153 @@
+from .base import BaseEncoder
+
+import json
+import mmap
+import struct
+
+import numpy
+import scipy.sparse
+
+# Layout of the encoded stream:
+#
+#   magic | description size (u32) | description (JSON) |
+#   component arrays (each starting at a multiple of _ALIGNMENT)
+#
+# The description holds the class, the shape and the dtype and length of each
+# component array. Offsets are relative to the start of the stream.
+_MAGIC = b'JUGSPM01'
+_ALIGNMENT = 64
+_SIZE = struct.Struct('<I')
+
+# The arrays which make up each format
+_COMPONENTS = {
+    'csr': ('data', 'indices', 'indptr'),
+    'csc': ('data', 'indices', 'indptr'),
+    'coo': ('data', 'row', 'col'),
+}
+
+_CLASSES = {}
+for _format in _COMPONENTS:
+    _CLASSES[_format + '_matrix'] = getattr(scipy.sparse, _format + '_matrix')
+    if hasattr(scipy.sparse, _format + '_array'):
+        _CLASSES[_format + '_array'] = getattr(scipy.sparse, _format + '_array')
+
+def _padding(pos):
+    return (-pos) % _ALIGNMENT
+
+def _read_exactly(file, n):
+    data = file.read(n)
+    if len(data) != n:
+        raise ValueError('jug.SparseEncoder: truncated stream')
+    return data
+
+def _read_description(file):
+    '''
+    class_name, shape, layout, end = _read_description(file)
+
+    Reads the description at the start of ``file``
+
+    Returns
+    -------
+    class_name : str
+        E.g., ``'csr_matrix'``
+    shape : tuple
+    layout : list of (str, numpy.dtype, int, int)
+        Name, dtype, offset (from the start of the stream) and number of
+        elements of each component array
+    end : int
+        Offset of the end of the description
+    '''
+    _read_exactly(file, len(_MAGIC))
+    size, = _SIZE.unpack(_read_exactly(file, _SIZE.size))
+    description = json.loads(_read_exactly(file, size).decode('utf-8'))
+    end = len(_MAGIC) + _SIZE.size + size
+    pos = end
+    layout = []
+    for name, dtype, n in description['arrays']:
+        dtype = numpy.dtype(dtype)
+        pos += _padding(pos)
+        layout.append((name, dtype, pos, n))
+        pos += dtype.itemsize * n
+    return description['class'], tuple(description['shape']), layout, end
+
+def _build(class_name, shape, arrays):
+    cls = _CLASSES[class_name]
+    if class_name.startswith('coo'):
+        return cls((arrays['data'], (arrays['row'], arrays['col'])), shape=shape, copy=False)
+    return cls((arrays['data'], arrays['indices'], arrays['indptr']), shape=shape, copy=False)
+
+class SparseEncoder(BaseEncoder):
+    '''
+    Saves scipy.sparse matrices (and arrays) in CSR, CSC and COO formats as
+    their component arrays (e.g., ``data``, ``indices`` and ``indptr``),
+    written directly from their memory. Uncompressed results can be memory
+    mapped (see ``load_mmap``).
+    '''
+    encoder_id = 6
+
+    @classmethod
+    def can_load(cls, file):
+        return file.peek(len(_MAGIC))[:len(_MAGIC)] == _MAGIC
+
+    @classmethod
+    def load(cls, file):
+        class_name, shape, layout, pos = _read_description(file)
+        arrays = {}
+        for name, dtype, offset, n in layout:
+            _read_exactly(file, offset - pos)
+            arr = numpy.empty(n, dtype=dtype)
+            buf = memoryview(arr.view(numpy.uint8))
+            filled = 0
+            while filled < len(buf):
+                r = file.readinto(buf[filled:])
+                if not r:
+                    raise ValueError('jug.SparseEncoder: truncated stream')
+                filled += r
+            arrays[name] = arr
+            pos = offset + arr.nbytes
+        return _build(class_name, shape, arrays)
+
+    @classmethod
+    def load_mmap(cls, fname, offset=0):
+        '''
+        matrix = SparseEncoder.load_mmap(fname, offset=0)
+
+        Loads the matrix saved (uncompressed) at ``offset`` in file ``fname``
+        with its component arrays backed by a read-only memory map (unless
+        scipy needs to convert them, e.g., to a smaller index dtype). Returns
+        None if the data at ``offset`` is not in this format.
+        '''
+        with open(fname, 'rb') as f:
+            f.seek(offset)
+            if f.read(len(_MAGIC)) != _MAGIC:
+                return None
+            f.seek(offset)
+            class_name, shape, layout, _ = _read_description(f)
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        arrays = {}
+        for name, dtype, start, n in layout:
+            arrays[name] = numpy.frombuffer(mapped, dtype=dtype, count=n, offset=offset + start)
+        return _build(class_name, shape, arrays)
+
+    @classmethod
+    def can_dump(cls, obj):
+        return type(obj) in _CLASSES.values() and obj.ndim == 2 and not obj.dtype.hasobject
+
+    @classmethod
+    def dump(cls, obj, file):
+        arrays = [numpy.ascontiguousarray(getattr(obj, name)) for name in _COMPONENTS[obj.format]]
+        class_name = next(n for n, c in _CLASSES.items() if c is type(obj))
+        description = json.dumps({
+            'class': class_name,
+            'shape': list(obj.shape),
+            'arrays': [[name, arr.dtype.str, len(arr)] for name, arr in zip(_COMPONENTS[obj.format], arrays)],
+            }).encode('utf-8')
+        file.write(_MAGIC)
+        file.write(_SIZE.pack(len(description)))
+        file.write(description)
+        pos = len(_MAGIC) + _SIZE.size + len(description)
+        for arr in arrays:
+            pad = _padding(pos)
+            file.write(b'\0' * pad)
+            file.write(memoryview(arr.view(numpy.uint8)))
+            pos += pad + arr.nbytes
@@ -0,0 +1,118 @@
+from .base import BaseEncoder
+
+import pickle
+import struct
+from collections.abc import Iterator
+
+# Layout of the encoded stream:
+#
+#   magic | frames (each: size (u64) | pickle of a list of records) | 0 (u64)
+#
+# Records are written as they are produced, so that a result can be larger
+# than the memory of the process which computes it.
+_MAGIC = b'JUGSTR01'
+_U64 = struct.Struct('<Q')
+
+# The number of records per frame is adjusted so that frames are about this
+# size (only one frame is held in memory when writing or reading)
+_FRAME_BYTES = 1 << 20
+_FIRST_FRAME_LENGTH = 16
+_MAX_FRAME_LENGTH = 1 << 16
+
+def _read_exactly(file, n):
+    data = file.read(n)
+    if len(data) != n:
+        raise ValueError('jug.StreamEncoder: truncated stream')
+    return data
+
+def read_frames(file):
+    '''
+    for data in read_frames(file):
+        ...
+
+    Iterates over the frames (each a pickled list of records) in ``file``,
+    which must be positioned at the start of the stream.
+    '''
+    if _read_exactly(file, len(_MAGIC)) != _MAGIC:
+        raise ValueError('jug.StreamEncoder: not a streamed result')
+    while True:
+        size, = _U64.unpack(_read_exactly(file, _U64.size))
+        if not size:
+            return
+        yield _read_exactly(file, size)
+
+def _in_memory(frames):
+    return StreamedResult(lambda: iter(frames))
+
+class StreamedResult(object):
+    '''
+    The result of a task which returned an iterator (e.g., a generator).
+
+    Iterating over it reads the records back from the store, one frame at a
+    time, so that only a small part of the result is in memory. It can be
+    iterated over several times.
+    '''
+    def __init__(self, open_frames):
+        '''
+        StreamedResult(open_frames)
+
+        ``open_frames()`` returns an iterator over the frames of the result
+        '''
+        self._open_frames = open_frames
+
+    def __iter__(self):
+        for data in self._open_frames():
+            for record in pickle.loads(data):
+                yield record
+
+    def __reduce__(self):
+        return (_in_memory, (list(self._open_frames()),))
+
+    def __repr__(self):
+        return 'jug.StreamedResult()'
+
+class StreamEncoder(BaseEncoder):
+    '''
+    Saves iterators (such as generators) by consuming them and writing their
+    records in frames, so that the full result is never in memory.
+
+    Loading returns a ``StreamedResult``. Stores which can read the result
+    again on demand (e.g., ``file_store``) only read it as it is iterated
+    over; otherwise, the encoded frames are kept in memory and the records
+    are unpickled as they are iterated over.
+    '''
+    encoder_id = 8
+
+    @classmethod
+    def can_load(cls, file):
+        return file.peek(len(_MAGIC))[:len(_MAGIC)] == _MAGIC
+
+    @classmethod
+    def load(cls, file):
+        return _in_memory(list(read_frames(file)))
+
+    @classmethod
+    def can_dump(cls, obj):
+        return isinstance(obj, Iterator)
+
+    @classmethod
+    def dump(cls, obj, file):
+        file.write(_MAGIC)
+        frame_length = _FIRST_FRAME_LENGTH
+        records = []
+        for record in obj:
+            records.append(record)
+            if len(records) == frame_length:
+                size = cls._write_frame(records, file)
+                frame_length = int(max(1, min(_MAX_FRAME_LENGTH, frame_length * _FRAME_BYTES // max(size, 1))))
+                records = []
+        if records:
+            cls._write_frame(records, file)
+        file.write(_U64.pack(0))
+
+    @staticmethod
+    def _write_frame(records, file):
+        data = pickle.dumps(records, pickle.HIGHEST_PROTOCOL)
+        file.write(_U64.pack(len(data)))
+        file.write(data)
+        return len(data)
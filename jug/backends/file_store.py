@@ -29,15 +29,61 @@ from os import path, mkdir, fdopen
 from os.path import dirname, exists
 
 import errno
+import stat
+import io
 import tempfile
 import shutil
 import six
+from multiprocessing.pool import ThreadPool
 
 import logging
 logger = logging.getLogger(__name__)
 
 from .base import base_store
-from .encode import encode_to, decode_from
+from .encode import encode_to, decode_from, read_header, HEADER_SIZE
+from .encoders.stream_encoder import StreamEncoder, StreamedResult, read_frames
+from .open_compressed import parse_compression, open_codec
+
+try:
+    from .encoders.numpy_encoder import NDArrayEncoder
+except ImportError:
+    NDArrayEncoder = None
+
+try:
+    from .encoders.pickle5_encoder import Pickle5Encoder
+except ImportError:
+    Pickle5Encoder = None
+
+try:
+    from .encoders.arrow_encoder import ArrowEncoder, select_columns
+except ImportError:
+    ArrowEncoder = None
+
+try:
+    from .encoders.h5py_encoder import H5PyEncoder
+except ImportError:
+    H5PyEncoder = None
+
+# Number of threads used by the batch methods (``load_many``, ...)
+_NR_IO_THREADS = 16
+
+def _thread_map(f, args):
+    '''
+    results = _thread_map(f, args)
+
+    Equivalent to ``[f(*a) for a in args]``, but calls ``f`` from a pool of
+    threads, as on network filesystems most of the time is spent waiting for
+    the server.
+    '''
+    args = list(args)
+    if len(args) < 2:
+        return [f(*a) for a in args]
+    pool = ThreadPool(min(len(args), _NR_IO_THREADS))
+    try:
+        return pool.map(lambda a: f(*a), args)
+    finally:
+        pool.close()
+        pool.join()
 
 def create_directories(dname):
     '''
@@ -55,15 +101,70 @@ def create_directories(dname):
         if e.errno != errno.EEXIST:
             raise
 
+def _key_name(key):
+    # On Python 3, names passed as bytes end up in the filesystem as their
+    # repr (e.g., "b'0123...'"). List them as the original name.
+    if key.startswith("b'") and key.endswith("'"):
+        return key[2:-1]
+    return key
+
+def _load_mmap(fname, min_size):
+    '''
+    obj = _load_mmap(fname, min_size)
+
+    If ``fname`` is at least ``min_size`` bytes and is either an uncompressed
+    npy file (holding no Python objects) or a pickle with out-of-band buffers
+    (see ``Pickle5Encoder``), loads it with its array data memory mapped
+    (read-only). Otherwise, returns None.
+    '''
+    if os.stat(fname).st_size < min_size:
+        return None
+    with open(fname, 'rb') as f:
+        header = read_header(f)
+    if header is not None:
+        if header.codec is not None or not hasattr(header.encoder, 'load_mmap'):
+            return None
+        return header.encoder.load_mmap(fname, HEADER_SIZE)
+    # Result written without a header
+    for encoder in (Pickle5Encoder, NDArrayEncoder):
+        if encoder is not None:
+            obj = encoder.load_mmap(fname)
+            if obj is not None:
+                return obj
+    return None
+
+def _open_frames(fname):
+    with open(fname, 'rb') as f:
+        header = read_header(f)
+        for data in read_frames(io.BufferedReader(open_codec(f, header.codec))):
+            yield data
+
 class file_store(base_store):
-    def __init__(self, dname):
+    def __init__(self, dname, mmap_threshold=None, compression=None):
         '''
-        file_store(dname)
+        file_store(dname, mmap_threshold=None, compression=None)
 
         Recursively create directories.
+
+        Parameters
+        ----------
+        dname : str
+            Directory
+        mmap_threshold : int, optional
+            Results whose file is at least this many bytes have their arrays
+            loaded as read-only memory maps (see ``load_mmap``). By default, only tasks
+            which request it (with ``jug.task.mmap_result``) are mapped.
+        compression : str, optional
+            How to compress results (e.g., ``zstd``, ``gzip:9`` or ``auto``,
+            see ``jug.backends.encode.encode_to``). Tasks can override it
+            with ``jug.task.compress_result``.
         '''
         if dname.endswith('/'): dname = dname[:-1]
         self.jugdir = dname
+        self.mmap_threshold = mmap_threshold
+        if compression is not None:
+            parse_compression(compression)
+        self.compression = compression
 
     def create(self):
         '''
@@ -87,25 +188,59 @@ class file_store(base_store):
         name = six.text_type(name)
         return path.join(self.jugdir, name[:2], name[2:])
 
-    def dump(self, obj, name):
+    def dump(self, obj, name, compression=None):
         '''
-        store.dump(obj, name)
+        store.dump(obj, name, compression=None)
 
         Dump obj to filesystem via intermediate temporary file.
+
+        ``compression`` overrides the compression setting of the store.
+
+        Open HDF5 files (``h5py.File`` objects) are copied into the store as
+        they are on disk (and made read-only) unless compression is
+        requested.
         '''
+        if compression is None:
+            compression = self.compression
         name = self._getfname(name)
         create_directories(dirname(name))
         self._maybe_create()
         fd, fname = tempfile.mkstemp('.jugtmp', 'jugtemp', self.tempdir())
-        output = os.fdopen(fd, 'wb')
-
-        encode_to(obj, output)
-
-        output.close()
+        source = self._hdf5_source(obj, compression)
+        if source is not None:
+            # A copy (rather than a link), so that writing to the source file
+            # later does not change the result
+            with open(source, 'rb') as input, os.fdopen(fd, 'wb') as output:
+                shutil.copyfileobj(input, output, 1 << 20)
+            os.chmod(fname, stat.S_IRUSR)
+        else:
+            output = os.fdopen(fd, 'wb')
+
+            # Long lists are saved in blocks (if not compressed), so that
+            # ``load_item`` can read single elements
+            encode_to(obj, output, compression, partial=True)
+
+            output.close()
 
         # Rename is atomic even over NFS.
         os.rename(fname, name)
 
+    def _hdf5_source(self, obj, compression):
+        if H5PyEncoder is None or not H5PyEncoder.can_dump(obj):
+            return None
+        if compression is not None and parse_compression(compression)[0] is not None:
+            return None
+        return H5PyEncoder.disk_filename(obj)
+
+    def dump_many(self, objects, names):
+        '''
+        store.dump_many(objects, names)
+
+        Dumps each of ``objects`` (from a pool of threads).
+        '''
+        self._maybe_create()
+        _thread_map(self.dump, zip(objects, names))
+
     def list(self):
         '''
         keys = store.list()
@@ -119,7 +254,7 @@ class file_store(base_store):
         for d in os.listdir(self.jugdir):
             if len(d) == 2:
                 for f in os.listdir(self.jugdir + '/' + d):
-                    keys.append(d+f)
+                    keys.append(_key_name(d+f))
         return keys
 
 
@@ -137,7 +272,7 @@ class file_store(base_store):
 
         keys = []
         for k in os.listdir(self.jugdir + '/locks'):
-            keys.append(k[:-len('.lock')])
+            keys.append(_key_name(k[:-len('.lock')]))
         return keys
 
 
@@ -149,6 +284,14 @@ class file_store(base_store):
         return exists(fname)
 
 
+    def can_load_many(self, names):
+        '''
+        can = store.can_load_many(names)
+
+        Checks for each of ``names`` (from a pool of threads).
+        '''
+        return _thread_map(self.can_load, [(name,) for name in names])
+
     def load(self, name):
         '''
         obj = store.load(name)
@@ -167,10 +310,84 @@ class file_store(base_store):
             The object that was saved under ``name``
         '''
         fname = self._getfname(name)
+        if self.mmap_threshold is not None:
+            obj = _load_mmap(fname, self.mmap_threshold)
+            if obj is not None:
+                return obj
         infile = open(fname, 'rb')
+        header = read_header(infile)
+        if header is not None and isinstance(header.encoder, StreamEncoder):
+            # Records are read from the file as they are iterated over
+            infile.close()
+            return StreamedResult(lambda: _open_frames(fname))
+        if header is None and H5PyEncoder is not None and H5PyEncoder.is_hdf5(infile):
+            # HDF5 files are opened in place (see ``dump``)
+            infile.close()
+            return H5PyEncoder.open_file(fname)
+        infile.seek(0)
 
         return decode_from( infile )
 
+    def load_mmap(self, name):
+        '''
+        obj = store.load_mmap(name)
+
+        Same as ``load``, except that array results (which were saved
+        uncompressed) are returned as read-only ``numpy.memmap`` objects and
+        the arrays inside containers saved with out-of-band buffers are backed
+        by a read-only memory map. Their pages are then shared between all the
+        processes which load them and only read from disk when accessed.
+        '''
+        obj = _load_mmap(self._getfname(name), 0)
+        if obj is not None:
+            return obj
+        return self.load(name)
+
+    def load_item(self, name, index):
+        '''
+        elem = store.load_item(name, index)
+
+        Equivalent to ``store.load(name)[index]``, but only the part of the
+        file which holds ``elem`` is read. This is only possible for results
+        saved uncompressed as arrays or long lists: for any other result,
+        ``NotImplementedError`` is raised (so that the caller can load, and
+        keep, the whole result instead).
+        '''
+        fname = self._getfname(name)
+        with open(fname, 'rb') as f:
+            header = read_header(f)
+        if header is None or header.codec is not None or not hasattr(header.encoder, 'load_item'):
+            raise NotImplementedError('jug.file_store: result cannot be loaded in part')
+        return header.encoder.load_item(fname, HEADER_SIZE, index)
+
+    def load_columns(self, name, columns):
+        '''
+        obj = store.load_columns(name, columns)
+
+        Loads only ``columns`` of a DataFrame (or Arrow table) result (the
+        index is always loaded). Results saved uncompressed in Arrow format
+        are memory mapped, so that the other columns are never read from
+        disk; other results are loaded in full and then subset.
+        '''
+        fname = self._getfname(name)
+        with open(fname, 'rb') as f:
+            header = read_header(f)
+        if header is not None and header.codec is None and isinstance(header.encoder, ArrowEncoder):
+            return header.encoder.load_mmap(fname, HEADER_SIZE, columns)
+        obj = self.load(name)
+        if ArrowEncoder is None:
+            return obj[list(columns)]
+        return select_columns(obj, columns)
+
+    def load_many(self, names):
+        '''
+        objs = store.load_many(names)
+
+        Loads the objects identified by each of ``names`` (from a pool of
+        threads).
+        '''
+        return _thread_map(self.load, [(name,) for name in names])
+
     def remove(self, name):
         '''
         was_removed = store.remove(name)
@@ -186,6 +403,16 @@ class file_store(base_store):
         except OSError:
             return False
 
+    def remove_many(self, names):
+        '''
+        was_removed = store.remove_many(names)
+
+        Remove the entries associated with each of ``names``.
+
+        Files are unlinked from a pool of threads.
+        '''
+        return _thread_map(self.remove, [(name,) for name in names])
+
     def cleanup(self, active):
         '''
         nr_removed = store.cleanup(active)
@@ -34,6 +34,7 @@ import os
 
 from jug.backends.encode import encode, decode
 from .base import base_store, base_lock
+from .redis_store import _glob_escape, _KEYS_BATCH_SIZE
 
 
 try:
@@ -57,16 +58,6 @@ store_connection_pattern  = re.compile(
 )
 
 
-def _delete_keys_script(key_pattern):
-    """Return script deleting keys matching given pattern for use with redis exec."""
-    return """
-        local curkey = redis.call('keys', '%(key_pattern)s')
-        if next(curkey) then
-            redis.call('del', unpack(curkey))
-        end
-    """ % dict(key_pattern = key_pattern)
-
-
 class gcs_redis_store(base_store):
 
     @property
@@ -127,9 +118,13 @@ class gcs_redis_store(base_store):
         logger.info("prefix: %r", self.prefix)
         
     def storage_key(self, name):
+        if isinstance(name, bytes):
+            name = name.decode("utf8")
         return self.prefix + name
 
     def redis_key(self, key_type, name):
+        if isinstance(name, bytes):
+            name = name.decode("utf8")
         return (key_type + ":" + self.prefix + name).encode("utf8")
 
     def redis_result_key(self, name):
@@ -163,6 +158,53 @@ class gcs_redis_store(base_store):
         s = self.bucket.blob(self.storage_key(name)).download_as_string()
         return decode(s)
 
+    def dump_many(self, objects, names):
+        '''
+        dump_many(objects, names)
+
+        Uploads each of ``objects`` and then writes all the redis markers in a
+        single pipelined round trip.
+        '''
+        names = list(names)
+        for obj, name in zip(objects, names):
+            sblob = self.bucket.blob(self.storage_key(name))
+            sblob.upload_from_string(encode(obj), content_type=None)
+        pipe = self.redis.pipeline(transaction=False)
+        for name in names:
+            pipe.set(self.redis_result_key(name), self.storage_key(name))
+        pipe.execute()
+
+    def can_load_many(self, names):
+        '''
+        can = can_load_many(names)
+
+        Checks the redis markers of each of ``names`` (using a single
+        pipelined round trip).
+        '''
+        pipe = self.redis.pipeline(transaction=False)
+        for name in names:
+            pipe.exists(self.redis_result_key(name))
+        return [bool(r) for r in pipe.execute()]
+
+    def remove_many(self, names):
+        '''
+        was_removed = remove_many(names)
+
+        Removes the redis markers of each of ``names`` (using a single
+        pipelined round trip) and then their storage blobs.
+        '''
+        names = list(names)
+        pipe = self.redis.pipeline(transaction=False)
+        for name in names:
+            pipe.delete(self.redis_result_key(name))
+        removed = [bool(r) for r in pipe.execute()]
+        for name in names:
+            try:
+                self.bucket.blob(self.storage_key(name)).delete()
+            except:
+                logger.exception("Error removing storage blob: %s" % self.storage_key(name))
+        return removed
+
     def remove(self, name):
         '''
         was_removed = remove(name)
@@ -178,22 +220,36 @@ class gcs_redis_store(base_store):
             logger.exception("Error removing storage blob: %s" % self.storage_key)
         return removed
 
+    def _scan(self, prefix):
+        return self.redis.scan_iter(match=_glob_escape(prefix) + b'*', count=_KEYS_BATCH_SIZE)
+
+    def _delete_keys(self, keys):
+        removed = 0
+        keys = list(keys)
+        for start in range(0, len(keys), _KEYS_BATCH_SIZE):
+            removed += self.redis.delete(*keys[start:start + _KEYS_BATCH_SIZE])
+        return removed
+
     def sync(self):
-        current_keys = self.redis.keys(self.redis_result_key("*"))
-        current_blobs = list(self.bucket.list_blobs(prefix=self.prefix))
+        '''
+        store.sync()
 
-        logger.info("sync gcs objects: %s redis markers: %s", len(current_blobs), len(current_keys))
+        Rebuilds the redis result markers from the objects present in GCS
+        '''
+        current_blobs = set(b.name for b in self.bucket.list_blobs(prefix=self.prefix))
+        current_keys = set(self._scan(self.redis_result_key("")))
 
-        sync_script = "\n".join(
-            [_delete_keys_script(self.redis_result_key("*"))] +
-            [
-                "redis.call('set', '%s', '%s')"
-                 % (self.redis_result_key(b.name[len(self.prefix):]), b.name)
-                 for b in current_blobs
-            ]
-        )
+        logger.info("sync gcs objects: %s redis markers: %s", len(current_blobs), len(current_keys))
 
-        self.redis.eval(sync_script, 0)
+        pipe = self.redis.pipeline(transaction=False)
+        expected = set()
+        for name in current_blobs:
+            key = self.redis_result_key(name[len(self.prefix):])
+            expected.add(key)
+            if key not in current_keys:
+                pipe.set(key, name)
+        pipe.execute()
+        self._delete_keys(current_keys - expected)
 
     def cleanup(self, active):
         '''
@@ -204,29 +260,22 @@ class gcs_redis_store(base_store):
         # Begin by hard-syncing redis result state with gcs backend.
         self.sync()
         
-        existing = list(self.list())
-
-        for inactive in set(existing) - set(active):
-            self.remove(inactive)
+        active = set(self.redis_result_key(t.hash()) for t in active)
+        prefix = self.redis_result_key("")
+        inactive = [k[len(prefix):] for k in self._scan(prefix) if k not in active]
+        return sum(self.remove_many(inactive))
 
     def remove_locks(self):
-        locks = self.redis.keys(self.redis_lock_key('*'))
-        for lk in locks:
-            self.redis.delete(lk)
-        return len(locks)
+        return self._delete_keys(self._scan(self.redis_lock_key("")))
 
     def list(self):
         prefix = self.redis_result_key("")
-        existing = self.redis.keys(prefix + "*")
-        
-        for ex in existing:
+        for ex in self._scan(prefix):
             yield ex[len(prefix):]
 
     def listlocks(self):
         prefix = self.redis_lock_key("")
-        existing = self.redis.keys(prefix + "*")
-        
-        for ex in existing:
+        for ex in self._scan(prefix):
             yield ex[len(prefix):]
             
     def getlock(self, name):
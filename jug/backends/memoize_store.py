@@ -25,6 +25,13 @@ memoize_store: a wrapper that never repeats a lookup.
 '''
 
 
+def _as_text(name):
+    # Stores differ on whether keys are listed as bytes or as text (and hashes
+    # are bytes), so listed keys are compared as text.
+    if isinstance(name, bytes):
+        return name.decode('utf-8')
+    return name
+
 class memoize_store(object):
     def __init__(self, base, list_base=False):
         '''
@@ -34,9 +41,9 @@ class memoize_store(object):
         self.keys = None
         self.locks = None
         if list_base and hasattr(base, 'list'):
-            self.keys = set(base.list())
+            self.keys = set(_as_text(k) for k in base.list())
         if list_base and hasattr(base, 'listlocks'):
-            self.locks = set(base.listlocks())
+            self.locks = set(_as_text(k) for k in base.listlocks())
 
     def dump(self, object, outname):
         '''
@@ -50,11 +57,27 @@ class memoize_store(object):
         can = can_load(name)
         '''
         if self.keys is not None:
-            return name in self.keys
+            return _as_text(name) in self.keys
         if ('can-load', name) not in self.cache:
             self.cache['can-load', name] = self.base.can_load(name)
         return self.cache['can-load',name]
 
+    def can_load_many(self, names):
+        '''
+        can = can_load_many(names)
+
+        Only the names which have not been looked up before are passed on (in
+        a single batch) to the base store.
+        '''
+        names = list(names)
+        if self.keys is not None:
+            return [_as_text(name) in self.keys for name in names]
+        missing = [name for name in names if ('can-load', name) not in self.cache]
+        if missing:
+            for name, can in zip(missing, self.base.can_load_many(missing)):
+                self.cache['can-load', name] = can
+        return [self.cache['can-load', name] for name in names]
+
 
     def load(self, name):
         '''
@@ -109,7 +132,7 @@ class cache_lock(object):
         self.base = base.getlock(name)
         self.status = _UNKNOWN
         if locks is not None:
-            self.status = (_LOCKED if (name in locks) else _NOT_LOCKED)
+            self.status = (_LOCKED if (_as_text(name) in locks) else _NOT_LOCKED)
 
     def get(self):
         '''
@@ -1,3 +1,5 @@
+import io
+
 def _open_gzip_compressed(f):
     from gzip import GzipFile
     return GzipFile(filename=f) if isinstance(f, str) else GzipFile(fileobj=f)
@@ -12,11 +14,40 @@ def _open_snappy_compressed(f):
 
     return snappy_stream.SnappyReadWrapper(f, owns_source=True)
 
+def _open_zstd_compressed(f):
+    import zstandard
+    return zstandard.ZstdDecompressor().stream_reader(f)
+
+def _open_lz4_compressed(f):
+    import lz4.frame
+    return lz4.frame.LZ4FrameFile(f, mode='rb')
+
 # bz2file used to support concatenated bz2 streams
 _compressed_magic_bytes = {}
 _compressed_magic_bytes[b"\x1f\x8b\x08"] = _open_gzip_compressed
 _compressed_magic_bytes[b"\x42\x5a\x68"] = _open_bz2_compressed
 _compressed_magic_bytes[b'\xff\x06\x00\x00sNaPpY'] = _open_snappy_compressed
+_compressed_magic_bytes[b'\x28\xb5\x2f\xfd'] = _open_zstd_compressed
+_compressed_magic_bytes[b'\x04\x22\x4d\x18'] = _open_lz4_compressed
+
+# Decompressing readers by codec name (the name recorded in the header of
+# results, see ``jug.backends.encode``)
+_compressed_readers = {
+    'gzip': _open_gzip_compressed,
+    'bz2': _open_bz2_compressed,
+    'snappy': _open_snappy_compressed,
+    'zstd': _open_zstd_compressed,
+    'lz4': _open_lz4_compressed,
+}
+
+def open_codec(stream, codec):
+    """Open ``stream``, compressed with ``codec``, as a decompressed file object.
+
+    codec - name of the codec (None if ``stream`` is not compressed)
+    """
+    if codec is None:
+        return stream
+    return _compressed_readers[codec](stream)
 
 def open_compressed(filename):
     """Open a possibly compressed file or stream as a decompressed file object.
@@ -39,3 +70,154 @@ def open_compressed(filename):
             return _compressed_magic_bytes[magic_bytes](file_object)
     else:
         return file_object
+
+
+def _gzip_writer(f, level):
+    from gzip import GzipFile
+    return GzipFile(fileobj=f, mode='wb', compresslevel=(6 if level is None else level))
+
+def _zstd_writer(f, level):
+    import zstandard
+    return zstandard.ZstdCompressor(level=(3 if level is None else level)).stream_writer(f, closefd=False)
+
+def _lz4_writer(f, level):
+    import lz4.frame
+    return lz4.frame.LZ4FrameFile(f, mode='wb', compression_level=(0 if level is None else level))
+
+# For each codec: the module it needs and a function returning a writer (whose
+# close() method finishes the compressed stream, but does not close ``f``)
+_compressed_writers = {
+    'gzip': ('gzip', _gzip_writer),
+    'zstd': ('zstandard', _zstd_writer),
+    'lz4': ('lz4.frame', _lz4_writer),
+}
+
+# In adaptive mode, the first bytes of each result are compressed as a
+# sample. If they do not shrink to at most this fraction of their size, the
+# result is written uncompressed
+_ADAPTIVE_SAMPLE_SIZE = 1 << 20
+_ADAPTIVE_MAX_RATIO = .9
+
+def _available(codec):
+    try:
+        __import__(_compressed_writers[codec][0])
+        return True
+    except ImportError:
+        return False
+
+def parse_compression(spec):
+    """Parse a compression setting.
+
+    The setting is one of ``none``, ``CODEC`` or ``CODEC:LEVEL`` (where
+    ``CODEC`` is one of ``zstd``, ``lz4`` or ``gzip``), optionally prefixed
+    with ``auto:`` for adaptive compression. ``auto`` on its own uses the best
+    codec which is available.
+
+    Returns (codec, level, adaptive), where codec is None for ``none``.
+    """
+    parts = spec.split(':')
+    adaptive = (parts[0] == 'auto')
+    if adaptive:
+        parts = parts[1:]
+        if not parts:
+            parts = [next(c for c in ('zstd', 'lz4', 'gzip') if _available(c))]
+    codec = parts[0]
+    if codec == 'none' and len(parts) == 1 and not adaptive:
+        return None, None, False
+    if codec not in _compressed_writers or len(parts) > 2:
+        raise ValueError('jug: invalid compression setting %r (expected none, zstd, lz4 or gzip, optionally with a :LEVEL and an auto: prefix)' % spec)
+    if not _available(codec):
+        raise ValueError('jug: %s compression needs the %s module' % (codec, _compressed_writers[codec][0]))
+    level = (int(parts[1]) if len(parts) == 2 else None)
+    return codec, level, adaptive
+
+class _Uncompressed(io.RawIOBase):
+    """Writer which passes everything on to ``stream`` (closing only flushes it)."""
+    def __init__(self, stream):
+        self.stream = stream
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.stream.write(b)
+        return memoryview(b).nbytes
+
+    def close(self):
+        if not self.closed:
+            self.stream.flush()
+        io.RawIOBase.close(self)
+
+def _compressed_size(codec, level, data):
+    output = io.BytesIO()
+    writer = _compressed_writers[codec][1](output, level)
+    writer.write(data)
+    writer.close()
+    return len(output.getvalue())
+
+class _AdaptiveWriter(io.RawIOBase):
+    """Writer which buffers the first ``_ADAPTIVE_SAMPLE_SIZE`` bytes and then
+    decides whether it is worth compressing them (and everything after)."""
+    def __init__(self, stream, codec, level, prefix):
+        self.stream = stream
+        self.codec = codec
+        self.level = level
+        self.prefix = prefix
+        self.sample = bytearray()
+        self.output = None
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        view = memoryview(b).cast('B')
+        n = len(view)
+        if self.output is None:
+            space = _ADAPTIVE_SAMPLE_SIZE - len(self.sample)
+            self.sample += view[:space]
+            if len(self.sample) < _ADAPTIVE_SAMPLE_SIZE:
+                return n
+            self._choose()
+            view = view[space:]
+        if len(view):
+            self.output.write(view)
+        return n
+
+    def _choose(self):
+        sample = bytes(self.sample)
+        self.sample = None
+        if sample and _compressed_size(self.codec, self.level, sample) <= _ADAPTIVE_MAX_RATIO * len(sample):
+            self.prefix(self.codec)
+            self.output = _compressed_writers[self.codec][1](self.stream, self.level)
+        else:
+            self.prefix(None)
+            self.output = _Uncompressed(self.stream)
+        self.output.write(sample)
+
+    def close(self):
+        if not self.closed:
+            if self.output is None:
+                self._choose()
+            self.output.close()
+        io.RawIOBase.close(self)
+
+def open_compressed_writer(stream, compression, prefix=None):
+    """Open a writer which compresses into ``stream``.
+
+    compression - setting (see ``parse_compression``)
+    prefix - optional function, called with the name of the codec which is
+             used (None if the data is written uncompressed) before anything
+             is written to ``stream`` (so that it can write a header)
+
+    Closing the writer finishes the compressed stream, but leaves ``stream``
+    open.
+    """
+    if prefix is None:
+        prefix = lambda codec: None
+    codec, level, adaptive = parse_compression(compression)
+    if codec is not None and adaptive:
+        return _AdaptiveWriter(stream, codec, level, prefix)
+    prefix(codec)
+    if codec is None:
+        return _Uncompressed(stream)
+    return _compressed_writers[codec][1](stream, level)
@@ -0,0 +1,7 @@
+'''
+Benchmarks for jug internals.
+
+Each submodule can be run as a script, e.g.::
+
+    python -m jug.benchmarks.graph
+'''
@@ -0,0 +1,241 @@
+'''
+Encoding benchmark.
+
+Times ``encode_to`` and ``decode_from`` (the functions which the stores use to
+save and load results) on representative payloads:
+
+- a large array of floats (which does not compress well) and one of small
+  integers (which does);
+- many small arrays;
+- nested dicts;
+- a list of strings;
+- a DataFrame and an HDF5 file (if pandas and h5py are installed).
+
+For each payload and compression setting, it reports which encoder was used,
+the throughput of saving and loading (relative to the uncompressed size), the
+peak memory allocated while doing so (as seen by ``tracemalloc``) and the
+size of the result. Payloads are generated from a fixed seed, so that runs
+on different machines (or with different settings) can be compared.
+
+Usage::
+
+    python -m jug.benchmarks.encode [--size=MB] [--repeat=N] [--codecs=none,zstd,...] [--payloads=NAME,...] [--json=FILE]
+'''
+from __future__ import print_function
+
+import json
+import platform
+import sys
+import tracemalloc
+from io import BytesIO
+from time import time
+
+import numpy as np
+
+from ..backends.encode import encode_to, decode_from, read_header
+from ..backends.open_compressed import _available
+
+def _dataframe(rs, nbytes):
+    try:
+        import pandas as pd
+    except ImportError:
+        return None
+    n = nbytes // 32
+    return pd.DataFrame({
+        'index': np.arange(n),
+        'value': rs.random_sample(n),
+        'count': rs.randint(0, 100, size=n).astype(np.int32),
+        'category': np.array(['alpha', 'beta', 'gamma', 'delta'])[rs.randint(0, 4, size=n)],
+        })
+
+def _hdf5_file(rs, nbytes):
+    try:
+        import h5py
+    except ImportError:
+        return None
+    f = h5py.File('jug-benchmark.h5', 'w', driver='core', backing_store=False)
+    f.create_dataset('values', data=rs.random_sample(nbytes // 16))
+    f.create_dataset('labels', data=rs.randint(0, 16, size=nbytes // 16).astype(np.int64))
+    return f
+
+def build_payloads(nbytes, seed=0):
+    '''
+    payloads = build_payloads(nbytes, seed=0)
+
+    Returns a list of (name, object) pairs of (approximately) ``nbytes`` each.
+    Payloads which need a module which is not installed are left out.
+    '''
+    rs = np.random.RandomState(seed)
+    small = 16 * 16
+    words = [''.join(rs.choice(list('abcdefghijklmnopqrstuvwxyz'), size=8)) for _ in range(1024)]
+    payloads = [
+        ('large array (float64)', rs.random_sample(nbytes // 8)),
+        ('large array (int64, compressible)', rs.randint(0, 16, size=nbytes // 8).astype(np.int64)),
+        ('many small arrays', [rs.random_sample((16, 16)) for _ in range(max(1, nbytes // (small * 8)))]),
+        ('nested dicts', dict(
+            ('group-%s' % i, {
+                'values': rs.random_sample(16).tolist(),
+                'counts': rs.randint(0, 1000, size=16).tolist(),
+                'label': words[i % len(words)],
+                'meta': {'id': i, 'valid': bool(i % 3)},
+            }) for i in range(max(1, nbytes // 512)))),
+        ('strings', [words[i % len(words)] * (1 + i % 8) for i in range(max(1, nbytes // 40))]),
+        ('DataFrame', _dataframe(rs, nbytes)),
+        ('HDF5 file', _hdf5_file(rs, nbytes)),
+        ]
+    return [(name, obj) for name, obj in payloads if obj is not None]
+
+def available_codecs():
+    '''
+    codecs = available_codecs()
+
+    Returns the compression settings which can be used here
+    '''
+    return ['none'] + [c for c in ('lz4', 'zstd', 'gzip') if _available(c)] + ['auto']
+
+def _best(f, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time()
+        f()
+        elapsed = time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def _peak_memory(f):
+    tracemalloc.start()
+    try:
+        f()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+def _encoded(obj, compression):
+    output = BytesIO()
+    encode_to(obj, output, compression)
+    return output.getvalue()
+
+def benchmark(obj, compression, repeat=3):
+    '''
+    result = benchmark(obj, compression, repeat=3)
+
+    Times saving ``obj`` with ``compression`` (e.g., ``'zstd'``) and loading it
+    back (best of ``repeat`` runs), in memory.
+
+    Returns
+    -------
+    result : dict
+        With keys 'encoder', 'size' (in bytes, including the header), 'dump'
+        and 'load' (in seconds) and 'dump peak memory' and 'load peak memory'
+        (in bytes)
+    '''
+    data = _encoded(obj, compression)
+    header = read_header(BytesIO(data))
+    return {
+        'encoder': (type(header.encoder).__name__ if header is not None else None),
+        'size': len(data),
+        'dump': _best(lambda: _encoded(obj, compression), repeat),
+        'load': _best(lambda: decode_from(BytesIO(data)), repeat),
+        'dump peak memory': _peak_memory(lambda: _encoded(obj, compression)),
+        'load peak memory': _peak_memory(lambda: decode_from(BytesIO(data))),
+        }
+
+def run(nbytes, codecs=None, payloads=None, repeat=3, seed=0):
+    '''
+    report = run(nbytes, codecs=None, payloads=None, repeat=3, seed=0)
+
+    Runs the benchmark on every payload (or only those named in
+    ``payloads``) with every compression setting in ``codecs`` (by default,
+    all those which are available).
+
+    Returns
+    -------
+    report : dict
+        The settings and environment of the run (under 'settings') and one
+        entry per payload and codec (under 'results'). Throughputs are in MB/s
+        of uncompressed output.
+    '''
+    if codecs is None:
+        codecs = available_codecs()
+    results = []
+    for name, obj in build_payloads(nbytes, seed):
+        if payloads is not None and name not in payloads:
+            continue
+        raw = len(_encoded(obj, 'none'))
+        for codec in codecs:
+            r = benchmark(obj, codec, repeat)
+            r['payload'] = name
+            r['codec'] = codec
+            r['ratio'] = r['size'] / float(max(raw, 1))
+            r['dump MB/s'] = raw / 2.**20 / max(r['dump'], 1e-9)
+            r['load MB/s'] = raw / 2.**20 / max(r['load'], 1e-9)
+            results.append(r)
+    return {
+        'settings': {
+            'size': nbytes,
+            'repeat': repeat,
+            'seed': seed,
+            'codecs': list(codecs),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+        },
+        'results': results,
+        }
+
+def print_report(report, output=None):
+    '''
+    print_report(report, output=sys.stdout)
+
+    Prints ``report`` (as returned by ``run``) as a table
+    '''
+    if output is None:
+        output = sys.stdout
+    payload = None
+    for r in report['results']:
+        if r['payload'] != payload:
+            if payload is not None:
+                print(file=output)
+            payload = r['payload']
+            print(payload, file=output)
+            print('-' * 96, file=output)
+            print('%-10s %-16s %10s %7s %10s %10s %12s %12s' % ('codec', 'encoder', 'size (MB)', 'ratio', 'dump MB/s', 'load MB/s', 'dump peak MB', 'load peak MB'), file=output)
+        print('%-10s %-16s %10.2f %7.3f %10.1f %10.1f %12.1f %12.1f' % (
+                r['codec'],
+                r['encoder'],
+                r['size'] / 2.**20,
+                r['ratio'],
+                r['dump MB/s'],
+                r['load MB/s'],
+                r['dump peak memory'] / 2.**20,
+                r['load peak memory'] / 2.**20), file=output)
+
+def main(argv=None):
+    import optparse
+    parser = optparse.OptionParser(usage='python -m jug.benchmarks.encode [OPTIONS]')
+    parser.add_option('--size', action='store', type='int', dest='size', default=64, help='Size of each payload (in MB)')
+    parser.add_option('--repeat', action='store', type='int', dest='repeat', default=3)
+    parser.add_option('--seed', action='store', type='int', dest='seed', default=0)
+    parser.add_option('--codecs', action='store', dest='codecs', default=None, help='Compression settings to compare, separated by commas (default: all available)')
+    parser.add_option('--payloads', action='store', dest='payloads', default=None, help='Payloads to use, separated by commas (default: all)')
+    parser.add_option('--json', action='store', dest='json', default=None, help='Also write the report as JSON to this file (use - for standard output, instead of the table)')
+    options, _ = parser.parse_args(argv)
+
+    report = run(options.size << 20,
+            codecs=(options.codecs.split(',') if options.codecs else None),
+            payloads=(options.payloads.split(',') if options.payloads else None),
+            repeat=options.repeat,
+            seed=options.seed)
+    if options.json == '-':
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return
+    print_report(report)
+    if options.json is not None:
+        with open(options.json, 'w') as output:
+            json.dump(report, output, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+'''
+Dependency graph benchmark.
+
+Builds two graphs which used to be pathological for jug and times ``jug
+check`` (as well as the graph helpers from ``jug.task``) on them:
+
+- a chain, where every task depends on the previous one (deep graph);
+- a diamond lattice, where every task depends on two tasks of the previous
+  level (the number of paths doubles at every level).
+
+Usage::
+
+    python -m jug.benchmarks.graph [--chain-length=N] [--levels=N] [--width=N]
+'''
+from __future__ import print_function
+
+from time import time
+
+from .. import task
+from ..task import Task, recursive_dependencies, topological_sort
+from ..graph import TaskGraph
+from ..backends.dict_store import dict_store
+
+def _noop(*args):
+    return None
+
+def build_chain(n):
+    '''
+    tasks = build_chain(n)
+
+    Builds a chain of ``n`` tasks, each depending on the previous one.
+    '''
+    tasks = [Task(_noop, 0)]
+    for _ in range(n - 1):
+        tasks.append(Task(_noop, tasks[-1]))
+    return tasks
+
+def build_lattice(levels, width=2):
+    '''
+    tasks = build_lattice(levels, width=2)
+
+    Builds a lattice of ``levels`` levels (on top of a base level) of
+    ``width`` tasks each. Task ``k`` of a level depends on tasks ``k`` and
+    ``k + 1`` of the previous level (wrapping around).
+    '''
+    prev = [Task(_noop, k) for k in range(width)]
+    tasks = list(prev)
+    for _ in range(levels):
+        prev = [Task(_noop, prev[k], prev[(k + 1) % width]) for k in range(width)]
+        tasks.extend(prev)
+    return tasks
+
+def _timed(timings, label, f, *args):
+    start = time()
+    r = f(*args)
+    timings.append((label, time() - start))
+    return r
+
+def benchmark(build, *args):
+    '''
+    timings = benchmark(build, *args)
+
+    Builds a graph with ``build(*args)`` and times the graph operations on it.
+
+    Returns
+    -------
+    timings : list of (str, float)
+        Each operation with its run time in seconds
+    '''
+    from ..jug import _check_or_sleep_until
+
+    del task.alltasks[:]
+    store = dict_store()
+    Task.store = store
+    timings = []
+    try:
+        tasks = _timed(timings, 'build tasks', build, *args)
+        graph = _timed(timings, 'TaskGraph', TaskGraph, task.alltasks)
+        hashes = _timed(timings, 'hash', graph.hashes)
+        assert _timed(timings, 'check (unfinished)', _check_or_sleep_until, store, False) == 1
+
+        for h in hashes:
+            store.dump(None, h)
+        assert _timed(timings, 'check (finished)', _check_or_sleep_until, store, False) == 0
+
+        _timed(timings, 'topological_sort', topological_sort, list(reversed(tasks)))
+        _timed(timings, 'recursive_dependencies', lambda: sum(1 for _ in recursive_dependencies(tasks[-1])))
+        _timed(timings, 'unload_recursive', tasks[-1].unload_recursive)
+    finally:
+        del task.alltasks[:]
+        Task.store = None
+    return timings
+
+def main(argv=None):
+    import optparse
+    parser = optparse.OptionParser(usage='python -m jug.benchmarks.graph [OPTIONS]')
+    parser.add_option('--chain-length', action='store', type='int', dest='chain_length', default=100000)
+    parser.add_option('--levels', action='store', type='int', dest='levels', default=20)
+    parser.add_option('--width', action='store', type='int', dest='width', default=2)
+    options, _ = parser.parse_args(argv)
+
+    for title, build, args in [
+                ('chain (%s tasks)' % options.chain_length, build_chain, (options.chain_length,)),
+                ('diamond lattice (%s levels x %s)' % (options.levels, options.width), build_lattice, (options.levels, options.width)),
+                ]:
+        print(title)
+        print('-' * 40)
+        for label, elapsed in benchmark(build, *args):
+            print('%-28s %10.3fs' % (label, elapsed))
+        print()
+
+if __name__ == '__main__':
+    main()
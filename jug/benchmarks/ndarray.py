@@ -0,0 +1,108 @@
+'''
+Array encoding benchmark.
+
+Times saving and loading numpy arrays with the npy encoder (which jug uses for
+arrays) and with the pickle encoder (which jug used to fall back on), both to
+memory and to a file.
+
+Usage::
+
+    python -m jug.benchmarks.ndarray [--size=MB] [--repeat=N]
+'''
+from __future__ import print_function
+
+import os
+import tempfile
+from time import time
+
+import numpy as np
+from six import BytesIO
+
+from ..backends.encoders.numpy_encoder import NDArrayEncoder
+from ..backends.encoders.pickle_encoder import PickleEncoder
+
+def build_arrays(nbytes):
+    '''
+    arrays = build_arrays(nbytes)
+
+    Returns a list of (label, array) pairs of (approximately) ``nbytes`` each
+    '''
+    n = nbytes // 8
+    structured = np.zeros(nbytes // 16, dtype=[('index', np.int32), ('weight', np.float32), ('value', np.float64)])
+    structured['index'] = np.arange(len(structured))
+    return [
+        ('float64 (C order)', np.random.random(n).reshape((-1, 1024))),
+        ('float64 (Fortran order)', np.asfortranarray(np.random.random(n).reshape((-1, 1024)))),
+        ('int8', (np.arange(nbytes) % 128).astype(np.int8)),
+        ('structured', structured),
+        ]
+
+def _best(f, repeat, *args):
+    best = None
+    for _ in range(repeat):
+        start = time()
+        f(*args)
+        elapsed = time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def benchmark(arr, encoder, repeat=3):
+    '''
+    timings = benchmark(arr, encoder, repeat=3)
+
+    Times ``encoder`` on ``arr`` (best of ``repeat`` runs).
+
+    Returns
+    -------
+    timings : dict
+        Seconds taken by each of 'dump (memory)', 'load (memory)', 'dump
+        (file)' and 'load (file)'
+    '''
+    from io import BufferedReader
+    timings = {}
+    output = BytesIO()
+    def dump_memory():
+        output.seek(0)
+        output.truncate()
+        encoder.dump(arr, output)
+    timings['dump (memory)'] = _best(dump_memory, repeat)
+    def load_memory(data):
+        encoder.load(BufferedReader(BytesIO(data)))
+    timings['load (memory)'] = _best(load_memory, repeat, output.getvalue())
+
+    fd, fname = tempfile.mkstemp('.jugbench')
+    os.close(fd)
+    try:
+        def dump_file():
+            with open(fname, 'wb') as output:
+                encoder.dump(arr, output)
+        timings['dump (file)'] = _best(dump_file, repeat)
+        def load_file():
+            with open(fname, 'rb') as input:
+                encoder.load(input)
+        timings['load (file)'] = _best(load_file, repeat)
+    finally:
+        os.unlink(fname)
+    return timings
+
+def main(argv=None):
+    import optparse
+    parser = optparse.OptionParser(usage='python -m jug.benchmarks.ndarray [OPTIONS]')
+    parser.add_option('--size', action='store', type='int', dest='size', default=256, help='Size of each array (in MB)')
+    parser.add_option('--repeat', action='store', type='int', dest='repeat', default=3)
+    options, _ = parser.parse_args(argv)
+
+    operations = ['dump (memory)', 'load (memory)', 'dump (file)', 'load (file)']
+    for label, arr in build_arrays(options.size << 20):
+        print('%s, %.1f MB' % (label, arr.nbytes / 2.**20))
+        print('-' * 60)
+        print('%-16s %10s %10s %10s' % ('', 'npy', 'pickle', 'speedup'))
+        npy = benchmark(arr, NDArrayEncoder(), options.repeat)
+        pkl = benchmark(arr, PickleEncoder(), options.repeat)
+        for op in operations:
+            print('%-16s %9.3fs %9.3fs %9.1fx' % (op, npy[op], pkl[op], pkl[op] / max(npy[op], 1e-9)))
+        print()
+
+if __name__ == '__main__':
+    main()
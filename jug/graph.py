@@ -0,0 +1,325 @@
+'''
+graph: integer-indexed task dependency graph.
+
+A ``TaskGraph`` is built in a single pass over a list of tasks and stores the
+dependency structure in compressed sparse row (CSR) form, in both directions.
+Commands which need to reason about the whole graph (``status``,
+``invalidate``, ``check``, ``execute``) query this structure instead of walking
+``Task.dependencies()`` repeatedly.
+
+If numpy is available, the adjacency arrays are numpy arrays and traversals are
+vectorised one frontier at a time. Otherwise, plain Python lists are used.
+'''
+
+from .task import Task
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+__all__ = [
+    'TaskGraph',
+    ]
+
+class TaskGraph(object):
+    '''
+    graph = TaskGraph(tasks)
+
+    Dependency graph over ``tasks``.
+
+    Nodes are integers: node ``i`` is ``graph.tasks[i]``. The first nodes are
+    the (unique) input tasks, in their original order. Tasks which are only
+    reached as dependencies are appended at the end. Non-Task dependencies
+    (e.g., Tasklets) are looked through so that the edge goes to the
+    underlying Task.
+
+    Attributes
+    ----------
+    tasks : list
+        Tasks, indexed by node
+    ninputs : int
+        Number of nodes which correspond to input tasks
+    dep_ptr, dep_idx : arrays
+        CSR forward adjacency: dependencies of node ``i`` are
+        ``dep_idx[dep_ptr[i]:dep_ptr[i+1]]``
+    rdep_ptr, rdep_idx : arrays
+        CSR reverse adjacency: nodes which depend on node ``i``
+    '''
+    def __init__(self, tasks):
+        self.tasks = []
+        self.index = {}
+        for t in tasks:
+            self._add_node(t)
+        self.ninputs = len(self.tasks)
+
+        ptr = [0]
+        idx = []
+        i = 0
+        while i < len(self.tasks):
+            seen = set()
+            queue = list(self.tasks[i].dependencies())
+            while queue:
+                dep = queue.pop()
+                if isinstance(dep, Task):
+                    j = self.index.get(id(dep))
+                    if j is None:
+                        j = self._add_node(dep)
+                    if j not in seen:
+                        seen.add(j)
+                        idx.append(j)
+                else:
+                    queue.extend(dep.dependencies())
+            ptr.append(len(idx))
+            i += 1
+
+        self.dep_ptr, self.dep_idx = _as_array(ptr), _as_array(idx)
+        self.rdep_ptr, self.rdep_idx = _transpose(self.dep_ptr, self.dep_idx, len(self.tasks))
+
+    def _add_node(self, t):
+        i = self.index.get(id(t))
+        if i is None:
+            i = len(self.tasks)
+            self.index[id(t)] = i
+            self.tasks.append(t)
+        return i
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def node(self, t):
+        '''
+        i = graph.node(t)
+
+        Returns the node index of task ``t`` (raises KeyError if not present)
+        '''
+        return self.index[id(t)]
+
+    def dependencies(self, i):
+        '''
+        for j in graph.dependencies(i):
+            ...
+
+        First-level dependencies of node ``i``
+        '''
+        return self.dep_idx[self.dep_ptr[i]:self.dep_ptr[i+1]]
+
+    def dependents(self, i):
+        '''
+        for j in graph.dependents(i):
+            ...
+
+        Nodes which directly depend on node ``i``
+        '''
+        return self.rdep_idx[self.rdep_ptr[i]:self.rdep_ptr[i+1]]
+
+    def hashes(self):
+        '''
+        hs = graph.hashes()
+
+        Returns the hash of every node (in node order).
+
+        Hashes are computed in topological order so that computing the hash of
+        a task never needs to recurse into the hashes of its dependencies.
+        '''
+        hs = [None] * len(self.tasks)
+        for i in self.topological_order():
+            hs[i] = self.tasks[i].hash()
+        return hs
+
+    def sinks(self):
+        '''
+        nodes = graph.sinks()
+
+        Nodes on which no other node depends
+        '''
+        counts = _diff(self.rdep_ptr)
+        if np is not None:
+            return np.flatnonzero(counts == 0)
+        return [i for i,c in enumerate(counts) if c == 0]
+
+    def reachable(self, sources, reverse=False):
+        '''
+        mask = graph.reachable(sources, reverse=False)
+
+        Computes which nodes can be reached from ``sources``.
+
+        Parameters
+        ----------
+        sources : sequence of int
+            Starting nodes (these are always part of the result)
+        reverse : bool, optional
+            If False (default), follow dependencies (i.e., compute everything
+            that ``sources`` need). If True, follow dependents (i.e., compute
+            everything that is affected by ``sources``).
+
+        Returns
+        -------
+        mask : sequence of bool
+            ``mask[i]`` is True iff node ``i`` is reachable
+        '''
+        if reverse:
+            ptr, idx = self.rdep_ptr, self.rdep_idx
+        else:
+            ptr, idx = self.dep_ptr, self.dep_idx
+        n = len(self.tasks)
+        lists = _Lists(ptr, idx)
+        if np is not None:
+            mask = np.zeros(n, bool)
+            frontier = np.unique(np.asarray(sources, dtype=np.intp))
+        else:
+            mask = [False] * n
+            frontier = sorted(set(sources))
+        for i in frontier:
+            mask[i] = True
+        while len(frontier):
+            if _vectorise(frontier):
+                frontier = np.asarray(frontier, dtype=np.intp)
+                nexts = _gather(ptr, idx, frontier)
+                frontier = np.unique(nexts[~mask[nexts]])
+                mask[frontier] = True
+            else:
+                lptr, lidx = lists.get()
+                nexts = []
+                for i in frontier:
+                    for j in lidx[lptr[i]:lptr[i+1]]:
+                        if not mask[j]:
+                            mask[j] = True
+                            nexts.append(j)
+                frontier = nexts
+        return mask
+
+    def levels(self):
+        '''
+        level = graph.levels()
+
+        Computes the level of each node: tasks without dependencies are at
+        level 0; every other task is one level above its highest dependency.
+
+        Returns
+        -------
+        level : sequence of int
+            Level of each node (-1 for nodes that are part of a cycle)
+        '''
+        n = len(self.tasks)
+        ptr, idx = self.rdep_ptr, self.rdep_idx
+        lists = _Lists(ptr, idx)
+        missing = _diff(self.dep_ptr)
+        if np is not None:
+            level = np.empty(n, np.intp)
+            level.fill(-1)
+            frontier = np.flatnonzero(missing == 0)
+        else:
+            level = [-1] * n
+            frontier = [i for i in range(n) if missing[i] == 0]
+        current = 0
+        while len(frontier):
+            if _vectorise(frontier):
+                frontier = np.asarray(frontier, dtype=np.intp)
+                level[frontier] = current
+                nexts, counts = np.unique(_gather(ptr, idx, frontier), return_counts=True)
+                missing[nexts] -= counts
+                frontier = nexts[missing[nexts] == 0]
+            else:
+                lptr, lidx = lists.get()
+                nexts = []
+                for i in frontier:
+                    level[i] = current
+                    for j in lidx[lptr[i]:lptr[i+1]]:
+                        missing[j] -= 1
+                        if missing[j] == 0:
+                            nexts.append(j)
+                frontier = nexts
+            current += 1
+        return level
+
+    def topological_order(self):
+        '''
+        order = graph.topological_order()
+
+        Returns all nodes sorted so that every node comes after all of its
+        dependencies. Ties are broken by node index.
+        '''
+        level = self.levels()
+        if np is not None:
+            return np.argsort(level, kind='stable')
+        return sorted(range(len(level)), key=level.__getitem__)
+
+
+# Below this frontier size, the fixed cost of each numpy call is larger than
+# the cost of stepping through the frontier in Python (this matters for deep,
+# narrow graphs such as long chains of tasks).
+_MIN_VECTORISE = 64
+
+def _vectorise(frontier):
+    return np is not None and len(frontier) >= _MIN_VECTORISE
+
+class _Lists(object):
+    '''
+    Lazily computed Python list copies of a CSR structure, for the non
+    vectorised steps of the traversals.
+    '''
+    def __init__(self, ptr, idx):
+        self.ptr = ptr
+        self.idx = idx
+        self.lists = None
+
+    def get(self):
+        if self.lists is None:
+            if np is not None:
+                self.lists = (self.ptr.tolist(), self.idx.tolist())
+            else:
+                self.lists = (self.ptr, self.idx)
+        return self.lists
+
+def _as_array(values):
+    if np is not None:
+        return np.array(values, dtype=np.intp)
+    return values
+
+def _diff(ptr):
+    if np is not None:
+        return np.diff(ptr)
+    return [ptr[i+1] - ptr[i] for i in range(len(ptr) - 1)]
+
+def _transpose(ptr, idx, n):
+    '''
+    rptr, ridx = _transpose(ptr, idx, n)
+
+    Computes the CSR representation of the reversed graph
+    '''
+    if np is not None:
+        sources = np.repeat(np.arange(n, dtype=np.intp), np.diff(ptr))
+        order = np.argsort(idx, kind='stable')
+        rptr = np.zeros(n + 1, np.intp)
+        np.cumsum(np.bincount(idx, minlength=n), out=rptr[1:])
+        return rptr, sources[order]
+
+    counts = [0] * n
+    for j in idx:
+        counts[j] += 1
+    rptr = [0] * (n + 1)
+    for i in range(n):
+        rptr[i+1] = rptr[i] + counts[i]
+    ridx = [0] * len(idx)
+    fill = rptr[:-1]
+    for i in range(n):
+        for j in idx[ptr[i]:ptr[i+1]]:
+            ridx[fill[j]] = i
+            fill[j] += 1
+    return rptr, ridx
+
+def _gather(ptr, idx, nodes):
+    '''
+    values = _gather(ptr, idx, nodes)
+
+    Concatenates ``idx[ptr[i]:ptr[i+1]]`` for every ``i`` in ``nodes``
+    (numpy only)
+    '''
+    starts = ptr[nodes]
+    counts = ptr[nodes + 1] - starts
+    total = counts.sum()
+    if total == 0:
+        return np.zeros(0, np.intp)
+    offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+    return idx[offsets + np.arange(total)]
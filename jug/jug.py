@@ -22,7 +22,7 @@
 #  THE SOFTWARE.
 
 
-from collections import defaultdict, Counter
+from collections import defaultdict, Counter, OrderedDict, deque
 import sys
 import os
 import os.path
@@ -31,8 +31,10 @@ import logging
 logger = logging.getLogger(__name__)
 
 from . import backends
-from .task import Task, Tasklet, walk_dependencies
+from .task import Task, Tasklet
 from . import task
+from .graph import TaskGraph
+from .metrics import ExecutorMetrics
 from .io import print_task_summary_table, render_task_summary_table
 from .subcommands.status import status
 from .subcommands.webstatus import webstatus
@@ -82,62 +84,72 @@ def invalidate(store, options):
 
     logger.info("Created invalidate_re: %r", invalidate_re.pattern)
 
-    invalid_tasks = {}
-    tasks = task.alltasks
-
-    # Scan and mark tasks as invalidated
-    for t in tasks:
-        if re.search( invalidate_re, t.name ):
-            invalid_tasks[t.hash()] = t
+    graph = TaskGraph(task.alltasks)
+    matched = [i for i,t in enumerate(graph.tasks) if re.search(invalidate_re, t.name)]
 
-    if not invalid_tasks:
+    if not matched:
         options.print_out('No tasks matched invalid pattern.')
         return
 
-    valid_tasks = {}
-    def scan_task_dependencies(t):
-        for _, deps in walk_dependencies(t):
-            for i in reversed(range(len(deps))):
-                if deps[i].hash() in invalid_tasks:
-                    invalid_tasks[t.hash()] = t
-                    return
-                elif deps[i].hash() in valid_tasks:
-                    deps.pop(i)
-
-        valid_tasks[t.hash()] = True
-
-    for t in tasks:
-        scan_task_dependencies(t)
+    # Everything downstream of a matched task is invalid too
+    invalid = graph.reachable(matched, reverse=True)
+    hashes = graph.hashes()
+    invalid_tasks = OrderedDict()
+    for i,t in enumerate(graph.tasks):
+        if invalid[i]:
+            invalid_tasks[hashes[i]] = t
 
     task_counts = defaultdict(int)
-    for t in invalid_tasks.values():
+    invalid_hashes = list(invalid_tasks.keys())
+    total = len(invalid_hashes)
+    for start in range(0, total, _INVALIDATE_BATCH_SIZE):
+        batch = invalid_hashes[start:start + _INVALIDATE_BATCH_SIZE]
         if not options.dry_run:
-            if store.remove(t.hash()):
-                task_counts[t.name] += 1
+            present = store.remove_many(batch)
         else:
-            if store.can_load(t.hash()):
-                task_counts[t.name] += 1
+            present = store.can_load_many(batch)
+        for h,p in zip(batch, present):
+            if p:
+                task_counts[invalid_tasks[h].name] += 1
+        if total > _INVALIDATE_BATCH_SIZE:
+            _report_progress('Invalidating', start + len(batch), total)
 
     if sum(task_counts.values()) == 0:
         options.print_out('Tasks matched invalid pattern, but no results present.')
     else:
         print_task_summary_table(options, [("Invalidated", task_counts)])
 
+# Number of results which are removed (or checked) in a single store call
+_INVALIDATE_BATCH_SIZE = 1024
+
+def _report_progress(label, done, total):
+    logger.info("%s: %s/%s", label, done, total)
+    if sys.stderr.isatty():
+        sys.stderr.write('\r%s: %s/%s tasks' % (label, done, total))
+        if done == total:
+            sys.stderr.write('\n')
+        sys.stderr.flush()
+
 def _sigterm(_,__):
     sys.exit(1)
 
 class Executor(object):
-    def __init__(self, store, tasks, execute_wait_cycle_time_secs, aggressive_unload, debug_mode, pdb, execute_keep_going):
+    def __init__(self, store, tasks, execute_wait_cycle_time_secs, aggressive_unload, debug_mode, pdb, execute_keep_going, metrics=None):
         logger.info("Beginning execution: <%s tasks>", len(tasks))
 
         self.store = store
         self.tasks = tasks
+        self.graph = TaskGraph(tasks)
+        self.finished = [False] * len(self.graph)
+        self.unfinished = set()
+        self.hashes = None
 
         self.execute_wait_cycle_time_secs = execute_wait_cycle_time_secs
         self.aggressive_unload            = aggressive_unload
         self.debug_mode                   = debug_mode
         self.pdb                          = pdb
         self.execute_keep_going           = execute_keep_going
+        self.metrics = (metrics if metrics is not None else ExecutorMetrics())
 
     def execute_loop(self, execute_nr_wait_cycles):
         from time import sleep
@@ -154,12 +166,13 @@ class Executor(object):
             tasks_locked   = []
             tasks_executed = []
 
+            self.probe()
             for t in tasks_current:
-                if t.can_load():
+                if self.is_finished(self.graph.node(t)):
                     tasks_finished.append(t)
                 elif t.is_locked():
                     tasks_locked.append(t)
-                elif t.can_run():
+                elif self.can_run(self.graph.node(t)):
                     tasks_ready.append(t)
                 else:
                     tasks_waiting.append(t)
@@ -173,16 +186,17 @@ class Executor(object):
                     ])
             logger.info("Pre-execute task status:\n" + "\n".join(task_summary_table))
 
-            for t in tasks_ready:
-                # Check if task is loadable. If so discard from task list.
+            # Tasks which become runnable during this cycle are moved from
+            # ``waiting`` into the ``ready`` queue as soon as their last
+            # dependency is executed.
+            waiting = OrderedDict((self.graph.node(t), t) for t in tasks_waiting)
+            tasks_ready = deque(tasks_ready)
+            while tasks_ready:
+                t = tasks_ready.popleft()
                 # Lock task for execution.
-                # If loadable due to execution during lock operation discard from task list.
+                # If loadable due to execution by another process discard from task list.
                 # If lock failed push task back onto tasks queue.
                 # If locked then execute.
-                if t.can_load():
-                    tasks_finished.append(t)
-                    continue
-
                 locked = False
                 try:
                     locked = t.lock()
@@ -192,6 +206,7 @@ class Executor(object):
                         continue
                     elif not locked:
                         tasks_locked.append(t)
+                        self.metrics.lock_failed()
                     else:
                         executed = self.execute_task(t)
                         if executed:
@@ -199,18 +214,24 @@ class Executor(object):
                             # during task execution.
                             # In which case task should be dropped from the task list.
                             tasks_executed.append(t)
+                            i = self.graph.node(t)
+                            self.finished[i] = True
+                            for j in self.graph.dependents(i):
+                                if j in waiting and self.can_run(j):
+                                    tasks_ready.append(waiting.pop(j))
                 finally:
                     if locked:
                         t.unlock()
 
             tasks_total_executed.extend(tasks_executed)
-            tasks_current = tasks_waiting + tasks_locked
+            tasks_current = list(waiting.values()) + tasks_locked
 
             if tasks_current and not tasks_executed:
                 if wait_cycles > 0:
                     wait_cycles -= 1
                     logger.info("Waiting %s seconds for open task. wait_cycle: %s/%s", self.execute_wait_cycle_time_secs, wait_cycles, execute_nr_wait_cycles)
                     sleep(int(self.execute_wait_cycle_time_secs))
+                    self.metrics.idle(int(self.execute_wait_cycle_time_secs))
                 else:
                     logger.info("Finished wait cycles without open task.")
                     return tasks_executed
@@ -218,16 +239,66 @@ class Executor(object):
         logger.info("No tasks available to run.")
         return tasks_total_executed
 
+    def probe(self):
+        '''
+        executor.probe()
+
+        Checks which of the nodes that are not known to be finished have their
+        results available, using a single ``can_load_many`` call. Until the
+        next call, ``is_finished`` does not query the store for the nodes
+        which were found to be unfinished.
+        '''
+        if self.hashes is None:
+            self.hashes = self.graph.hashes()
+        nodes = [i for i in range(len(self.graph)) if not self.finished[i]]
+        found = self.store.can_load_many([self.hashes[i] for i in nodes])
+        self.unfinished = set()
+        for i,f in zip(nodes, found):
+            if f:
+                self.finished[i] = True
+            else:
+                self.unfinished.add(i)
+
+    def is_finished(self, i):
+        '''
+        finished = executor.is_finished(i)
+
+        Whether the result of node ``i`` is available in the store. Positive
+        answers are remembered so that the store is not queried again for the
+        same task.
+        '''
+        if not self.finished[i] and i not in self.unfinished:
+            self.finished[i] = self.graph.tasks[i].can_load()
+        return self.finished[i]
+
+    def can_run(self, i):
+        '''
+        can_run = executor.can_run(i)
+
+        Whether all the dependencies of node ``i`` are available.
+        '''
+        for dep in self.graph.dependencies(i):
+            if not self.graph.tasks[dep].is_loaded() and not self.is_finished(dep):
+                return False
+        return True
+
     def execute_task(self, task):
+        from time import time
+        start = time()
+        self.metrics.task_started(task.display_name)
         try:
             logger.info("Begin task: %s", task.display_name)
-            task.run(debug_mode = self.debug_mode)
+            # The caller has just checked that the result is not available
+            # (while holding the lock), so there is no need to check again.
+            task.run(force=True, debug_mode = self.debug_mode)
             logger.info("Ended task: %s", task.display_name)
+            self.metrics.task_ended(task.display_name, time() - start, True)
             if self.aggressive_unload:
                 task.unload_recursive()
             return True
 
         except (Exception, KeyboardInterrupt) as e:
+            self.metrics.task_ended(task.display_name, time() - start, False)
             if self.pdb:
                 exc_info = sys.exc_info()
                 try:
@@ -278,41 +349,51 @@ def execute(options):
     tasks_executed = defaultdict(int)
     store = None
 
+    metrics = ExecutorMetrics(textfile=options.metrics_textfile)
+    if options.metrics_port is not None:
+        metrics.serve(int(options.metrics_port))
+
     from time import sleep
     wait_cycles = int(options.execute_nr_wait_cycles)
 
-    while wait_cycles > 0:
-        del tasks[:]
-        store, jugspace = init(options.jugfile, options.jugdir, store=store)
-        if options.debug:
-            for t in tasks:
-                # Trigger hash computation:
-                t.hash()
-
-        has_barrier = jugspace.get('__jug__hasbarrier__', False)
-        executor = Executor(
-                store,
-                tasks,
-                options.execute_wait_cycle_time_secs,
-                options.aggressive_unload,
-                options.debug,
-                options.pdb,
-                options.execute_keep_going)
-
-        tasks_executed_in_cycle = executor.execute_loop(0 if has_barrier else int(options.execute_nr_wait_cycles))
-
-        for t in tasks_executed_in_cycle:
-            tasks_executed[t.display_name] += 1
-
-        if not has_barrier:
-            break
-
-        if not tasks_executed_in_cycle:
-            wait_cycles -= 1
-            logger.info("Waiting %s seconds to recycle barrier.", options.execute_wait_cycle_time_secs)
-            sleep(int(options.execute_wait_cycle_time_secs))
-    else:
-        logger.info('Execute ending, no tasks can be run.')
+    try:
+        while wait_cycles > 0:
+            del tasks[:]
+            store, jugspace = init(options.jugfile, options.jugdir, store=store)
+            if options.debug:
+                for t in tasks:
+                    # Trigger hash computation:
+                    t.hash()
+
+            has_barrier = jugspace.get('__jug__hasbarrier__', False)
+            executor = Executor(
+                    store,
+                    tasks,
+                    options.execute_wait_cycle_time_secs,
+                    options.aggressive_unload,
+                    options.debug,
+                    options.pdb,
+                    options.execute_keep_going,
+                    metrics)
+
+            tasks_executed_in_cycle = executor.execute_loop(0 if has_barrier else int(options.execute_nr_wait_cycles))
+
+            for t in tasks_executed_in_cycle:
+                tasks_executed[t.display_name] += 1
+
+            if not has_barrier:
+                break
+
+            if not tasks_executed_in_cycle:
+                wait_cycles -= 1
+                logger.info("Waiting %s seconds to recycle barrier.", options.execute_wait_cycle_time_secs)
+                sleep(int(options.execute_wait_cycle_time_secs))
+                metrics.idle(int(options.execute_wait_cycle_time_secs))
+        else:
+            logger.info('Execute ending, no tasks can be run.')
+    finally:
+        # Includes any update which was held back (see ``changed``)
+        metrics.changed(force=True)
 
     print_task_summary_table(options, [("Executed", tasks_executed)])
 
@@ -362,24 +443,17 @@ def sleep_until(store, options):
     sys.exit(_check_or_sleep_until(store, True))
 
 def _check_or_sleep_until(store, sleep_until):
-    from .task import recursive_dependencies
-    tasks = task.alltasks
-    active = set(tasks)
-    for t in reversed(tasks):
-        if t not in active:
-            continue
+    # Every task is either a sink of the graph or a (recursive) dependency of
+    # one. Therefore, it is enough to check that the sinks can be loaded.
+    graph = TaskGraph(task.alltasks)
+    for i in graph.sinks():
+        t = graph.tasks[i]
         while not t.can_load(store):
             if sleep_until:
                 from time import sleep
                 sleep(12)
             else:
                 return 1
-        else:
-            for dep in recursive_dependencies(t):
-                try:
-                    active.remove(dep)
-                except KeyError:
-                    pass
     return 0
 
 def init(jugfile="jugfile", jugdir=None, on_error='exit', store=None):
@@ -11,8 +11,10 @@ mapreduce: Build tasks that follow a map-reduce pattern.
 from .jug import Task
 from .utils import identity
 from .hash import hash_one
+from .barrier import bvalue
 
 from itertools import chain
+from time import time
 import operator
 
 __all__ = [
@@ -57,10 +59,47 @@ def _jug_map(mapper, es):
 def _jug_map_curry(mapper, es):
     return [mapper(*e) for e in es]
 
+# With map_step='auto', the mapper is timed on the first few elements (in a
+# task of its own, so that the measurement is saved and the same blocks are
+# built in every run) and the step is chosen so that each task takes about
+# `target_seconds` (by default, this long). However, at least this many
+# tasks are built (if there are enough elements), so that a fast mapper does
+# not end up in a few large tasks which cannot run in parallel
+AUTO_TARGET_SECONDS = 60.
+AUTO_MIN_TASKS = 16
+_PILOT_SIZE = 4
+
+def _jug_map_pilot(mapper, sample, curry):
+    start = time()
+    if curry:
+        _jug_map_curry(mapper, sample)
+    else:
+        _jug_map(mapper, sample)
+    return (time() - start) / len(sample)
+
+def _auto_step(mapper, sequence, target_seconds, curry=False):
+    '''
+    step = _auto_step(mapper, sequence, target_seconds, curry=False)
 
-def mapreduce(reducer, mapper, inputs, map_step=4, reduce_step=8):
+    Returns the number of elements of ``sequence`` to map per task so that
+    each task takes about ``target_seconds`` (but at least
+    ``AUTO_MIN_TASKS`` tasks are built). The first time, this stops the
+    jugfile (as ``bvalue`` does) until the mapper has been timed.
+    '''
+    if target_seconds is None:
+        target_seconds = AUTO_TARGET_SECONDS
+    n = len(sequence)
+    if n == 0:
+        return 1
+    pilot = Task(_jug_map_pilot, _get_function(mapper), sequence[:_PILOT_SIZE], curry)
+    per_element = bvalue(pilot)
+    largest = (n + AUTO_MIN_TASKS - 1) // AUTO_MIN_TASKS
+    return int(max(1, min(largest, round(target_seconds / max(per_element, 1e-9)))))
+
+
+def mapreduce(reducer, mapper, inputs, map_step=4, reduce_step=8, target_seconds=None):
     '''
-    task = mapreduce(reducer, mapper, inputs, map_step=4, reduce_step=8)
+    task = mapreduce(reducer, mapper, inputs, map_step=4, reduce_step=8, target_seconds=None)
 
     Create a task that does roughly the following::
 
@@ -78,17 +117,23 @@ def mapreduce(reducer, mapper, inputs, map_step=4, reduce_step=8):
     mapper : function from X -> Y
     inputs : list of X
 
-    map_step : integer, optional
+    map_step : integer or 'auto', optional
             Number of mapping operations to do in one go.
             This is what defines an inner task. (default: 4)
+            See ``map`` for 'auto'.
     reduce_step : integer, optional
             Number of reduce operations to do in one go.
             (default: 8)
+    target_seconds : float, optional
+            With ``map_step='auto'``, how long each mapping task should take
+            (default: ``AUTO_TARGET_SECONDS``)
 
     Returns
     -------
     task : jug.Task object
     '''
+    if map_step == 'auto':
+        map_step = _auto_step(mapper, inputs, target_seconds)
     reducers = [Task(_jug_map_reduce, reducer, mapper, input_i) for input_i in _break_up(inputs, map_step)]
     while len(reducers) > 1:
         reducers = [Task(_jug_reduce, reducer, reduce_i) for reduce_i in _break_up(reducers, reduce_step)]
@@ -177,9 +222,9 @@ class block_access(object):
         from .task import value
         return [value(self[i]) for i in range(len(self))]
 
-def map(mapper, sequence, map_step=4):
+def map(mapper, sequence, map_step=4, target_seconds=None):
     '''
-    sequence' = map(mapper, sequence, map_step=4)
+    sequence' = map(mapper, sequence, map_step=4, target_seconds=None)
 
     Roughly equivalent to::
 
@@ -192,9 +237,15 @@ def map(mapper, sequence, map_step=4):
     mapper : function
         function from A -> B
     sequence : list of A
-    map_step : integer, optional
+    map_step : integer or 'auto', optional
         nr of elements to process per task. This should be set so that each
-        task takes the right amount of time.
+        task takes the right amount of time. If 'auto', the mapper is timed on
+        the first few elements of `sequence` (in a separate task, whose result
+        is saved, so that the same tasks are built in later runs) and the
+        step is chosen so that each task takes about `target_seconds` (but
+        the sequence is split into at least ``AUTO_MIN_TASKS`` tasks).
+    target_seconds : float, optional
+        Only used if `map_step` is 'auto' (default: ``AUTO_TARGET_SECONDS``)
 
     Returns
     -------
@@ -207,6 +258,8 @@ def map(mapper, sequence, map_step=4):
     currymap: function
         Curried version of this function
     '''
+    if map_step == 'auto':
+        map_step = _auto_step(mapper, sequence, target_seconds)
     if map_step == 1:
         return [Task(mapper, s) for s in sequence]
     blocks = []
@@ -218,9 +271,9 @@ def map(mapper, sequence, map_step=4):
         n += len(ss)
     return block_access(blocks, map_step, n)
 
-def currymap(mapper, sequence, map_step=4):
+def currymap(mapper, sequence, map_step=4, target_seconds=None):
     '''
-    sequence' = currymap(mapper, sequence, map_step=4)
+    sequence' = currymap(mapper, sequence, map_step=4, target_seconds=None)
 
     Roughly equivalent to::
 
@@ -233,9 +286,11 @@ def currymap(mapper, sequence, map_step=4):
     mapper : function
         function from A1 -> A2 ... -> An -> B
     sequence : list of (A1,A2,...,An)
-    map_step : integer, optional
+    map_step : integer or 'auto', optional
         nr of elements to process per task. This should be set so that each
-        task takes the right amount of time.
+        task takes the right amount of time (see ``map`` for 'auto').
+    target_seconds : float, optional
+        Only used if `map_step` is 'auto' (default: ``AUTO_TARGET_SECONDS``)
 
     Returns
     -------
@@ -248,6 +303,8 @@ def currymap(mapper, sequence, map_step=4):
     map: function
         Uncurried version of this function
     '''
+    if map_step == 'auto':
+        map_step = _auto_step(mapper, sequence, target_seconds, curry=True)
     if map_step == 1:
         return [Task(mapper, *s) for s in sequence]
     result = []
@@ -0,0 +1,194 @@
+'''
+metrics: counters for ``jug execute`` in the Prometheus text format.
+
+An ``ExecutorMetrics`` object is updated by the ``Executor``. It can be
+exposed over HTTP (``--metrics-port``), for Prometheus to scrape, or written to
+a file (``--metrics-textfile``), for the node-exporter textfile collector.
+'''
+
+from collections import defaultdict
+from time import time
+import os
+import socket
+import threading
+
+import logging
+logger = logging.getLogger(__name__)
+
+from .backends.encode import io_counters
+
+__all__ = [
+    'ExecutorMetrics',
+    ]
+
+# Minimum time (in seconds) between two writes of the metrics textfile
+_TEXTFILE_MIN_INTERVAL = 1.
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class ExecutorMetrics(object):
+    '''
+    metrics = ExecutorMetrics(textfile=None)
+
+    Counters describing the work of an executor process.
+
+    Parameters
+    ----------
+    textfile : str, optional
+        If given, the metrics are (atomically) written to this file whenever
+        they change (at most once a second). The following substitutions are
+        performed on the name: ``%(pid)s`` and ``%(hostname)s``, so that several
+        processes can share the same setting.
+    '''
+    def __init__(self, textfile=None):
+        self.lock = threading.Lock()
+        self.start_time = time()
+        self.completed = defaultdict(int)
+        self.failed = defaultdict(int)
+        self.task_seconds = defaultdict(float)
+        self.in_flight = 0
+        self.lock_contention = 0
+        self.idle_seconds = 0.
+        self.encoded_start = io_counters.encoded
+        self.decoded_start = io_counters.decoded
+        if textfile is not None:
+            textfile = textfile % {
+                'pid': os.getpid(),
+                'hostname': socket.gethostname(),
+                }
+        self.textfile = textfile
+        self.last_write = None
+        # Writes of the textfile are serialised by their own lock (as
+        # ``render`` takes ``self.lock``). An update which comes too soon
+        # after the previous write is written later, by the ``pending`` timer
+        self.write_lock = threading.Lock()
+        self.pending = None
+
+    def task_started(self, name):
+        with self.lock:
+            self.in_flight += 1
+        self.changed()
+
+    def task_ended(self, name, elapsed, ok):
+        with self.lock:
+            self.in_flight -= 1
+            self.task_seconds[name] += elapsed
+            if ok:
+                self.completed[name] += 1
+            else:
+                self.failed[name] += 1
+        self.changed()
+
+    def lock_failed(self):
+        with self.lock:
+            self.lock_contention += 1
+        self.changed()
+
+    def idle(self, seconds):
+        with self.lock:
+            self.idle_seconds += seconds
+        self.changed()
+
+    def render(self):
+        '''
+        text = metrics.render()
+
+        Returns the metrics in the Prometheus text exposition format
+        '''
+        lines = []
+        def metric(name, kind, help, values):
+            lines.append('# HELP %s %s' % (name, help))
+            lines.append('# TYPE %s %s' % (name, kind))
+            if isinstance(values, dict):
+                for label in sorted(values):
+                    lines.append('%s{name="%s"} %s' % (name, _escape(label), values[label]))
+            else:
+                lines.append('%s %s' % (name, values))
+
+        with self.lock:
+            metric('jug_tasks_completed_total', 'counter', 'Tasks executed by this process.', dict(self.completed))
+            metric('jug_tasks_failed_total', 'counter', 'Tasks which raised an exception in this process.', dict(self.failed))
+            metric('jug_task_seconds_total', 'counter', 'Time spent executing tasks.', dict(self.task_seconds))
+            metric('jug_tasks_in_flight', 'gauge', 'Tasks currently being executed.', self.in_flight)
+            metric('jug_bytes_loaded_total', 'counter', 'Bytes of results loaded from the store.', io_counters.decoded - self.decoded_start)
+            metric('jug_bytes_dumped_total', 'counter', 'Bytes of results written to the store.', io_counters.encoded - self.encoded_start)
+            metric('jug_lock_contention_total', 'counter', 'Ready tasks which could not be run as another process held their lock.', self.lock_contention)
+            metric('jug_idle_seconds_total', 'counter', 'Time spent waiting for tasks to become available.', self.idle_seconds)
+            metric('jug_start_time_seconds', 'gauge', 'Start time of the executor (seconds since epoch).', self.start_time)
+        lines.append('')
+        return '\n'.join(lines)
+
+    def changed(self, force=False):
+        '''
+        metrics.changed(force=False)
+
+        Writes the textfile (if any). If it was written less than a second ago
+        (and ``force`` is False), it is written once that second has passed.
+        '''
+        if self.textfile is None:
+            return
+        with self.write_lock:
+            now = time()
+            if not force and self.last_write is not None and now - self.last_write < _TEXTFILE_MIN_INTERVAL:
+                if self.pending is None:
+                    self.pending = threading.Timer(self.last_write + _TEXTFILE_MIN_INTERVAL - now, self._write_pending)
+                    self.pending.daemon = True
+                    self.pending.start()
+                return
+            self._write()
+
+    def _write(self):
+        # Called with ``write_lock`` held
+        if self.pending is not None:
+            self.pending.cancel()
+            self.pending = None
+        self.last_write = time()
+        self.write_textfile(self.textfile)
+
+    def _write_pending(self):
+        with self.write_lock:
+            # Unless the update was written (and the timer cancelled) meanwhile
+            if self.pending is threading.current_thread():
+                self._write()
+
+    def write_textfile(self, filename):
+        '''
+        metrics.write_textfile(filename)
+
+        Writes the metrics to ``filename``. A temporary file is renamed over the
+        target so that a reader never sees a partial file.
+        '''
+        tmpname = '%s.%s.tmp' % (filename, os.getpid())
+        with open(tmpname, 'w') as output:
+            output.write(self.render())
+        os.rename(tmpname, filename)
+
+    def serve(self, port, host='127.0.0.1'):
+        '''
+        server = metrics.serve(port, host='127.0.0.1')
+
+        Serves the metrics over HTTP (on a background thread). If ``port`` is
+        0, a free port is chosen (see ``server.server_address``).
+        '''
+        from six.moves import BaseHTTPServer
+        metrics = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format, *args)
+
+        server = BaseHTTPServer.HTTPServer((host, port), Handler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        logger.info('Serving metrics on http://%s:%s/metrics', *server.server_address)
+        return server
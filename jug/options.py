@@ -70,6 +70,9 @@ default_options.argv = None
 default_options.print_out = six.print_
 default_options.status_mode = 'no-cached'
 default_options.status_cache_clear = False
+default_options.status_watch = False
+default_options.status_format = 'table'
+default_options.status_watch_interval = 30.
 default_options.pdb = False
 default_options.verbose = 'quiet'
 default_options.debug = False
@@ -79,6 +82,8 @@ default_options.cleanup_locks_only = False
 default_options.execute_wait_cycle_time_secs = 12
 default_options.execute_nr_wait_cycles = (30*60) // default_options.execute_wait_cycle_time_secs
 default_options.execute_keep_going = False
+default_options.metrics_port = None
+default_options.metrics_textfile = None
 
 default_options.status_cache_file = '.jugstatus.sqlite3'
 
@@ -134,6 +139,30 @@ execute OPTIONS
     true: you can use --debug mode without --pdb.
 --keep-going
     Keep going after errors
+--metrics-port=PORT
+    Serve Prometheus metrics (tasks completed & failed per name, tasks in
+    flight, bytes loaded & dumped, lock contention, idle time) on
+    http://127.0.0.1:PORT/metrics
+--metrics-textfile=FILE
+    Write the same metrics to FILE (for the node-exporter textfile
+    collector). "%(pid)s" and "%(hostname)s" are replaced in the file name.
+
+status OPTIONS
+--------------
+--cache
+    Use a cache for faster status. The cache is rebuilt whenever the jugfile
+    (or any module it imports) changes.
+--clear
+    Use with --cache. Removes the cache file.
+--watch
+    Keep refreshing the status (only unfinished tasks are checked again) and
+    show completion rate and estimated time left for each task name.
+--watch-interval=SECONDS
+    Time between refreshes in watch mode and in webstatus (default: 30).
+--format=FORMAT
+    Output format: 'table' (default), 'json', or 'ndjson' (one JSON record
+    per line). The JSON formats include the state of every task and are
+    written out as the status is computed.
 
 invalidate OPTIONS
 ------------------
@@ -208,6 +237,7 @@ def read_configuration_file(fp=None):
     attempt('main', 'jugfile', 'jugfile')
 
     attempt('status', 'cache', 'status_mode')
+    attempt('status', 'watch-interval', 'status_watch_interval', float)
 
     attempt('cleanup', 'locks-only', 'cleanup_locks_only', bool)
 
@@ -254,11 +284,26 @@ def parse(cmdlist=None, optionsfile=None):
     parser.add_option('--cache',
                     action='store_true',
                     dest='cache',
-                    help='Use a cache for faster status [does not update after jugfile changes, though]')
+                    help='Use a cache for faster status [rebuilt when the jugfile or the modules it imports change]')
     parser.add_option('--clear',
                     action='store_true',
                     dest='status_cache_clear',
                     help='Use with status --cache. Removes the cache file')
+    parser.add_option('--watch',
+                    action='store_true',
+                    dest='status_watch',
+                    help='Use with status. Keep refreshing the status')
+    parser.add_option('--watch-interval',
+                    action='store',
+                    type='float',
+                    dest='status_watch_interval',
+                    help='Use with status --watch or webstatus. Seconds between refreshes')
+    parser.add_option('--format',
+                    action='store',
+                    type='choice',
+                    choices=('table', 'json', 'ndjson'),
+                    dest='status_format',
+                    help='Use with status. Output format (table, json, or ndjson)')
     parser.add_option('--locks-only', action='store_true', dest='cleanup_locks_only')
     parser.add_option('--pdb',
                     action='store_true',
@@ -271,6 +316,8 @@ def parse(cmdlist=None, optionsfile=None):
     parser.add_option('--nr-wait-cycles', action='store', dest='execute_nr_wait_cycles')
     parser.add_option('--keep-going', action='store_true', dest='execute_keep_going', help='For execute: continue after errors')
     parser.add_option('--wait-cycle-time', action='store', dest='execute_wait_cycle_time_secs')
+    parser.add_option('--metrics-port', action='store', type='int', dest='metrics_port', help='For execute: serve Prometheus metrics on this port')
+    parser.add_option('--metrics-textfile', action='store', dest='metrics_textfile', help='For execute: write Prometheus metrics to this file')
     options,args = parser.parse_args(cmdlist)
     if not args:
         usage()
@@ -289,6 +336,9 @@ def parse(cmdlist=None, optionsfile=None):
     if options.dry_run and cmdline.cmd != 'invalidate':
         usage(error='dry_run is only useful for invalidate subcommand')
         return
+    if options.status_watch and cmdline.cmd != 'status':
+        usage(error='watch is only useful for status subcommand')
+        return
     if cmdline.cmd == 'invalidate' and not options.invalid_name:
         usage(error='invalidate subcommand requires ``invalid-name`` option')
         return
@@ -312,7 +362,12 @@ def parse(cmdlist=None, optionsfile=None):
     _maybe_set('execute_nr_wait_cycles')
     _maybe_set('execute_wait_cycle_time_secs')
     _maybe_set('execute_keep_going')
+    _maybe_set('metrics_port')
+    _maybe_set('metrics_textfile')
     _maybe_set('status_cache_clear')
+    _maybe_set('status_watch')
+    _maybe_set('status_watch_interval')
+    _maybe_set('status_format')
 
     cmdline.jugdir = resolve_jugdir( cmdline.jugfile, cmdline.jugdir )
 
@@ -23,18 +23,28 @@
 
 from collections import defaultdict
 from contextlib import contextmanager
+from os import path
+from time import sleep, time
+import hashlib
+import json
+import os
+import sys
 
 import jug
 import logging
 logger = logging.getLogger(__name__)
 
-from ..task import recursive_dependencies, walk_dependencies
 from .. import task
 from .. import backends
-from ..task import Task, Tasklet
+from ..graph import TaskGraph
 from ..backends import memoize_store
 from ..io import print_task_summary_table
 
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
 __all__ = [
     'status'
     ]
@@ -45,8 +55,13 @@ ready = 'ready'
 running = 'running'
 finished = 'finished'
 
-def create_sqlite3(connection, ht, deps, rdeps):
+all_states = (waiting, ready, running, finished)
+
+def create_sqlite3(connection, ht, deps, rdeps, sources=()):
     connection.executescript('''
+    DROP TABLE IF EXISTS ht;
+    DROP TABLE IF EXISTS dep;
+    DROP TABLE IF EXISTS source;
     CREATE TABLE ht (
             id INTEGER PRIMARY KEY,
             name CHAR(128),
@@ -55,6 +70,9 @@ def create_sqlite3(connection, ht, deps, rdeps):
     CREATE TABLE dep (
         source INT,
         target INT);
+    CREATE TABLE source (
+        path TEXT PRIMARY KEY,
+        digest CHAR(40));
     ''')
 
     connection.executemany('INSERT INTO ht VALUES(?,?,?,?)', ht)
@@ -64,6 +82,7 @@ def create_sqlite3(connection, ht, deps, rdeps):
             connection.executemany('''
                INSERT INTO dep(source, target) VALUES(?,?)
                 ''', [(i,cd) for cd in cdeps])
+    connection.executemany('INSERT INTO source VALUES(?,?)', sources)
 
 def retrieve_sqlite3(connection):
     ht = connection. \
@@ -76,42 +95,110 @@ def retrieve_sqlite3(connection):
         rdeps[d1].append(d0)
     return ht, dict(deps), dict(rdeps)
 
+def retrieve_sources(connection):
+    '''
+    sources = retrieve_sources(connection)
+
+    Returns the list of (path, digest) of the source files which the cache was
+    built from (empty for caches written by older versions of jug).
+    '''
+    try:
+        return connection.execute('SELECT * FROM source ORDER BY path').fetchall()
+    except sqlite3.OperationalError:
+        return []
+
 def save_dirty3(connection, dirty):
     connection.executemany('UPDATE ht SET STATUS = ? WHERE id = ?', [(nstatus,id) for id,nstatus in dirty.items()])
 
 @contextmanager
 def _open_connection(options):
-    import sqlite3
     connection = sqlite3.connect(options.status_cache_file)
     yield connection
     connection.commit()
     connection.close()
 
 
+def jugfile_sources(jugfile):
+    '''
+    paths = jugfile_sources(jugfile)
+
+    Returns the jugfile and the source files of all the modules which were
+    imported from its directory (or from the current directory) and which are
+    not installed packages. Must be called after the jugfile has been loaded.
+    '''
+    bases = set([path.dirname(path.abspath(jugfile)), path.abspath('.')])
+    bases = tuple(b + os.sep for b in bases)
+    sources = set([path.abspath(jugfile)])
+    for mod in list(sys.modules.values()):
+        fname = getattr(mod, '__file__', None)
+        if not fname:
+            continue
+        fname = path.abspath(fname)
+        if fname.endswith(('.pyc', '.pyo')):
+            fname = fname[:-1]
+        if not fname.startswith(bases):
+            continue
+        if 'site-packages' in fname or 'dist-packages' in fname:
+            continue
+        if path.exists(fname):
+            sources.add(fname)
+    return sorted(sources)
+
+def fingerprint(paths):
+    '''
+    sources = fingerprint(paths)
+
+    Returns a list of (path, digest) with the SHA1 of the contents of each
+    file (``None`` if it cannot be read).
+    '''
+    sources = []
+    for p in paths:
+        try:
+            with open(p, 'rb') as ifile:
+                digest = hashlib.sha1(ifile.read()).hexdigest()
+        except (IOError, OSError):
+            digest = None
+        sources.append((p, digest))
+    return sources
+
 def load_jugfile(options):
+    # Re-loading the jugfile must not add to tasks created by a previous load
+    del task.alltasks[:]
     store,_ = jug.init(options.jugfile, options.jugdir)
-    h2idx = {}
+    graph = TaskGraph(task.alltasks)
+    hashes = graph.hashes()
+
     ht = []
     deps = {}
+    rdeps = {}
+    for i,t in enumerate(graph.tasks):
+        ht.append( (i, t.display_name, hashes[i], unknown) )
+        deps[i] = [int(j) for j in graph.dependencies(i)]
+        cur_rdeps = graph.dependents(i)
+        if len(cur_rdeps):
+            rdeps[i] = [int(j) for j in cur_rdeps]
+    return store, ht, deps, rdeps
+
+def reuse_finished(ht, previous):
+    '''
+    reused = reuse_finished(ht, previous)
 
-    h2idx = { t.hash() : i for i, t in enumerate(task.alltasks) }
-
-    for t_i,t in enumerate(task.alltasks):
-        deps[t_i] = []
-        for _, rdeps in walk_dependencies(t):
-            for i in range(len(rdeps) - 1, -1, -1):
-                if isinstance( rdeps[i], Task ):
-                    deps[i].append( h2idx[rdeps[i].hash()] )
-                    rdeps.pop(i)
-
-        ht.append( (t_i, t.display_name, t.hash(), unknown) )
-
-    rdeps = defaultdict(list)
-    for k,v in deps.items():
-        for rv in v:
-            rdeps[rv].append(k)
-    return store, ht, deps, dict(rdeps)
+    Marks as finished every entry of ``ht`` whose hash was recorded as finished
+    in ``previous`` (a hash identifies a task *and* all its dependencies, so
+    these results are still valid). ``ht`` is modified in place.
 
+    Returns
+    -------
+    reused : int
+        Number of entries marked as finished
+    '''
+    done = set(h for _,_,h,st in previous if st == finished)
+    reused = 0
+    for k,(i,name,h,st) in enumerate(ht):
+        if h in done:
+            ht[k] = (i, name, h, finished)
+            reused += 1
+    return reused
 
 def update_status(store, ht, deps, rdeps):
     tasks_waiting = defaultdict(int)
@@ -169,18 +256,31 @@ def _clear_cache(options):
 def _status_cached(options):
     logger.debug("Executing _status_cached.")
     create, update = list(range(2))
+    previous = None
     try:
         with _open_connection(options) as connection:
             ht, deps, rdeps = retrieve_sqlite3(connection)
-        store = backends.select(options.jugdir)
-        mode = update
+            sources = retrieve_sources(connection)
+        previous = ht
     except Exception:
         logger.debug("Exception opening status cache, loading jugfile.", exc_info=True)
+        sources = []
+
+    if sources and fingerprint(p for p,_ in sources) == sources:
+        store = backends.select(options.jugdir)
+        mode = update
+    else:
+        if previous is not None:
+            logger.info("Jugfile (or a module it imports) changed. Rebuilding status cache.")
         store, ht, deps, rdeps = load_jugfile(options)
+        sources = fingerprint(jugfile_sources(options.jugfile))
+        if previous:
+            reused = reuse_finished(ht, previous)
+            logger.info("Reused %s finished tasks from previous status cache.", reused)
         mode = create
 
     tw,tre,tru,tf,dirty = update_status(store, ht, deps, rdeps)
-    _print_status(options, tw, tre, tru, tf)
+    write_status(options, ((name, h, dirty.get(i, st)) for i,name,h,st in ht))
     if mode == update:
         with _open_connection(options) as connection:
             save_dirty3(connection, dirty)
@@ -189,29 +289,342 @@ def _status_cached(options):
             _,name,hash,_ = ht[k]
             ht[k] = (k, name, hash, dirty[k])
         with _open_connection(options) as connection:
-            create_sqlite3(connection, ht, deps, rdeps)
+            create_sqlite3(connection, ht, deps, rdeps, sources)
     return sum(tf.values())
 
+# When at most this many tasks are unfinished, refreshes probe them
+# individually instead of listing the whole store.
+_MAX_INDIVIDUAL_PROBES = 1024
+
+class StatusTracker(object):
+    '''
+    tracker = StatusTracker(tasks)
+
+    Keeps the dependency graph of ``tasks`` in memory and tracks their status
+    across calls to ``refresh``. Tasks which are known to be finished are never
+    probed again.
+    '''
+    def __init__(self, tasks):
+        self.graph = TaskGraph(tasks)
+        self.order = self.graph.topological_order()
+        n = len(self.graph)
+        self.hashes = [None] * n
+        for i in self.order:
+            self.hashes[i] = self.graph.tasks[i].hash()
+        self.index = dict((h,i) for i,h in enumerate(self.hashes))
+        self.finished = [False] * n
+        self.totals = defaultdict(int)
+        for t in self.graph.tasks[:self.graph.ninputs]:
+            self.totals[t.display_name] += 1
+        self.running = set()
+        self.start = None
+        self.start_finished = None
+        self.last = None
+
+    def iter_refresh(self, store, written=(), probe=True):
+        '''
+        for name, hash, state in tracker.iter_refresh(store, written=(), probe=True):
+            ...
+
+        Updates the status of all tasks in a single pass in topological order
+        (so that the status of its dependencies is already known when a task
+        is visited). The state of each task is yielded as soon as it is known.
+        All the tasks which are not known to be finished are checked with a
+        single ``can_load_many`` call.
+
+        Parameters
+        ----------
+        store : jug store
+        written : sequence of str, optional
+            Hashes of results which are known to have been written (e.g., from
+            store notifications). These are marked as finished without probing.
+        probe : bool, optional
+            If False, the store is not accessed at all: only ``written`` is
+            taken into account (and tasks which were running at the last probe
+            are assumed to still be running, unless they are in ``written``)
+        '''
+        for h in written:
+            i = self.index.get(h)
+            if i is not None:
+                self.finished[i] = True
+
+        graph = self.graph
+        if probe:
+            unknown = [i for i in self.order if not self.finished[i]]
+            for i,f in zip(unknown, store.can_load_many([self.hashes[i] for i in unknown])):
+                self.finished[i] = bool(f)
+
+        available = [False] * len(graph)
+        for i in self.order:
+            t = graph.tasks[i]
+            h = self.hashes[i]
+            available[i] = self.finished[i] or t.is_loaded()
+            if i >= graph.ninputs:
+                continue
+            if self.finished[i]:
+                self.running.discard(i)
+                yield t.display_name, h, finished
+            elif all(available[j] for j in graph.dependencies(i)):
+                if probe:
+                    if store.getlock(h).is_locked():
+                        self.running.add(i)
+                    else:
+                        self.running.discard(i)
+                if i in self.running:
+                    yield t.display_name, h, running
+                else:
+                    yield t.display_name, h, ready
+            else:
+                yield t.display_name, h, waiting
+
+        self.last = time()
+        if self.start is None:
+            self.start = self.last
+            self.start_finished = defaultdict(int)
+            for i,t in enumerate(graph.tasks[:graph.ninputs]):
+                if self.finished[i]:
+                    self.start_finished[t.display_name] += 1
+
+    def probe_store(self, store):
+        '''
+        pstore = tracker.probe_store(store)
+
+        Wraps ``store`` for a refresh. If many tasks are unfinished, the whole
+        store is listed once; otherwise, they are probed individually.
+        '''
+        return memoize_store(store, list_base=(self.nr_unfinished() > _MAX_INDIVIDUAL_PROBES))
+
+    def refresh(self, store, written=(), probe=True):
+        '''
+        waiting, ready, running, finished = tracker.refresh(store, written=(), probe=True)
+
+        Same as ``iter_refresh``, but only returns the number of tasks per name
+        in each state.
+        '''
+        return count_states(self.iter_refresh(store, written, probe))
+
+    def nr_unfinished(self):
+        return self.finished[:self.graph.ninputs].count(False)
+
+    def progress(self, name, nr_finished):
+        '''
+        rate, eta = tracker.progress(name, nr_finished)
+
+        Returns the completion rate (tasks per second) of tasks called ``name``
+        since the first refresh and the estimated number of seconds until they
+        are all finished (both are None if no task has finished in the
+        meanwhile).
+        '''
+        done = nr_finished - self.start_finished.get(name, 0)
+        elapsed = self.last - self.start
+        if done <= 0 or elapsed <= 0:
+            return None, None
+        rate = done / elapsed
+        return rate, (self.totals[name] - nr_finished) / rate
+
+
+def count_states(states):
+    '''
+    waiting, ready, running, finished = count_states(states)
+
+    Counts the tasks per name in each state.
+
+    Parameters
+    ----------
+    states : iterable of (name, hash, state)
+
+    Returns
+    -------
+    waiting, ready, running, finished : dict
+        Number of tasks per name in each state
+    '''
+    counts = dict((st, defaultdict(int)) for st in all_states)
+    for name,_,st in states:
+        counts[st][name] += 1
+    return tuple(counts[st] for st in all_states)
+
+
+def hash_text(h):
+    '''
+    text = hash_text(h)
+
+    Returns hash ``h`` as text (hashes are bytes)
+    '''
+    if isinstance(h, bytes):
+        return h.decode('utf-8')
+    return h
+
+
+def write_status(options, states, tracker=None):
+    '''
+    waiting, ready, running, finished = write_status(options, states, tracker=None)
+
+    Outputs the status in the format given by ``options.status_format``:
+
+    table
+        Human readable table (the default)
+    json
+        A single JSON object with the state of every task (``tasks``), counts
+        per task name (``names``), and timing fields
+    ndjson
+        One JSON object per line: a ``start`` record, one ``task`` record per
+        task, one ``name`` record per task name, and an ``end`` record
+
+    ``states`` is consumed lazily, so that, in the JSON formats, each task is
+    written out as soon as its state is known.
+
+    Parameters
+    ----------
+    options : jug options
+    states : iterable of (name, hash, state)
+    tracker : StatusTracker, optional
+        If given, the completion rate & ETA per task name are also output
+
+    Returns
+    -------
+    waiting, ready, running, finished : dict
+        Number of tasks per name in each state
+    '''
+    fmt = options.status_format
+    if fmt not in ('json', 'ndjson'):
+        counts = count_states(states)
+        if tracker is not None:
+            for line in render_watch_table(tracker, *counts):
+                options.print_out(line)
+            options.print_out('')
+        else:
+            _print_status(options, *counts)
+        return counts
+
+    out = options.print_out
+    started = time()
+    if fmt == 'ndjson':
+        out(json.dumps({'type': 'start', 'timestamp': started}))
+    else:
+        out('{"timestamp": %s, "tasks": [' % json.dumps(started))
+
+    names = []
+    seen = set()
+    counts = dict((st, defaultdict(int)) for st in all_states)
+    sep = ''
+    for name,h,st in states:
+        if name not in seen:
+            seen.add(name)
+            names.append(name)
+        counts[st][name] += 1
+        record = {'name': name, 'hash': hash_text(h), 'state': st}
+        if fmt == 'ndjson':
+            record['type'] = 'task'
+            out(json.dumps(record, sort_keys=True))
+        else:
+            out(sep + json.dumps(record, sort_keys=True))
+            sep = ','
+
+    if fmt == 'json':
+        out('], "names": [')
+    sep = ''
+    for name in names:
+        record = dict((st, counts[st][name]) for st in all_states)
+        record['name'] = name
+        if tracker is not None:
+            record['rate'], record['eta'] = tracker.progress(name, counts[finished][name])
+        if fmt == 'ndjson':
+            record['type'] = 'name'
+            out(json.dumps(record, sort_keys=True))
+        else:
+            out(sep + json.dumps(record, sort_keys=True))
+            sep = ','
+
+    end = time()
+    totals = dict((st, sum(counts[st].values())) for st in all_states)
+    if fmt == 'ndjson':
+        record = {'type': 'end', 'timestamp': end, 'elapsed': end - started}
+        record.update(totals)
+        out(json.dumps(record, sort_keys=True))
+    else:
+        out('], "totals": %s, "elapsed": %s}' % (json.dumps(totals, sort_keys=True), json.dumps(end - started)))
+    return tuple(counts[st] for st in all_states)
+
+
+def _format_eta(seconds):
+    if seconds is None:
+        return '-'
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return '%dh%02dm' % (seconds // 3600, (seconds % 3600) // 60)
+    return '%dm%02ds' % (seconds // 60, seconds % 60)
+
+
+def render_watch_table(tracker, waiting, ready, running, finished):
+    '''
+    lines = render_watch_table(tracker, waiting, ready, running, finished)
+
+    Renders the per-name status table for ``status --watch``: task counts,
+    percentage finished, completion rate (per minute), and ETA.
+    '''
+    names = sorted(tracker.totals)
+    header = ('Waiting', 'Ready', 'Running', 'Finished', 'Done', 'Rate/min', 'ETA')
+    line_format = ('%10s' * len(header)) + '  %s'
+    lines = [line_format % (header + ('Task name',))]
+    lines.append('-' * (10 * len(header) + 12))
+    for name in names:
+        rate, eta = tracker.progress(name, finished[name])
+        lines.append(line_format % (
+                    waiting[name],
+                    ready[name],
+                    running[name],
+                    finished[name],
+                    '%.1f%%' % (100. * finished[name] / tracker.totals[name]),
+                    ('-' if rate is None else '%.1f' % (60. * rate)),
+                    _format_eta(eta),
+                    name))
+    return lines
+
+
 def _status_nocache(options):
     logger.debug("Executing _status_nocache.")
-    jug.init(options.jugfile, options.jugdir)
+    store,_ = jug.init(options.jugfile, options.jugdir)
 
-    tasks_waiting = defaultdict(int)
-    tasks_ready = defaultdict(int)
-    tasks_running = defaultdict(int)
-    tasks_finished = defaultdict(int)
-    for t in task.alltasks:
-        if t.can_load():
-            tasks_finished[t.display_name] += 1
-        elif t.can_run():
-            if t.is_locked():
-                tasks_running[t.display_name] += 1
+    # All results & locks are listed once, up front (instead of probing the
+    # store for every task and again for every dependency).
+    tracker = StatusTracker(task.alltasks)
+    tw,tre,tru,tf = write_status(options, tracker.iter_refresh(memoize_store(store, list_base=True)))
+    return sum(tf.values())
+
+
+def _status_watch(options):
+    logger.debug("Executing _status_watch.")
+    store,_ = jug.init(options.jugfile, options.jugdir)
+    tracker = StatusTracker(task.alltasks)
+    redraw = sys.stdout.isatty() and options.status_format not in ('json', 'ndjson')
+
+    written = ()
+    tf = {}
+    next_probe = 0
+    try:
+        while True:
+            if redraw:
+                # Clear screen & move to top left corner
+                sys.stdout.write('\x1b[H\x1b[2J')
+            # The store is probed at most once per interval; in between,
+            # notifications of written results update the status without
+            # accessing the store
+            probe = (time() >= next_probe)
+            if probe:
+                next_probe = time() + options.status_watch_interval
+                states = tracker.iter_refresh(tracker.probe_store(store), written)
             else:
-                tasks_ready[t.display_name] += 1
-        else:
-            tasks_waiting[t.display_name] += 1
-    _print_status(options, tasks_waiting, tasks_ready, tasks_running, tasks_finished)
-    return sum(tasks_finished.values())
+                states = tracker.iter_refresh(store, written, probe=False)
+            tw,tre,tru,tf = write_status(options, states, tracker)
+            if not tracker.nr_unfinished():
+                break
+            if hasattr(store, 'wait_for_results'):
+                written = store.wait_for_results(max(0., next_probe - time()))
+            else:
+                sleep(options.status_watch_interval)
+    except KeyboardInterrupt:
+        pass
+    return sum(tf.values())
 
 
 def status(options):
@@ -229,10 +642,10 @@ def status(options):
     tasks_finished : int
         Count of finsihed tasks.
     '''
+    if options.status_watch:
+        return _status_watch(options)
     if options.status_mode == 'cached':
-        try:
-            import sqlite3
-        except ImportError:
+        if sqlite3 is None:
             logger.warning('Cached status relies on sqlite3. Falling back to non-cached version')
             options.status_mode = 'no-cache'
             return status(options)
@@ -21,7 +21,16 @@
 #  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 #  THE SOFTWARE.
 
+import json
+import threading
+from time import time
+
+import jug
+import logging
+logger = logging.getLogger(__name__)
+
 from . import status as st
+from .. import task
 
 template = '''
 <html>
@@ -46,6 +55,18 @@ TH {
     color: #6d2243;
 }
 </style>
+<script>
+// Every event carries the current status; the page is only reloaded if the
+// status is newer than the one it shows
+var version = %(version)s;
+if (window.EventSource) {
+    new EventSource('/api/events').onmessage = function(e) {
+        if (JSON.parse(e.data).version != version) {
+            window.location.reload();
+        }
+    };
+}
+</script>
 </head>
 <body>
 <h1>Jug Status for <span class="jugfile">%(jugfile)s</span></h1>
@@ -87,12 +108,144 @@ def _format_counts(tw, tre, tru, tf):
     return r
 
 
-def webstatus(options):
-    import sqlite3
-    connection = sqlite3.connect(':memory:', check_same_thread=False)
-    store, ht, deps, rdeps = st.load_jugfile(options)
-    st.create_sqlite3(connection, ht, deps, rdeps)
+class StatusRefresher(object):
+    '''
+    refresher = StatusRefresher(store, tasks, interval)
+
+    Keeps the status of ``tasks`` up to date on a background thread (call
+    ``start()``), so that any number of web requests share a single refresh.
+
+    The thread refreshes every ``interval`` seconds or, if the store supports
+    notifications (``wait_for_results``), as soon as results are written.
+
+    Attributes
+    ----------
+    version : int
+        Incremented whenever the status changes
+    counts : tuple of dict
+        waiting, ready, running, finished counts per task name
+    tasks : dict
+        For each task name, list of (hash, state)
+    '''
+    def __init__(self, store, tasks, interval):
+        self.store = store
+        self.tracker = st.StatusTracker(tasks)
+        self.interval = interval
+        self.version = 0
+        self.counts = None
+        self.tasks = {}
+        self.timestamp = None
+        self.changed = threading.Condition()
+        self.stopped = threading.Event()
+        self.thread = None
+        self._written = ()
+        self._next_probe = 0
+
+    def refresh(self):
+        '''
+        changed = refresher.refresh()
+
+        Refreshes the status once. Returns whether it changed.
+
+        The store is probed at most once per interval: in between, only the
+        results reported by store notifications are taken into account.
+        '''
+        if time() >= self._next_probe:
+            self._next_probe = time() + self.interval
+            states = list(self.tracker.iter_refresh(self.tracker.probe_store(self.store), self._written))
+        else:
+            states = list(self.tracker.iter_refresh(self.store, self._written, probe=False))
+        tasks = {}
+        for name,h,state in states:
+            tasks.setdefault(name, []).append((st.hash_text(h), state))
+        counts = st.count_states(states)
+        with self.changed:
+            self.timestamp = time()
+            if counts != self.counts:
+                self.counts = counts
+                self.tasks = tasks
+                self.version += 1
+                self.changed.notify_all()
+                return True
+        return False
+
+    def _wait(self):
+        if hasattr(self.store, 'wait_for_results'):
+            self._written = self.store.wait_for_results(max(0., self._next_probe - time()))
+        else:
+            self.stopped.wait(self.interval)
+
+    def _run(self):
+        while not self.stopped.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception('webstatus: error refreshing status')
+            self._wait()
+
+    def start(self):
+        self.refresh()
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        with self.changed:
+            self.changed.notify_all()
+
+    def wait_for_change(self, version, timeout):
+        '''
+        version = refresher.wait_for_change(version, timeout)
 
+        Blocks until the status version is different from ``version`` (or
+        ``timeout`` seconds elapse). Returns the current version.
+        '''
+        with self.changed:
+            if self.version == version and not self.stopped.is_set():
+                self.changed.wait(timeout)
+            return self.version
+
+    def status_json(self):
+        '''
+        text = refresher.status_json()
+
+        Returns the JSON for ``/api/status``: counts per task name and totals
+        '''
+        with self.changed:
+            counts = self.counts
+            version = self.version
+            timestamp = self.timestamp
+        names = sorted(set().union(*[c.keys() for c in counts]))
+        result = {
+            'version': version,
+            'timestamp': timestamp,
+            'names': [dict([('name', n)] + [(s, c[n]) for s,c in zip(st.all_states, counts)]) for n in names],
+            'totals': dict((s, sum(c.values())) for s,c in zip(st.all_states, counts)),
+        }
+        return json.dumps(result, sort_keys=True)
+
+    def task_json(self, name):
+        '''
+        text = refresher.task_json(name)
+
+        Returns the JSON for ``/api/task/<name>``: counts and the state of each
+        task called ``name`` (None if there is no such task)
+        '''
+        with self.changed:
+            counts = self.counts
+            tasks = self.tasks.get(name)
+            version = self.version
+        if tasks is None:
+            return None
+        result = dict((s, c[name]) for s,c in zip(st.all_states, counts))
+        result['name'] = name
+        result['version'] = version
+        result['tasks'] = [{'hash': h, 'state': s} for h,s in tasks]
+        return json.dumps(result, sort_keys=True)
+
+
+def webstatus(options):
     try:
         import web
     except ImportError:
@@ -108,17 +261,66 @@ or
     easy_install web.py
 ''')
         return
+
+    del task.alltasks[:]
+    store,_ = jug.init(options.jugfile, options.jugdir)
+    refresher = StatusRefresher(store, task.alltasks, options.status_watch_interval)
+    refresher.start()
+
     urls = (
-        '/(.*)', 'status'
+        '/api/status', 'api_status',
+        '/api/task/(.+)', 'api_task',
+        '/api/events', 'api_events',
+        '/(.*)', 'status',
     )
     class Status(object):
         def GET(self, name):
-            ht, deps, rdeps = st.retrieve_sqlite3(connection)
-            tw,tre,tru,tf,dirty = st.update_status(store, ht, deps, rdeps)
-            st.save_dirty3(connection, dirty)
+            with refresher.changed:
+                counts = refresher.counts
+                version = refresher.version
             return template % {
                     'jugfile' : options.jugfile,
-                    'table' : _format_counts(tw, tre, tru, tf),
+                    'table' : _format_counts(*counts),
+                    'version' : version,
             }
-    app = web.application(urls, {'status': Status})
-    app.run()
+
+    class APIStatus(object):
+        def GET(self):
+            web.header('Content-Type', 'application/json')
+            return refresher.status_json()
+
+    class APITask(object):
+        def GET(self, name):
+            data = refresher.task_json(name)
+            if data is None:
+                raise web.notfound()
+            web.header('Content-Type', 'application/json')
+            return data
+
+    class APIEvents(object):
+        def GET(self):
+            web.header('Content-Type', 'text/event-stream')
+            web.header('Cache-Control', 'no-cache')
+            def events():
+                version = refresher.version
+                yield 'data: %s\n\n' % refresher.status_json()
+                while not refresher.stopped.is_set():
+                    nversion = refresher.wait_for_change(version, 15.)
+                    if nversion == version:
+                        # Keep the connection alive
+                        yield ': ping\n\n'
+                    else:
+                        version = nversion
+                        yield 'data: %s\n\n' % refresher.status_json()
+            return events()
+
+    app = web.application(urls, {
+                    'status': Status,
+                    'api_status': APIStatus,
+                    'api_task': APITask,
+                    'api_events': APIEvents,
+                    })
+    try:
+        app.run()
+    finally:
+        refresher.stop()
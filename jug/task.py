@@ -16,7 +16,10 @@ There are two main alternatives:
 from abc import ABCMeta, abstractmethod, abstractproperty
 
 from .hash import new_hash_object, hash_update, hash_one
+from collections import deque
+from collections.abc import Iterator
 import functools
+import operator
 
 __all__ = [
     'Task',
@@ -136,14 +139,15 @@ class TaskBase(TaskletMixin):
 
             for tt in recursive_dependencies(t): tt.unload()
         '''
-        def checked_unload_recursive(t, visited):
-            if id(t) not in visited:
-                visited.add(id(t))
-                t.unload()
-                for dep in t.dependencies():
-                    checked_unload_recursive(dep, visited)
-
-        checked_unload_recursive(self, set())
+        visited = set([id(self)])
+        queue = [self]
+        while queue:
+            t = queue.pop()
+            t.unload()
+            for dep in t.dependencies():
+                if id(dep) not in visited:
+                    visited.add(id(dep))
+                    queue.append(dep)
 
     def hash(self):
         '''Returns the hash for this task.'''
@@ -158,6 +162,205 @@ def jug_name(jug_name):
 
     return set_jug_name
 
+def mmap_result(f):
+    """Decorator to load the results of ``f`` as read-only memory maps.
+
+    When the store supports it (e.g., ``file_store``), array results of tasks
+    calling ``f`` are not read into memory, but mapped (as ``numpy.memmap``)
+    so that processes on the same machine share the same pages. Apply it
+    below ``TaskGenerator``::
+
+        @TaskGenerator
+        @mmap_result
+        def compute(...):
+            ...
+    """
+    f.__jug_mmap__ = True
+    return f
+
+def compress_result(compression):
+    """Decorator to set how the results of ``f`` are compressed.
+
+    ``compression`` overrides the setting of the store (for stores which
+    support compression, such as ``file_store`` and ``redis_store``). It is
+    one of ``none``, ``zstd``, ``lz4`` or ``gzip``, optionally followed by
+    ``:LEVEL`` and/or prefixed with ``auto:`` to only compress results which
+    shrink well. Apply it below ``TaskGenerator``::
+
+        @TaskGenerator
+        @compress_result('zstd:10')
+        def count_words(...):
+            ...
+    """
+    from .backends.open_compressed import parse_compression
+    parse_compression(compression)
+    def set_compression(f):
+        f.__jug_compression__ = compression
+        return f
+    return set_compression
+
+def lazy_arguments(*names):
+    """Decorator to pass the arguments of ``f`` as lazy proxies.
+
+    Task arguments (which are not loaded yet) are not loaded before ``f`` is
+    called. Instead, ``f`` receives a ``LazyValue`` for each of them, which
+    loads the result from the store on first use (attribute or item access,
+    ``len()``, arithmetic, ...). Arguments which are only passed through or
+    not used at all are never loaded. Apply it below ``TaskGenerator``,
+    either to all arguments::
+
+        @TaskGenerator
+        @lazy_arguments
+        def select(features, labels, i):
+            ...
+
+    or only to some of them (by name)::
+
+        @TaskGenerator
+        @lazy_arguments('features')
+        def select(features, labels, i):
+            ...
+
+    This does not change the hash of the tasks.
+    """
+    if len(names) == 1 and callable(names[0]):
+        names[0].__jug_lazy__ = True
+        return names[0]
+    def set_lazy(f):
+        import inspect
+        parameters = inspect.signature(f).parameters
+        for name in names:
+            if name not in parameters:
+                raise ValueError('jug.lazy_arguments: %s has no argument named "%s"' % (f.__name__, name))
+        f.__jug_lazy__ = frozenset(names)
+        return f
+    return set_lazy
+
+def _positional_names(f, n):
+    '''
+    names = _positional_names(f, n)
+
+    Returns the names of the parameters of ``f`` which receive the first
+    ``n`` positional arguments (None where they are unknown).
+    '''
+    import inspect
+    try:
+        parameters = list(inspect.signature(f).parameters.values())
+    except (TypeError, ValueError):
+        return [None] * n
+    names = []
+    for p in parameters:
+        if p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD):
+            names.append(p.name)
+        elif p.kind == p.VAR_POSITIONAL:
+            names.extend([p.name] * (n - len(names)))
+    return (names + [None] * n)[:n]
+
+def _identity(obj):
+    return obj
+
+class LazyValue(object):
+    '''
+    LazyValue(t)
+
+    Stands in for the value of the Task(let) ``t``, which is only loaded when
+    it is first used (see ``lazy_arguments``). ``value(lazy)`` returns the
+    loaded value itself, which is needed when the exact type matters (e.g.,
+    for ``isinstance`` checks).
+    '''
+    __slots__ = ('_task', '_value')
+
+    def __init__(self, t):
+        object.__setattr__(self, '_task', t)
+
+    def __jug_value__(self):
+        try:
+            return object.__getattribute__(self, '_value')
+        except AttributeError:
+            v = value(object.__getattribute__(self, '_task'))
+            object.__setattr__(self, '_value', v)
+            return v
+
+    def __getattr__(self, name):
+        return getattr(self.__jug_value__(), name)
+
+    def __setattr__(self, name, v):
+        setattr(self.__jug_value__(), name, v)
+
+    def __delattr__(self, name):
+        delattr(self.__jug_value__(), name)
+
+    def __reduce__(self):
+        # Results which include the proxy are saved with the actual value
+        return (_identity, (self.__jug_value__(),))
+
+    def __array__(self, *args, **kwargs):
+        import numpy as np
+        return np.asarray(self.__jug_value__(), *args, **kwargs)
+
+    def __repr__(self):
+        try:
+            return repr(object.__getattribute__(self, '_value'))
+        except AttributeError:
+            return 'LazyValue(%r)' % (object.__getattribute__(self, '_task'),)
+
+def _forward(name, f):
+    def method(self, *args, **kwargs):
+        return f(self.__jug_value__(), *args, **kwargs)
+    method.__name__ = name
+    return method
+
+def _reflected(f):
+    return lambda v, other: f(other, v)
+
+# Special methods are looked up on the type (not through __getattr__), so
+# each of them has to be forwarded explicitly
+_FORWARDED = {
+    '__str__': str,
+    '__bytes__': bytes,
+    '__format__': format,
+    '__bool__': bool,
+    '__len__': len,
+    '__iter__': iter,
+    '__reversed__': reversed,
+    '__hash__': hash,
+    '__contains__': lambda v, x: x in v,
+    '__getitem__': operator.getitem,
+    '__setitem__': operator.setitem,
+    '__delitem__': operator.delitem,
+    '__call__': lambda v, *args, **kwargs: v(*args, **kwargs),
+    '__enter__': lambda v: v.__enter__(),
+    '__exit__': lambda v, *args: v.__exit__(*args),
+    '__neg__': operator.neg,
+    '__pos__': operator.pos,
+    '__abs__': abs,
+    '__invert__': operator.invert,
+    '__int__': int,
+    '__float__': float,
+    '__complex__': complex,
+    '__index__': operator.index,
+    '__eq__': operator.eq,
+    '__ne__': operator.ne,
+    '__lt__': operator.lt,
+    '__le__': operator.le,
+    '__gt__': operator.gt,
+    '__ge__': operator.ge,
+}
+for _op, _f in [('add', operator.add), ('sub', operator.sub), ('mul', operator.mul),
+        ('matmul', operator.matmul), ('truediv', operator.truediv), ('floordiv', operator.floordiv),
+        ('mod', operator.mod), ('divmod', divmod), ('pow', pow), ('lshift', operator.lshift),
+        ('rshift', operator.rshift), ('and', operator.and_), ('xor', operator.xor), ('or', operator.or_)]:
+    _FORWARDED['__%s__' % _op] = _f
+    _FORWARDED['__r%s__' % _op] = _reflected(_f)
+for _name, _f in _FORWARDED.items():
+    setattr(LazyValue, _name, _forward(_name, _f))
+del _op, _f, _name
+
+def _lazy_value(dep):
+    if isinstance(dep, TaskBase) and not dep.is_loaded():
+        return LazyValue(dep)
+    return value(dep)
+
 class Task(TaskBase):
     '''
     T = Task(f, dep0, dep1,..., kw_arg0=kw_val0, kw_arg1=kw_val1, ...)
@@ -210,19 +413,34 @@ class Task(TaskBase):
         if debug_mode:
             self._check_hash()
 
-        if self.can_load() and not force:
+        if not force and self.can_load():
             return
 
         name = self.hash()
         self._result = self._execute()
-        self.store.dump(self._result, name)
+        compression = getattr(self.f, '__jug_compression__', None)
+        if compression is not None and hasattr(self.store, 'compression'):
+            self.store.dump(self._result, name, compression=compression)
+        else:
+            self.store.dump(self._result, name)
+        if isinstance(self._result, Iterator):
+            # It was consumed by writing it out: the result is loaded back
+            # (as a ``StreamedResult``) when it is needed
+            del self._result
 
         if debug_mode:
             self._check_hash()
 
     def _execute(self):
-        args = [value(dep) for dep in self.args]
-        kwargs = dict((key,value(dep)) for key,dep in self.kwargs.items())
+        lazy = getattr(self.f, '__jug_lazy__', None)
+        if lazy is None:
+            args = [value(dep) for dep in self.args]
+            kwargs = dict((key,value(dep)) for key,dep in self.kwargs.items())
+        else:
+            is_lazy = lambda name: (lazy is True or name in lazy)
+            names = _positional_names(self.f, len(self.args))
+            args = [(_lazy_value(dep) if is_lazy(name) else value(dep)) for name,dep in zip(names, self.args)]
+            kwargs = dict((key,(_lazy_value(dep) if is_lazy(key) else value(dep))) for key,dep in self.kwargs.items())
         return self.f(*args,**kwargs)
 
     @property
@@ -269,7 +487,10 @@ class Task(TaskBase):
         Nothing
         '''
         assert self.can_load()
-        self._result = self.store.load(self.hash())
+        if getattr(self.f, '__jug_mmap__', False) and hasattr(self.store, 'load_mmap'):
+            self._result = self.store.load_mmap(self.hash())
+        else:
+            self._result = self.store.load(self.hash())
 
     def invalidate(self):
         '''
@@ -352,6 +573,7 @@ class Task(TaskBase):
         The results are cached, so the first call can be much slower than
         subsequent calls.
         """
+        _hash_dependencies(self)
         return self._compute_set_hash()
 
 
@@ -460,7 +682,16 @@ class Tasklet(TaskBase):
         yield self.base
 
     def value(self):
-        return self.f(value(self.base))
+        base = self.base
+        if isinstance(self.f, _getitem) and isinstance(base, Task) and not base.is_loaded() \
+                and not isinstance(self.f.slice, TaskBase) and hasattr(base.store, 'load_item'):
+            # Only the element(s) are read from the store
+            try:
+                return base.store.load_item(base.hash(), self.f.slice)
+            except NotImplementedError:
+                # The result is loaded (and kept) in full
+                pass
+        return self.f(value(base))
 
     def can_load(self, store=None):
         return self.base.can_load(store)
@@ -487,6 +718,32 @@ class Tasklet(TaskBase):
             ])
         return M.hexdigest().encode('utf-8')
 
+def _hash_dependencies(t):
+    '''
+    _hash_dependencies(t)
+
+    Computes (and caches) the hashes of all the Tasks that ``t`` depends on,
+    dependencies first. As a task's hash includes the hashes of its
+    dependencies, computing it directly would otherwise recurse once per level
+    of the graph.
+    '''
+    def needs_hash(dep):
+        return not (isinstance(dep, Task) and '__jug_hash__' in dep.__dict__)
+
+    visited = set([id(t)])
+    stack = [(t, iter(t.dependencies()))]
+    while stack:
+        cur, deps = stack[-1]
+        for dep in deps:
+            if id(dep) not in visited and needs_hash(dep):
+                visited.add(id(dep))
+                stack.append((dep, iter(dep.dependencies())))
+                break
+        else:
+            stack.pop()
+            if cur is not t and isinstance(cur, Task):
+                cur._compute_set_hash()
+
 def topological_sort(tasks):
     '''
     topological_sort(tasks)
@@ -494,18 +751,9 @@ def topological_sort(tasks):
     Sorts a list of tasks topologically in-place. The list is sorted when
     there is never a dependency between tasks[i] and tasks[j] if i < j.
     '''
-    sorted = []
-    whites = set(tasks)
-    def dfs(t):
-        for dep in t.dependencies():
-            if dep in whites:
-                whites.remove(dep)
-                dfs(dep)
-        sorted.append(t)
-    while whites:
-        next = whites.pop()
-        dfs(next)
-    tasks[:] = sorted
+    from .graph import TaskGraph
+    graph = TaskGraph(tasks)
+    tasks[:] = [graph.tasks[i] for i in graph.topological_order() if i < graph.ninputs]
 
 def recursive_dependencies(t, max_level=-1):
     '''
@@ -514,6 +762,10 @@ def recursive_dependencies(t, max_level=-1):
 
     Returns a generator that lists all recursive dependencies of task
 
+    Each dependency is listed only once (even if it can be reached through
+    several paths). Dependencies are listed breadth-first, so that closer
+    dependencies come first.
+
     Parameters
     ----------
     t : Task
@@ -528,30 +780,39 @@ def recursive_dependencies(t, max_level=-1):
     '''
     if max_level is None:
         max_level = -1
-    if max_level == 0:
-        return
 
-    for dep in t.dependencies():
-        yield dep
-        for d2 in recursive_dependencies(dep, max_level - 1):
-            yield d2
+    visited = set([id(t)])
+    queue = deque([(t, 0)])
+    while queue:
+        cur, level = queue.popleft()
+        if level == max_level:
+            continue
+        for dep in cur.dependencies():
+            if id(dep) not in visited:
+                visited.add(id(dep))
+                yield dep
+                queue.append((dep, level + 1))
 
 def walk_dependencies(t):
     """Walk dependency tree from given task t.
 
-    Walk dependency tree top-down yielding (path, dependencies) tuple at each
-    encountered dependency. Walk may be modified by removing entries from
-    yielded dependencies list.
+    Walk dependency tree top-down (breadth-first) yielding (path, dependencies)
+    tuple at each encountered dependency. Walk may be modified by removing
+    entries from yielded dependencies list.
+
+    Each task is walked only once, through the first (i.e., shortest) path
+    which reaches it.
 
     Yields: (path, dependencies)
         path - Tuple of tasks to, path[-1] is current task being walked.
         dependencies - list of dependencies.
     """
 
-    to_walk = [([], t)]
+    visited = set([id(t)])
+    to_walk = deque([([], t)])
 
     while to_walk:
-        src_path, cur_t = to_walk.pop(0)
+        src_path, cur_t = to_walk.popleft()
 
         cur_path = src_path + [cur_t]
         cur_dependencies = list(cur_t.dependencies())
@@ -560,7 +821,10 @@ def walk_dependencies(t):
 
         # Ignore modifications to path by resetting cur_path
         cur_path = src_path + [cur_t]
-        to_walk.extend( (cur_path, d) for d in cur_dependencies )
+        for d in cur_dependencies:
+            if id(d) not in visited:
+                visited.add(id(d))
+                to_walk.append((cur_path, d))
 
 def tasks_for_value(*args, **kwargs):
     """Walk elem, yielding all contained tasks.
@@ -613,14 +877,50 @@ def value(elem):
     else:
         return elem
 
+def _load_many(elems):
+    '''
+    _load_many(elems)
+
+    Loads the Tasks in ``elems`` which are not loaded yet, with a single
+    ``load_many`` call per store (instead of a round trip per Task).
+
+    Tasks which are the base of several Tasklets in ``elems`` are loaded in
+    full (rather than reading the elements one at a time).
+    '''
+    elems = list(elems)
+    bases = {}
+    for e in elems:
+        if isinstance(e, Tasklet) and isinstance(e.base, Task):
+            _, n = bases.get(id(e.base), (e.base, 0))
+            bases[id(e.base)] = (e.base, n + 1)
+    shared = [base for base, n in bases.values() if n > 1 and not base.is_loaded()]
+    elems.extend(shared)
+
+    pending = {}
+    for e in elems:
+        if isinstance(e, Task) and not e.is_loaded() and not getattr(e.f, '__jug_mmap__', False):
+            _, tasks = pending.setdefault(id(e.store), (e.store, {}))
+            tasks[id(e)] = e
+    for store, tasks in pending.values():
+        if len(tasks) < 2:
+            continue
+        tasks = list(tasks.values())
+        for t, r in zip(tasks, store.load_many([t.hash() for t in tasks])):
+            t._result = r
+    for base in shared:
+        if not base.is_loaded():
+            base.load()
+
 @value.register(list)
 @value.register(tuple)
 @value.register(set)
 def container_to_value(container):
+    _load_many(container)
     return container.__class__(map(value, container))
 
 @value.register(dict)
 def dict_to_value(container):
+    _load_many(container.values())
     return container.__class__(zip(container.keys(), map(value, container.values())))
 
 @functools.singledispatch
@@ -0,0 +1,9 @@
+from jug import mapreduce
+import time
+
+def slow_double(x):
+    time.sleep(.01)
+    return 2*x
+
+vs = list(range(32))
+v2s = mapreduce.map(slow_double, vs, map_step='auto', target_seconds=.04)
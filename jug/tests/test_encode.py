@@ -1,6 +1,6 @@
 from six import BytesIO
 import six
-from jug.backends.encode import encode, decode
+from jug.backends.encode import encode, encode_to, decode, HEADER_SIZE
 import numpy as np
 
 def test_encode():
@@ -18,3 +18,205 @@ class Derived(np.ndarray):
 def test_numpy_derived():
     a = Derived([1,2,3])
     assert type(decode(encode(a))) == type(a)
+
+def test_numpy_npy_format():
+    from jug.backends.encode import available_encoders
+    from jug.backends.encoders.numpy_encoder import NDArrayEncoder
+    assert any(isinstance(e, NDArrayEncoder) for e in available_encoders)
+    arr = np.arange(12.).reshape((3, 4))
+    s = encode(arr)[HEADER_SIZE:]
+    assert s.startswith(six.b('\x93NUMPY'))
+    assert np.all(np.load(BytesIO(s)) == arr)
+
+def test_numpy_layouts():
+    structured = np.array([(1, 2.5, b'ab'), (3, 4.5, b'cd')], dtype=[('a', '<i4'), ('b', '>f8'), ('c', 'S2')])
+    for arr in [
+            np.asfortranarray(np.arange(12).reshape((3, 4))),
+            np.arange(24).reshape((2, 3, 4))[:, ::2],
+            np.array(3.5),
+            np.zeros((0, 3)),
+            np.arange(5, dtype='>i8'),
+            structured,
+            ]:
+        loaded = decode(encode(arr))
+        assert loaded.dtype == arr.dtype
+        assert loaded.shape == arr.shape
+        assert np.all(loaded == arr)
+    assert decode(encode(np.asfortranarray(np.ones((3, 4))))).flags.f_contiguous
+
+def test_numpy_objects():
+    arr = np.array([None, 'a', 1])
+    assert list(decode(encode(arr))) == [None, 'a', 1]
+
+def test_out_of_band_buffers():
+    import pickle
+    if pickle.HIGHEST_PROTOCOL < 5:
+        from nose import SkipTest
+        raise SkipTest()
+    from jug.backends.encoders.pickle5_encoder import _MAGIC
+    big = np.arange(100000.)
+    obj = {
+        'big': big,
+        'fortran': np.asfortranarray(np.ones((300, 300))),
+        'strided': big[::2],
+        'small': np.arange(10),
+        'nested': [(big, 'x')],
+        }
+    s = encode(obj)
+    assert s[HEADER_SIZE:].startswith(_MAGIC)
+    # The big buffers are stored once each (not inside the pickle as well)
+    assert len(s) < 2 * big.nbytes + obj['fortran'].nbytes
+    loaded = decode(s)
+    assert sorted(loaded.keys()) == sorted(obj.keys())
+    for k in ('big', 'fortran', 'strided', 'small'):
+        assert np.all(loaded[k] == obj[k])
+    assert loaded['fortran'].flags.f_contiguous
+    assert loaded['nested'][0][1] == 'x'
+    assert np.all(loaded['nested'][0][0] == big)
+
+    # Containers without large arrays are pickled as before
+    assert not encode({'small': np.arange(10)})[HEADER_SIZE:].startswith(_MAGIC)
+
+def test_compression():
+    from jug.backends.open_compressed import _available
+    text = {'words': ['word%s' % (i % 100) for i in range(100000)]}
+    noise = np.random.random(200000)
+    plain = len(encode(text, 'none'))
+    for codec, magic in [('gzip', b'\x1f\x8b'), ('zstd', b'\x28\xb5\x2f\xfd'), ('lz4', b'\x04\x22\x4d\x18')]:
+        if not _available(codec):
+            continue
+        for setting in (codec, codec + ':1'):
+            s = encode(text, setting)
+            assert s[HEADER_SIZE:].startswith(magic)
+            assert len(s) < plain // 5
+            assert decode(s) == text
+            assert np.all(decode(encode(noise, setting)) == noise)
+
+        # Adaptive mode skips compression of data which does not shrink
+        assert encode(text, 'auto:' + codec)[HEADER_SIZE:].startswith(magic)
+        assert encode(noise, 'auto:' + codec) == encode(noise, 'none')
+        assert decode(encode([1, 2], 'auto:' + codec)) == [1, 2]
+
+def test_compression_invalid():
+    from nose.tools import assert_raises
+    from jug.backends.open_compressed import parse_compression
+    assert parse_compression('none') == (None, None, False)
+    assert parse_compression('gzip:3') == ('gzip', 3, False)
+    assert parse_compression('auto:gzip') == ('gzip', None, True)
+    assert_raises(ValueError, parse_compression, 'rar')
+    assert_raises(ValueError, parse_compression, 'gzip:1:2')
+
+def test_header():
+    from jug.backends.encode import read_header, decode_from
+    from jug.backends.encoders.numpy_encoder import NDArrayEncoder
+    from jug.backends.encoders.pickle_encoder import PickleEncoder
+    arr = np.arange(100.)
+    s = encode(arr)
+    header = read_header(BytesIO(s))
+    assert header.codec is None
+    assert isinstance(header.encoder, NDArrayEncoder)
+    assert header.payload_size == len(s) - HEADER_SIZE
+
+    s = encode({'words': ['jug'] * 100}, 'gzip')
+    header = read_header(BytesIO(s))
+    assert header.codec == 'gzip'
+    assert isinstance(header.encoder, PickleEncoder)
+    assert header.payload_size == len(s) - HEADER_SIZE
+    assert decode(s) == {'words': ['jug'] * 100}
+
+    # Adaptive mode records the codec which was actually used
+    assert read_header(BytesIO(encode(np.random.random(200000), 'auto:gzip'))).codec is None
+
+def test_header_legacy():
+    import gzip
+    import pickle
+    from jug.backends.encode import read_header
+    obj = {'a': list(range(10))}
+    for legacy in (pickle.dumps(obj), gzip.compress(pickle.dumps(obj))):
+        stream = BytesIO(legacy)
+        assert read_header(stream) is None
+        assert stream.tell() == 0
+        assert decode(legacy) == obj
+    legacy = BytesIO()
+    np.save(legacy, np.arange(10))
+    assert np.all(decode(legacy.getvalue()) == np.arange(10))
+
+def test_dataframe():
+    try:
+        import pandas as pd
+        import pyarrow as pa
+    except ImportError:
+        from nose import SkipTest
+        raise SkipTest()
+    from jug.backends.encode import read_header
+    from jug.backends.encoders.arrow_encoder import ArrowEncoder
+    df = pd.DataFrame({
+            'i': np.arange(5, dtype=np.int32),
+            'f': np.linspace(0, 1, 5),
+            's': ['a', 'b', None, 'd', 'e'],
+            'c': pd.Categorical(['x', 'y', 'x', 'x', 'y']),
+            't': pd.date_range('2020-01-01', periods=5, tz='UTC'),
+            }, index=pd.Index([10, 20, 30, 40, 50], name='key'))
+    for setting in (None, 'gzip'):
+        s = encode(df, setting)
+        assert isinstance(read_header(BytesIO(s)).encoder, ArrowEncoder)
+        loaded = decode(s)
+        assert loaded.equals(df)
+        assert list(loaded.dtypes) == list(df.dtypes)
+        assert loaded.index.equals(df.index)
+        assert loaded.index.name == 'key'
+    assert isinstance(decode(encode(pd.DataFrame({'a': [1, 2]}))).index, pd.RangeIndex)
+
+    table = pa.table({'x': [1, 2, 3]})
+    assert decode(encode(table)).equals(table)
+
+    # Columns which Arrow cannot hold are pickled
+    mixed = pd.DataFrame({'o': [1, 'a', None]})
+    assert not isinstance(read_header(BytesIO(encode(mixed))).encoder, ArrowEncoder)
+    assert decode(encode(mixed)).equals(mixed)
+
+def test_sparse():
+    try:
+        import scipy.sparse
+    except ImportError:
+        from nose import SkipTest
+        raise SkipTest()
+    from jug.backends.encode import read_header
+    from jug.backends.encoders.sparse_encoder import SparseEncoder
+    base = scipy.sparse.random(200, 100, density=.05, format='csr', dtype=np.float32)
+    for mat in (base, base.tocsc(), base.tocoo(), scipy.sparse.csr_matrix((3, 4))):
+        for setting in (None, 'gzip'):
+            s = encode(mat, setting)
+            assert isinstance(read_header(BytesIO(s)).encoder, SparseEncoder)
+            loaded = decode(s)
+            assert type(loaded) == type(mat)
+            assert loaded.dtype == mat.dtype
+            assert loaded.shape == mat.shape
+            assert (loaded != mat).nnz == 0
+    # The component arrays are stored once, not pickled
+    assert len(encode(base)) < 1.1 * (base.data.nbytes + base.indices.nbytes + base.indptr.nbytes) + 1024
+
+def test_list_blocks():
+    from jug.backends.encode import read_header
+    from jug.backends.encoders.list_encoder import ListEncoder
+    lst = [('x' * (i % 50), i) for i in range(3000)]
+    def encoded_partial(obj, compression=None):
+        output = BytesIO()
+        encode_to(obj, output, compression, partial=True)
+        return output.getvalue()
+    s = encoded_partial(lst)
+    assert isinstance(read_header(BytesIO(s)).encoder, ListEncoder)
+    assert decode(s) == lst
+    # Short lists, compressed output and stores which cannot load results in
+    # part get a single pickle
+    for s in [encoded_partial(lst[:10]), encoded_partial(lst, 'gzip'), encode(lst)]:
+        assert not isinstance(read_header(BytesIO(s)).encoder, ListEncoder)
+    assert decode(encode(lst, 'gzip')) == lst
+
+def test_list_shared_objects():
+    shared = list(range(100))
+    lst = [(i, shared) for i in range(5000)]
+    loaded = decode(encode(lst))
+    assert loaded == lst
+    # Pickled as a whole: the shared list is a single object
+    assert len(set(id(elem[1]) for elem in loaded)) == 1
@@ -0,0 +1,102 @@
+import jug.graph
+import jug.task
+from jug.task import Task
+from jug.graph import TaskGraph
+from jug.tests.task_reset import task_reset
+
+def pair():
+    return [0, 1]
+
+def add1(x):
+    return x + 1
+
+def sum_nested(a, b):
+    return a + b['r'][0]
+
+def _with_and_without_numpy(test):
+    np = jug.graph.np
+    try:
+        test()
+        jug.graph.np = None
+        test()
+    finally:
+        jug.graph.np = np
+
+def _diamond():
+    top = Task(pair)
+    left = Task(add1, top[0])
+    right = Task(add1, top[1])
+    bottom = Task(sum_nested, left, {'r': [right]})
+    return top, left, right, bottom
+
+@task_reset
+def test_csr():
+    def test():
+        top, left, right, bottom = _diamond()
+        graph = TaskGraph([bottom, left, right, top])
+        b, l, r, t = [graph.node(x) for x in (bottom, left, right, top)]
+        assert (b, l, r, t) == (0, 1, 2, 3)
+        assert sorted(graph.dependencies(b)) == [l, r]
+        assert list(graph.dependencies(r)) == [t]
+        assert list(graph.dependencies(t)) == []
+        assert sorted(graph.dependents(t)) == [l, r]
+        assert list(graph.sinks()) == [b]
+    _with_and_without_numpy(test)
+
+@task_reset
+def test_external_dependencies():
+    def test():
+        top, left, right, bottom = _diamond()
+        graph = TaskGraph([bottom])
+        assert graph.ninputs == 1
+        assert len(graph) == 4
+        assert graph.tasks[0] is bottom
+    _with_and_without_numpy(test)
+
+@task_reset
+def test_reachable_levels():
+    def test():
+        top, left, right, bottom = _diamond()
+        other = Task(add1, 3)
+        graph = TaskGraph([top, left, right, bottom, other])
+        assert list(graph.reachable([1])) == [True, True, False, False, False]
+        assert list(graph.reachable([1], reverse=True)) == [False, True, False, True, False]
+        assert list(graph.reachable([0], reverse=True)) == [True, True, True, True, False]
+        assert list(graph.levels()) == [0, 1, 1, 2, 0]
+        assert list(graph.topological_order()) == [0, 4, 1, 2, 3]
+    _with_and_without_numpy(test)
+
+@task_reset
+def test_hashes():
+    top, left, right, bottom = _diamond()
+    graph = TaskGraph([bottom, left, right, top])
+    assert graph.hashes() == [bottom.hash(), left.hash(), right.hash(), top.hash()]
+
+@task_reset
+def test_wide_graph():
+    def test():
+        tops = [Task(add1, i) for i in range(200)]
+        bottoms = [Task(sum_nested, t, {'r': [tops[0]]}) for t in tops]
+        last = Task(sum, bottoms)
+        graph = TaskGraph([last])
+        assert list(graph.levels()).count(0) == 200
+        assert graph.levels()[0] == 2
+        assert all(graph.reachable([graph.node(tops[0])], reverse=True)[graph.node(b)] for b in bottoms)
+        assert sum(graph.reachable([graph.node(tops[1])], reverse=True)) == 3
+    _with_and_without_numpy(test)
+
+@task_reset
+def test_deep_chain():
+    t = Task(add1, 0)
+    for _ in range(5000):
+        t = Task(add1, t)
+    assert len(list(jug.task.recursive_dependencies(t))) == 5000
+    assert t.hash()
+    t.unload_recursive()
+
+@task_reset
+def test_recursive_dependencies_unique():
+    top, left, right, bottom = _diamond()
+    deps = list(jug.task.recursive_dependencies(bottom))
+    assert len(set(id(d) for d in deps)) == len(deps)
+    assert sum(1 for d in deps if d is top) == 1
@@ -27,6 +27,27 @@ def test_jug_invalidate():
     assert not list(store.store.keys()), list(store.store.keys())
     jug.task.Task.store = dict_store()
 
+@task_reset
+def test_jug_invalidate_chain():
+    from jug.tests.test_graph import add1
+    store = dict_store()
+    jug.task.Task.store = store
+    tasks = [Task(add1, 0)]
+    for i in range(3 * jug.jug._INVALIDATE_BATCH_SIZE):
+        tasks.append(Task(add1, tasks[-1]))
+    for t in tasks: t.run()
+
+    opts = Options(default_options)
+    opts.invalid_name = tasks[0].name
+    opts.dry_run = True
+    jug.jug.invalidate(store, opts)
+    assert all(store.can_load(t.hash()) for t in tasks)
+
+    opts.dry_run = False
+    jug.jug.invalidate(store, opts)
+    assert not list(store.store.keys())
+    jug.task.Task.store = dict_store()
+
 @task_reset
 def test_complex():
     store, space = jug.jug.init('jug/tests/jugfiles/tasklets.py', 'dict_store')
@@ -88,3 +88,37 @@ def test_currymap():
     simple_execute()
     assert np.allclose(np.array(value(ts)) , A*2)
 
+
+@task_reset
+def test_map_auto():
+    store, space = jug.jug.init('jug/tests/jugfiles/map_auto.py', 'dict_store')
+    # The mapper needs to be timed first
+    assert 'v2s' not in space
+    simple_execute()
+    store, space = jug.jug.init('jug/tests/jugfiles/map_auto.py', store)
+    v2s = space['v2s']
+    assert 1 < v2s.block_size < 32
+    simple_execute()
+    assert value(v2s) == [2*v for v in range(32)]
+
+    # The timing is saved, so the same tasks are built again
+    hashes = [t.hash() for t in v2s.blocks]
+    store, space = jug.jug.init('jug/tests/jugfiles/map_auto.py', store)
+    assert [t.hash() for t in space['v2s'].blocks] == hashes
+
+@task_reset
+def test_map_auto_fast_mapper():
+    from jug.barrier import BarrierError
+    jug.task.Task.store = dict_store()
+    try:
+        jug.mapreduce.map(mapper, list(range(1000)), map_step='auto')
+        assert False, 'The mapper should be timed first'
+    except BarrierError:
+        pass
+    simple_execute()
+    # A fast mapper would fit in a single task of a minute, but the work is
+    # still split into (at least) AUTO_MIN_TASKS tasks
+    ts = jug.mapreduce.map(mapper, list(range(1000)), map_step='auto')
+    assert len(ts.blocks) == jug.mapreduce.AUTO_MIN_TASKS
+    simple_execute()
+    assert value(ts) == [mapper(x) for x in range(1000)]
@@ -0,0 +1,132 @@
+import os
+import tempfile
+import shutil
+
+import jug.task
+from jug.task import Task
+from jug.metrics import ExecutorMetrics
+from jug.tests.task_reset import task_reset
+from jug.tests.utils import simple_execute
+
+def double(x):
+    return 2 * x
+
+def fail(x):
+    raise ValueError(x)
+
+def _value(text, line_start):
+    for line in text.splitlines():
+        if line.startswith(line_start + ' '):
+            return float(line.split()[-1])
+    return None
+
+@task_reset
+def test_executor_metrics():
+    from jug.jug import Executor
+    from jug.backends.dict_store import dict_store
+    jug.task.Task.store = dict_store()
+    tasks = [Task(double, i) for i in range(4)]
+    tasks.append(Task(double, tasks[0]))
+    tasks.append(Task(fail, 1))
+    metrics = ExecutorMetrics()
+    executor = Executor(jug.task.Task.store, tasks, 0, False, False, False, True, metrics)
+    try:
+        executor.execute_loop(0)
+    finally:
+        # ``fail`` must not leak into other tests
+        del jug.task.alltasks[:]
+
+    text = metrics.render()
+    assert _value(text, 'jug_tasks_completed_total{name="jug.tests.test_metrics.double"}') == 5
+    assert _value(text, 'jug_tasks_failed_total{name="jug.tests.test_metrics.fail"}') == 1
+    assert _value(text, 'jug_tasks_in_flight') == 0
+    assert _value(text, 'jug_lock_contention_total') == 0
+    assert '# TYPE jug_tasks_completed_total counter' in text
+
+@task_reset
+def test_lock_contention():
+    from jug.jug import Executor
+    from jug.backends.dict_store import dict_store
+
+    class contended_store(dict_store):
+        def getlock(self, name):
+            lock = dict_store.getlock(self, name)
+            get = lock.get
+            def contended_get():
+                # Another process takes the lock just before this one
+                dict_store.getlock(self, name).get()
+                return get()
+            lock.get = contended_get
+            return lock
+
+    store = contended_store()
+    jug.task.Task.store = store
+    t = Task(double, 4)
+    metrics = ExecutorMetrics()
+    executor = Executor(store, [t], 0, False, False, False, False, metrics)
+    try:
+        executor.execute_loop(0)
+    finally:
+        # The task stays locked, so it must not leak into other tests
+        del jug.task.alltasks[:]
+    assert metrics.lock_contention == 1
+    assert not t.can_load()
+
+def test_escape():
+    metrics = ExecutorMetrics()
+    metrics.task_started('a"b')
+    metrics.task_ended('a"b', 1., True)
+    assert 'jug_tasks_completed_total{name="a\\"b"} 1' in metrics.render()
+
+def test_textfile():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        metrics = ExecutorMetrics(textfile=os.path.join(tmpdir, 'jug-%(pid)s.prom'))
+        metrics.task_started('t')
+        fname = os.path.join(tmpdir, 'jug-%s.prom' % os.getpid())
+        assert os.listdir(tmpdir) == [os.path.basename(fname)]
+        assert _value(open(fname).read(), 'jug_tasks_in_flight') == 1
+
+        # This comes less than a second after the previous write: it is
+        # written later
+        metrics.task_ended('t', 2., True)
+        assert metrics.pending is not None
+        metrics.pending.join(5.)
+        assert _value(open(fname).read(), 'jug_tasks_in_flight') == 0
+        assert _value(open(fname).read(), 'jug_task_seconds_total{name="t"}') == 2.
+        assert os.listdir(tmpdir) == [os.path.basename(fname)]
+    finally:
+        shutil.rmtree(tmpdir)
+
+def test_serve():
+    from six.moves.urllib.request import urlopen
+    metrics = ExecutorMetrics()
+    metrics.idle(3)
+    server = metrics.serve(0)
+    try:
+        host, port = server.server_address
+        text = urlopen('http://%s:%s/metrics' % (host, port)).read().decode('utf-8')
+        assert _value(text, 'jug_idle_seconds_total') == 3
+    finally:
+        server.shutdown()
+        server.server_close()
+
+@task_reset
+def test_bytes_dumped():
+    from jug.backends.dict_store import dict_store
+    from jug.backends.file_store import file_store
+    tmpdir = tempfile.mkdtemp()
+    try:
+        store = file_store(tmpdir)
+        jug.task.Task.store = store
+        metrics = ExecutorMetrics()
+        t = Task(double, list(range(1000)))
+        simple_execute([t])
+        assert _value(metrics.render(), 'jug_bytes_dumped_total') > 1000
+        t.unload()
+        t.load()
+        assert _value(metrics.render(), 'jug_bytes_loaded_total') > 1000
+    finally:
+        del jug.task.alltasks[:]
+        jug.task.Task.store = dict_store()
+        shutil.rmtree(tmpdir)
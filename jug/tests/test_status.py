@@ -49,3 +49,217 @@ def test_cache_bvalue():
     simple_execute()
     assert status.status(options) == 1
 
+
+_incremental_jugfile = '''
+from jug import TaskGenerator
+
+@TaskGenerator
+def double(x):
+    return x*2
+
+vals = [double(i) for i in range(%s)]
+'''
+
+@task_reset
+def test_cache_jugfile_changed():
+    import os
+    import tempfile
+    import shutil
+    tmpdir = tempfile.mkdtemp()
+    try:
+        jugfile = os.path.join(tmpdir, 'incremental.py')
+        with open(jugfile, 'w') as output:
+            output.write(_incremental_jugfile % 4)
+
+        options = default_options.copy()
+        options.jugdir = 'dict_store'
+        options.jugfile = jugfile
+        options.verbose = 'quiet'
+        options.status_mode = 'cached'
+        options.status_cache_file = os.path.join(tmpdir, 'status.sqlite3')
+
+        assert status.status(options) == 0
+        options.jugdir = jug.task.Task.store
+        simple_execute()
+        assert status.status(options) == 4
+
+        # Cache is up to date: jugfile is not loaded again
+        while jug.task.alltasks:
+            jug.task.alltasks.pop()
+        assert status.status(options) == 4
+        assert not jug.task.alltasks
+
+        with open(jugfile, 'w') as output:
+            output.write(_incremental_jugfile % 6)
+        store = options.jugdir
+        store.store.clear()
+        # Finished states are reused from the cache for unchanged tasks
+        assert status.status(options) == 4
+        assert len(jug.task.alltasks) == 6
+    finally:
+        shutil.rmtree(tmpdir)
+
+@task_reset
+def test_nocache_states():
+    while jug.task.alltasks:
+        jug.task.alltasks.pop()
+    store, space = jug.jug.init('jug/tests/jugfiles/simple.py', 'dict_store')
+    tasks = list(jug.task.alltasks)
+    # Run the first 8 tasks (double); lock one of the 8 plus1 tasks
+    simple_execute(tasks[:8])
+    tasks[8].lock()
+    while jug.task.alltasks:
+        jug.task.alltasks.pop()
+    store.counts.clear()
+
+    lines = []
+    options = default_options.copy()
+    options.jugdir = store
+    options.jugfile = 'jug/tests/jugfiles/simple.py'
+    options.print_out = lines.append
+    assert status.status(options) == 8
+    waiting, ready, finished, running = map(int, lines[-2].split()[:4])
+    assert (waiting, ready, finished, running) == (16, 7, 8, 1)
+    assert not [k for k in store.counts if k.startswith('exists:')]
+
+@task_reset
+def test_nocache_states_file_store():
+    import tempfile
+    import shutil
+    from jug.backends.memoize_store import memoize_store
+    tmpdir = tempfile.mkdtemp()
+    try:
+        while jug.task.alltasks:
+            jug.task.alltasks.pop()
+        store, space = jug.jug.init('jug/tests/jugfiles/simple.py', tmpdir + '/jugdata')
+        tasks = list(jug.task.alltasks)
+        simple_execute(tasks[:8])
+        tasks[8].lock()
+        while jug.task.alltasks:
+            jug.task.alltasks.pop()
+
+        # Keys listed by file_store match the task hashes (which are bytes)
+        listed = memoize_store(store, list_base=True)
+        assert listed.can_load(tasks[0].hash())
+        assert not listed.can_load(tasks[8].hash())
+        assert listed.getlock(tasks[8].hash()).is_locked()
+
+        lines = []
+        options = default_options.copy()
+        options.jugdir = tmpdir + '/jugdata'
+        options.jugfile = 'jug/tests/jugfiles/simple.py'
+        options.print_out = lines.append
+        assert status.status(options) == 8
+        waiting, ready, finished, running = map(int, lines[-2].split()[:4])
+        assert (waiting, ready, finished, running) == (16, 7, 8, 1)
+        tasks[8].unlock()
+    finally:
+        shutil.rmtree(tmpdir)
+
+def test_tracker_refresh():
+    while jug.task.alltasks:
+        jug.task.alltasks.pop()
+    store, space = jug.jug.init('jug/tests/jugfiles/simple.py', 'dict_store')
+    tasks = list(jug.task.alltasks)
+    tracker = status.StatusTracker(tasks)
+    tw,tre,tru,tf = tracker.refresh(store)
+    assert sum(tf.values()) == 0
+    assert tracker.nr_unfinished() == 32
+
+    simple_execute(tasks[:8])
+    store.counts.clear()
+    tw,tre,tru,tf = tracker.refresh(store)
+    assert tf['simple.double'] == 8
+    assert tre['simple.plus1'] == 8
+    assert tracker.nr_unfinished() == 24
+
+    # Finished tasks are not probed again
+    store.counts.clear()
+    tracker.refresh(store)
+    probed = [k for k in store.counts if k[:len('exists:')] == 'exists:']
+    assert len(probed) == 24
+    assert not [k for k in probed if k[len('exists:'):] == str(tasks[0].hash())]
+
+    lines = status.render_watch_table(tracker, tw, tre, tru, tf)
+    assert any(('simple.double' in line and '100.0%' in line) for line in lines)
+
+@task_reset
+def test_tracker_written():
+    while jug.task.alltasks:
+        jug.task.alltasks.pop()
+    store, space = jug.jug.init('jug/tests/jugfiles/simple.py', 'dict_store')
+    tasks = list(jug.task.alltasks)
+    tracker = status.StatusTracker(tasks)
+    tracker.refresh(store)
+
+    # Results reported as written (e.g., by store notifications) update the
+    # status without accessing the store
+    simple_execute(tasks[:8])
+    store.counts.clear()
+    tw,tre,tru,tf = tracker.refresh(store, [t.hash() for t in tasks[:8]], probe=False)
+    assert not store.counts
+    assert tf['simple.double'] == 8
+    assert tre['simple.plus1'] == 8
+    assert tracker.nr_unfinished() == 24
+
+@task_reset
+def test_watch_finished():
+    while jug.task.alltasks:
+        jug.task.alltasks.pop()
+    store, _ = jug.jug.init('jug/tests/jugfiles/simple.py', 'dict_store')
+    simple_execute()
+    while jug.task.alltasks:
+        jug.task.alltasks.pop()
+
+    lines = []
+    options = default_options.copy()
+    options.jugdir = store
+    options.jugfile = 'jug/tests/jugfiles/simple.py'
+    options.status_watch = True
+    options.print_out = lines.append
+    # Returns immediately as all tasks are finished
+    assert status.status(options) == 8 * 4
+    assert any('simple.sum2' in line for line in lines)
+
+def _status_output(fmt, mode):
+    while jug.task.alltasks:
+        jug.task.alltasks.pop()
+    store, _ = jug.jug.init('jug/tests/jugfiles/simple.py', 'dict_store')
+    simple_execute(list(jug.task.alltasks)[:8])
+    while jug.task.alltasks:
+        jug.task.alltasks.pop()
+
+    lines = []
+    options = default_options.copy()
+    options.jugdir = store
+    options.jugfile = 'jug/tests/jugfiles/simple.py'
+    options.status_format = fmt
+    options.status_mode = mode
+    options.status_cache_file = ':memory:'
+    options.print_out = lines.append
+    assert status.status(options) == 8
+    return lines
+
+@task_reset
+def test_format_ndjson():
+    import json
+    for mode in ('no-cached', 'cached'):
+        records = [json.loads(line) for line in _status_output('ndjson', mode)]
+        assert records[0]['type'] == 'start'
+        assert records[-1]['type'] == 'end'
+        assert records[-1]['finished'] == 8
+        assert records[-1]['ready'] == 8
+        tasks = [r for r in records if r['type'] == 'task']
+        assert len(tasks) == 32
+        assert len([r for r in tasks if r['state'] == 'finished']) == 8
+        names = dict((r['name'], r) for r in records if r['type'] == 'name')
+        assert names['simple.double']['finished'] == 8
+        assert names['simple.sum2']['waiting'] == 16
+
+@task_reset
+def test_format_json():
+    import json
+    result = json.loads('\n'.join(_status_output('json', 'no-cached')))
+    assert len(result['tasks']) == 32
+    assert result['totals'] == {'waiting': 16, 'ready': 8, 'running': 0, 'finished': 8}
+    assert set(n['name'] for n in result['names']) == set(['simple.double', 'simple.plus1', 'simple.sum2'])
@@ -1,3 +1,4 @@
+import os
 from os import path
 
 import six
@@ -62,18 +63,62 @@ def test_stores():
             store.close()
         except redis.ConnectionError:
             raise SkipTest()
+    def remove_many(store):
+        try:
+            keys = [six.b('jugisbestthingever%s' % i) for i in range(8)]
+            for key in keys[:5]:
+                store.dump(key, key)
+            assert list(map(bool, store.remove_many(keys))) == [True] * 5 + [False] * 3
+            assert not any(store.can_load(key) for key in keys)
+            assert len(list(store.list())) == 0
+            store.close()
+        except redis.ConnectionError:
+            raise SkipTest()
+
+    def many(store):
+        try:
+            keys = [six.b('jugisbestthingever%s' % i) for i in range(8)]
+            objects = [list(range(i)) for i in range(5)]
+            store.dump_many(objects, keys[:5])
+            assert store.can_load_many(keys) == [True] * 5 + [False] * 3
+            assert store.load_many(keys[:5]) == objects
+            assert store.load_many([]) == []
+            store.remove_many(keys)
+            assert store.can_load_many(keys) == [False] * 8
+            store.close()
+        except redis.ConnectionError:
+            raise SkipTest()
+
+    def large(store):
+        try:
+            if hasattr(store, 'chunk_size'):
+                store.chunk_size = 1024
+            key = six.b('jugisbestthingever')
+            obj = [list(range(i)) for i in range(300)]
+            store.dump(obj, key)
+            assert store.load(key) == obj
+            assert store.load_many([key, key]) == [obj, obj]
+            assert len(list(store.list())) == 1
+            assert store.remove(key)
+            assert not store.can_load(key)
+            store.close()
+        except redis.ConnectionError:
+            raise SkipTest()
+
     stores = [
         lambda: jug.backends.file_store.file_store('jug_test_store'),
         jug.backends.dict_store.dict_store,
         lambda: jug.redis_store.redis_store('redis://'),
+        lambda: jug.redis_store.redis_store('redis://?raw=1'),
     ]
     teardowns = [
         lambda: jug.backends.file_store.file_store.remove_store("jug_test_store"),
         None,
         None,
+        None,
     ]
 
-    functions = (load_get, lock, lock_remove)
+    functions = (load_get, lock, lock_remove, remove_many, many, large)
 
     for f in functions:
         for store,tear in zip(stores,teardowns):
@@ -127,3 +172,182 @@ def test_h5py_store():
 
     invalid_store = jug.backends.dict_store.dict_store()
     assert_raises(TypeError, invalid_store.dump, db, key)
+
+@with_setup(teardown=lambda: jug.backends.file_store.file_store.remove_store("jug_test_h5py_in_place"))
+def test_h5py_store_in_place():
+    try:
+        import h5py
+        import numpy
+    except ImportError:
+        raise SkipTest()
+    store = jug.backends.file_store.file_store("jug_test_h5py_in_place")
+    store.create()
+    key = 'mykey'
+
+    source = path.join(store.tempdir(), "temp_db")
+    db = h5py.File(source, "w")
+    db.create_dataset("test_array", data=numpy.arange(100))
+    store.dump(db, key)
+    # Writing to the source file does not change the result
+    db["test_array"][:] = 0
+    db.close()
+    with h5py.File(source, "w") as db:
+        db.create_dataset("other", data=numpy.arange(3))
+
+    fname = store._getfname(key)
+    assert not (os.stat(fname).st_mode & 0o222)
+    with open(fname, 'rb') as f:
+        assert f.read(8) == b'\x89HDF\r\n\x1a\n'
+    result_db = store.load(key)
+    assert result_db.mode == 'r'
+    assert path.samefile(result_db.filename, fname)
+    assert numpy.all(result_db["test_array"][:] == numpy.arange(100))
+    result_db.close()
+
+@with_setup(teardown=lambda: jug.backends.file_store.file_store.remove_store("jug_test_list_store"))
+def test_file_store_list_bytes():
+    store = jug.backends.file_store.file_store('jug_test_list_store')
+    key = six.b('0123456789abcdef')
+    store.dump(1, key)
+    assert list(store.list()) == ['0123456789abcdef']
+    lock = store.getlock(key)
+    assert lock.get()
+    assert list(store.listlocks()) == ['0123456789abcdef']
+    lock.release()
+    store.close()
+
+def test_redis_raw_encoding():
+    if redis is None:
+        raise SkipTest()
+    import numpy as np
+    from base64 import b64encode
+    from jug.backends.encode import encode
+    from jug.backends.redis_store import _RAW_MARKER
+    # No connection is made until a command is sent
+    b64 = jug.backends.redis_store.redis_store('redis://localhost:6379/prefix')
+    raw = jug.backends.redis_store.redis_store('redis://localhost:6379/prefix?raw=1&chunk_size=1024')
+    assert not b64.raw
+    assert raw.raw
+    assert raw.chunk_size == 1024
+    assert raw.prefix == 'prefix/'
+    assert raw.redis_params == {'host': 'localhost', 'port': 6379}
+    assert raw._resultname(six.b('abc')) == six.b('result:prefix/abc')
+
+    obj = {'a': list(range(100)), 'b': np.arange(10)}
+    s = encode(obj)
+    for value in (b64encode(s), _RAW_MARKER + s):
+        for reader in (b64, raw):
+            loaded = reader._decode(value, six.b('abc'))
+            assert loaded['a'] == obj['a']
+            assert np.all(loaded['b'] == obj['b'])
+
+def test_redis_chunks():
+    from jug.backends.encode import encode_to, decode_from
+    from jug.backends.redis_store import _ChunkWriter, _ChunkReader
+    chunks = {}
+    def send(index, data):
+        assert index not in chunks
+        chunks[index] = data
+    def fetch(indices):
+        return [chunks[i] for i in indices]
+
+    obj = [list(range(i)) for i in range(300)]
+    writer = _ChunkWriter(send, 1000)
+    encode_to(obj, writer)
+    assert writer.finish() is None
+    assert writer.nr_chunks == len(chunks) > 10
+    assert all(len(chunks[i]) == 1000 for i in range(writer.nr_chunks - 1))
+    assert decode_from(_ChunkReader(fetch, writer.nr_chunks)) == obj
+
+    chunks.clear()
+    writer = _ChunkWriter(send, 1000)
+    encode_to([1, 2, 3], writer)
+    assert writer.finish()
+    assert not chunks
+
+@with_setup(teardown=lambda: jug.backends.file_store.file_store.remove_store("jug_test_mmap_store"))
+def test_file_store_mmap():
+    try:
+        import numpy as np
+    except ImportError:
+        raise SkipTest()
+    store = jug.backends.file_store.file_store('jug_test_mmap_store')
+    arr = np.arange(1000, dtype=np.float32).reshape((10, 100))
+    store.dump(arr, 'array')
+    store.dump(np.array([None, 1]), 'objects')
+    store.dump([arr], 'list')
+
+    assert not isinstance(store.load('array'), np.memmap)
+    mapped = store.load_mmap('array')
+    assert isinstance(mapped, np.memmap)
+    assert not mapped.flags.writeable
+    assert np.all(mapped == arr)
+    assert not isinstance(store.load_mmap('objects'), np.memmap)
+    assert np.all(store.load_mmap('list')[0] == arr)
+
+    big = np.arange(100000.)
+    store.dump({'big': big, 'other': 'x'}, 'container')
+    loaded = store.load_mmap('container')
+    assert loaded['other'] == 'x'
+    assert np.all(loaded['big'] == big)
+    assert not loaded['big'].flags.writeable
+    assert store.load('container')['big'].flags.writeable
+
+    store.mmap_threshold = 1024
+    assert isinstance(store.load('array'), np.memmap)
+    assert not store.load('container')['big'].flags.writeable
+    store.mmap_threshold = 1 << 20
+    assert not isinstance(store.load('array'), np.memmap)
+    store.close()
+
+@with_setup(teardown=lambda: jug.backends.file_store.file_store.remove_store("jug_test_sparse_store"))
+def test_file_store_sparse_mmap():
+    try:
+        import scipy.sparse
+    except ImportError:
+        raise SkipTest()
+    store = jug.backends.file_store.file_store('jug_test_sparse_store')
+    mat = scipy.sparse.random(100, 100, density=.1, format='csr')
+    store.dump(mat, 'sparse')
+    loaded = store.load_mmap('sparse')
+    assert (loaded != mat).nnz == 0
+    assert not loaded.data.flags.writeable
+    store.close()
+
+@with_setup(teardown=lambda: jug.backends.file_store.file_store.remove_store("jug_test_columns_store"))
+def test_file_store_columns():
+    from importlib.util import find_spec
+    try:
+        import numpy as np
+        import pandas as pd
+    except ImportError:
+        raise SkipTest()
+    if find_spec('pyarrow') is None:
+        raise SkipTest()
+    store = jug.backends.file_store.file_store('jug_test_columns_store')
+    df = pd.DataFrame({'a': np.arange(100), 'b': np.ones(100), 'c': ['x'] * 100}, index=np.arange(100) * 2)
+    store.dump(df, 'frame')
+    store.dump(df, 'compressed', compression='gzip')
+    assert store.load_mmap('frame').equals(df)
+    assert not store.load_mmap('frame')['a'].values.flags.writeable
+    for name in ('frame', 'compressed'):
+        sub = store.load_columns(name, ['b'])
+        assert list(sub.columns) == ['b']
+        assert sub.equals(df[['b']])
+    store.close()
+
+@with_setup(teardown=lambda: jug.backends.file_store.file_store.remove_store("jug_test_compression_store"))
+def test_file_store_compression():
+    from jug.backends.encode import read_header
+    store = jug.backends.file_store.file_store('jug_test_compression_store', compression='gzip:1')
+    obj = ['jug'] * 1000
+    store.dump(obj, 'gzip')
+    store.dump(obj, 'none', compression='none')
+    with open(store._getfname('gzip'), 'rb') as f:
+        assert read_header(f).codec == 'gzip'
+        assert f.read(2) == six.b('\x1f\x8b')
+    assert path.getsize(store._getfname('gzip')) < path.getsize(store._getfname('none'))
+    assert store.load('gzip') == obj
+    assert store.load('none') == obj
+    assert_raises(ValueError, jug.backends.file_store.file_store, 'jug_test_compression_store', compression='unknown')
+    store.close()
@@ -268,3 +268,176 @@ def test_builtin_function():
     simple_execute()
     a8 = jug.task.value(space['a8'])
     assert np.all(a8 == np.arange(8))
+
+@task_reset
+def test_value_list_load_many():
+    jug.task.Task.store = store = dict_store()
+    tasks = [double(i) for i in range(4)]
+    for t in tasks:
+        t.run()
+        t.unload()
+    store.counts.clear()
+    assert jug.task.value(tasks + [tasks[0], 7]) == [0, 2, 4, 6, 0, 7]
+    assert jug.task.value({'a': tasks[1], 'b': tasks[2]}) == {'a': 2, 'b': 4}
+    # All the results were fetched through ``load_many`` (without the
+    # existence check done by ``Task.load``)
+    assert not [k for k in store.counts if k[:len('exists:')] == 'exists:']
+
+@jug.task.TaskGenerator
+@jug.task.mmap_result
+def arange(n):
+    import numpy as np
+    return np.arange(n)
+
+@task_reset
+def test_mmap_result():
+    import numpy as np
+    from jug.backends.file_store import file_store
+    jug.task.Task.store = file_store('jug_test_mmap_result')
+    try:
+        t = arange(100)
+        t.run()
+        t.unload()
+        assert isinstance(t.value(), np.memmap)
+        assert np.all(t.value() == np.arange(100))
+    finally:
+        file_store.remove_store('jug_test_mmap_result')
+
+@jug.task.TaskGenerator
+@jug.task.compress_result('gzip')
+def words(n):
+    return ['word'] * n
+
+@task_reset
+def test_compress_result():
+    from jug.backends.encode import read_header
+    from jug.backends.file_store import file_store
+    store = file_store('jug_test_compress_result')
+    jug.task.Task.store = store
+    try:
+        t = words(1000)
+        t.run()
+        with open(store._getfname(t.hash()), 'rb') as f:
+            assert read_header(f).codec == 'gzip'
+        t.unload()
+        assert t.value() == ['word'] * 1000
+    finally:
+        file_store.remove_store('jug_test_compress_result')
+
+def listrange(n):
+    return list(range(n))
+
+@jug.task.TaskGenerator
+@jug.task.lazy_arguments('big')
+def pick(big, other, i):
+    if i < 0:
+        return len(other)
+    return big[i] + len(other)
+
+@task_reset
+def test_lazy_arguments():
+    store = dict_store()
+    jug.task.Task.store = store
+    big = jug.task.Task(listrange, 100)
+    other = jug.task.Task(listrange, 2)
+    big.run()
+    other.run()
+    big.unload()
+    other.unload()
+    loaded = lambda t: [k for k in store.counts if k.startswith('load:') and t.hash().decode() in k]
+
+    unused = pick(big, other, -1)
+    unused.run()
+    assert unused.result == 2
+    assert not loaded(big)
+    assert loaded(other)
+
+    used = pick(big, other, 3)
+    used.run()
+    assert used.result == 3 + 2
+    assert loaded(big)
+
+@task_reset
+def test_tasklet_load_item():
+    import numpy as np
+    from jug.backends.file_store import file_store
+    store = file_store('jug_test_load_item')
+    jug.task.Task.store = store
+    try:
+        lst = jug.task.Task(listrange, 1000)
+        arr = jug.task.Task(np.arange, 1000)
+        lst.run()
+        arr.run()
+        lst.unload()
+        arr.unload()
+        assert lst[10].value() == 10
+        assert lst[-1].value() == 999
+        assert lst[5:8].value() == [5, 6, 7]
+        assert np.all(arr[3:6].value() == [3, 4, 5])
+        assert not lst.is_loaded()
+        assert not arr.is_loaded()
+
+        # A result which is used through several Tasklets is loaded once
+        assert jug.task.value([lst[1], lst[2]]) == [1, 2]
+        assert lst.is_loaded()
+    finally:
+        file_store.remove_store('jug_test_load_item')
+
+def triple(x):
+    return (x, x + 1, x + 2)
+
+@task_reset
+def test_tasklet_load_item_full():
+    from jug.backends.file_store import file_store
+    store = file_store('jug_test_load_item_full', compression='gzip')
+    jug.task.Task.store = store
+    loads = []
+    load = store.load
+    def counted_load(name):
+        loads.append(name)
+        return load(name)
+    store.load = counted_load
+    try:
+        # Neither a tuple nor a compressed result can be loaded in part: they
+        # are loaded (and kept) once
+        for t, expected in [(jug.task.Task(triple, 4), [4, 5, 6]), (jug.task.Task(listrange, 1000), [0, 1, 2])]:
+            t.run()
+            t.unload()
+            del loads[:]
+            assert [t[i].value() for i in range(3)] == expected
+            assert len(loads) == 1
+            assert t.is_loaded()
+    finally:
+        file_store.remove_store('jug_test_load_item_full')
+
+# Hash of the streaming task and whether its result was visible half-way
+_streaming = []
+
+def records(n):
+    for i in range(n):
+        if i == n // 2:
+            # The result only becomes visible once it is complete
+            _streaming.append(jug.task.Task.store.can_load(_streaming[0]))
+        yield (i, 'record')
+
+@task_reset
+def test_streamed_result():
+    from jug.backends.file_store import file_store
+    from jug.backends.encoders.stream_encoder import StreamedResult
+    for store in (dict_store(), file_store('jug_test_streamed_result')):
+        jug.task.Task.store = store
+        try:
+            t = jug.task.Task(records, 10000)
+            _streaming[:] = [t.hash()]
+            t.run()
+            assert _streaming[1:] == [False]
+            assert not t.is_loaded()
+            assert t.can_load()
+            result = t.value()
+            assert isinstance(result, StreamedResult)
+            assert list(result) == [(i, 'record') for i in range(10000)]
+            # It can be iterated over more than once
+            assert sum(1 for _ in result) == 10000
+        finally:
+            if isinstance(store, file_store):
+                file_store.remove_store('jug_test_streamed_result')
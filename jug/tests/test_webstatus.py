@@ -1,4 +1,5 @@
-from jug.subcommands.webstatus import _format_counts
+from jug.subcommands.webstatus import _format_counts, template
+from jug.tests.task_reset import task_reset
 
 def test_format_counts():
     assert len(_format_counts({'n': 0}, {'n': 1}, {'n': 2}, {'n':3}))
@@ -8,3 +9,40 @@ def test_format_counts():
                     {'n': 2, 'n2': 3 },
                     {'n': 3, 'n2': 4 }
                     ))
+
+def test_template_version():
+    page = template % {'jugfile': 'jugfile.py', 'table': '', 'version': 17}
+    # The page only reloads itself for events with a different version
+    assert 'var version = 17;' in page
+    assert '.version != version' in page
+
+@task_reset
+def test_refresher():
+    import json
+    import jug.jug
+    import jug.task
+    from jug.tests.utils import simple_execute
+    from jug.subcommands.webstatus import StatusRefresher
+    while jug.task.alltasks:
+        jug.task.alltasks.pop()
+    store, _ = jug.jug.init('jug/tests/jugfiles/simple.py', 'dict_store')
+    tasks = list(jug.task.alltasks)
+
+    refresher = StatusRefresher(store, tasks, 0.01)
+    assert refresher.refresh()
+    assert not refresher.refresh()
+    status = json.loads(refresher.status_json())
+    assert status['totals'] == {'waiting': 24, 'ready': 8, 'running': 0, 'finished': 0}
+
+    refresher.start()
+    try:
+        version = refresher.version
+        simple_execute(tasks[:8])
+        assert refresher.wait_for_change(version, 5.) != version
+    finally:
+        refresher.stop()
+    double = json.loads(refresher.task_json('simple.double'))
+    assert double['finished'] == 8
+    assert len(double['tasks']) == 8
+    assert set(t['state'] for t in double['tasks']) == set(['finished'])
+    assert refresher.task_json('simple.nonexistent') is None